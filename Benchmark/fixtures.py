@@ -0,0 +1,268 @@
+"""
+压测与基准测试用的本地固定数据和外部服务桩：
+    知识库：由KnowledgeSystem/ks_data中的模板生成的ChromaDB集合（可按需扩充到任意文档数）
+    知识图谱：固定的岗位能力画像
+    搜索工具：带固定延迟的DuckDuckGo桩
+    简历：生成纯ASCII文本的pdf
+"""
+import hashlib
+import json
+import os
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+KS_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "KnowledgeSystem", "ks_data")
+COLLECTION_NAME = "res_opt_documents"
+
+
+def load_ks_templates(data_dir: str = KS_DATA_DIR) -> List[Tuple[str, dict]]:
+    """
+    读取知识库模板（与KsBuilder相同的.txt JSON数组格式），元数据中的列表转为逗号分隔的字符串
+    :return: [(文本, 元数据)]
+    """
+    templates = []
+    for filename in sorted(os.listdir(data_dir)):
+        if not filename.endswith(".txt"):
+            continue
+        with open(os.path.join(data_dir, filename), "r", encoding="utf-8-sig") as f:
+            data = json.load(f)
+        for item in data:
+            if not isinstance(item, dict) or not item.get("text"):
+                continue
+            metadata = {"source_file": filename}
+            for key, value in (item.get("metadata") or {}).items():
+                if isinstance(value, list):
+                    value = ", ".join(str(v) for v in value)
+                elif isinstance(value, dict):
+                    value = json.dumps(value, ensure_ascii=False)
+                metadata[key] = value
+            templates.append((item["text"], metadata))
+    return templates
+
+
+def synthesize_documents(n_docs: int, seed: int = 0,
+                         templates: List[Tuple[str, dict]] = None) -> Tuple[List[str], List[str], List[dict]]:
+    """
+    由模板生成n_docs个文档：前len(templates)个为原文，其余为模板的变体（句子顺序打乱并加编号），
+    元数据中的template_index记录来源模板，用于计算召回率
+    :return: (ids, documents, metadatas)
+    """
+    rnd = random.Random(seed)
+    templates = templates or load_ks_templates()
+    ids, documents, metadatas = [], [], []
+    for i in range(n_docs):
+        index = i % len(templates)
+        text, metadata = templates[index]
+        if i >= len(templates):
+            sentences = [s for s in text.split("。") if s]
+            rnd.shuffle(sentences)
+            text = f"（变体{i}）" + "。".join(sentences) + "。"
+        ids.append(f"doc_{i}")
+        documents.append(text)
+        metadatas.append({**metadata, "template_index": index})
+    return ids, documents, metadatas
+
+
+class HashEmbeddingFunction(object):
+    """
+    离线向量函数：字符二元组哈希到固定维度后归一化。不需要下载模型，结果可复现，
+    用于在无网络环境下压测（检索质量不代表真实模型）
+    """
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def __call__(self, input: List[str]) -> List[np.ndarray]:
+        vectors = []
+        for text in input:
+            vector = np.zeros(self.dim, dtype=np.float32)
+            for i in range(len(text) - 1):
+                digest = hashlib.blake2b(text[i:i + 2].encode("utf-8"), digest_size=8).digest()
+                vector[int.from_bytes(digest, "little") % self.dim] += 1.0
+            norm = np.linalg.norm(vector)
+            vectors.append(vector / norm if norm else vector)
+        return vectors
+
+    @staticmethod
+    def name() -> str:
+        return "hash_bigram"
+
+    def embed_query(self, input: List[str]) -> List[np.ndarray]:
+        return self(input)
+
+    def get_config(self) -> dict:
+        return {"dim": self.dim}
+
+    @staticmethod
+    def build_from_config(config: dict) -> "HashEmbeddingFunction":
+        return HashEmbeddingFunction(config.get("dim", 384))
+
+
+def get_embedding_function(hash_embedding: bool = False):
+    """
+    :param hash_embedding: 为True时使用离线哈希向量函数，否则使用ChromaDB默认向量函数（与生产一致，首次需下载模型）
+    """
+    if hash_embedding:
+        return HashEmbeddingFunction()
+    from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+    return DefaultEmbeddingFunction()
+
+
+def chunk_documents(ids: List[str], documents: List[str],
+                    metadatas: List[dict]) -> Tuple[List[str], List[str], List[dict]]:
+    """
+    按入库时的规则（KsChunker）将文档切块，块元数据带parent_id、chunk_index
+    :return: (块ids, 块文本, 块元数据)
+    """
+    from KnowledgeSystem.KsChunker import chunk_text
+
+    chunk_ids, chunks, chunk_metadatas = [], [], []
+    for doc_id, document, metadata in zip(ids, documents, metadatas):
+        texts = chunk_text(document)
+        for i, text in enumerate(texts):
+            chunk_ids.append(f"{doc_id}#{i}")
+            chunks.append(text)
+            chunk_metadatas.append({**metadata, "parent_id": doc_id, "chunk_index": i, "chunk_count": len(texts)})
+    return chunk_ids, chunks, chunk_metadatas
+
+
+def build_fixture_collection(path: str, n_docs: int = None, embedding_function=None, batch_size: int = 1000,
+                             seed: int = 0, chunked: bool = True):
+    """
+    在path/chroma_db下创建知识库集合（名称与生产一致，已存在时重建）
+    :param n_docs: 文档数，为空时只使用模板原文
+    :param chunked: 是否按入库规则切块（为False时每个文档整篇入库，对应切块前的旧集合）
+    :return: 集合
+    """
+    import chromadb
+
+    client = chromadb.PersistentClient(path=os.path.join(path, "chroma_db"))
+    try:
+        client.delete_collection(COLLECTION_NAME)
+    except Exception:
+        pass
+    collection = client.create_collection(COLLECTION_NAME, embedding_function=embedding_function)
+    templates = load_ks_templates()
+    ids, documents, metadatas = synthesize_documents(n_docs or len(templates), seed, templates)
+    if chunked:
+        ids, documents, metadatas = chunk_documents(ids, documents, metadatas)
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        collection.add(ids=ids[start:end], documents=documents[start:end], metadatas=metadatas[start:end])
+    return collection
+
+
+class FixtureGraph(object):
+    """
+    知识图谱桩：返回固定的岗位能力画像，接口与KgUser.find_skill_txt一致
+    """
+    SKILLS = ["Python", "SQL", "数据分析", "机器学习", "统计学", "沟通能力", "Excel", "Tableau", "Hadoop", "Spark"]
+
+    def __init__(self, latency_ms: float = 5.0):
+        self.latency_ms = latency_ms
+
+    def find_skill_txt(self, job_name: str) -> List[str]:
+        time.sleep(self.latency_ms / 1000)
+        return list(self.SKILLS)
+
+
+class FakeSearch(object):
+    """
+    DuckDuckGo搜索桩：固定延迟后返回固定格式的结果，接口与DuckDuckGoUser一致
+    """
+    def __init__(self, latency_ms: float = 300.0):
+        self.latency_ms = latency_ms
+
+    def _reply(self, keywords: List[str]) -> str:
+        time.sleep(self.latency_ms / 1000)
+        return "\n".join(f"### 关键词：{k}\n{k}相关的示例搜索结果。\n" for k in keywords if k)
+
+    def ddg_search_resume(self, keywords: List[str]) -> str:
+        return self._reply(keywords)
+
+    def ddg_search_else(self, keywords: List[str]) -> str:
+        return self._reply(keywords)
+
+
+_RESUME_WORDS = ["Python", "Java", "SQL", "Redis", "FastAPI", "Docker", "Linux", "PyTorch", "Neo4j", "React",
+                 "internship", "project", "competition", "award", "research", "paper", "leader", "team"]
+
+
+def make_resume_text(index: int, seed: int = 0) -> str:
+    """
+    生成一份纯ASCII的简历文本（pdf标准字体不含中文字形）
+    """
+    rnd = random.Random(seed * 100003 + index)
+    lines = [f"Name: Candidate {index}", "Education: Hefei University of Technology, Information Systems",
+             "Skills: " + ", ".join(rnd.sample(_RESUME_WORDS[:10], 6))]
+    for k in range(rnd.randint(4, 12)):
+        lines.append(f"Experience {k + 1}: " + " ".join(rnd.choice(_RESUME_WORDS) for _ in range(rnd.randint(8, 16))))
+    return "\n".join(lines)
+
+
+def make_pdf(text: str) -> bytes:
+    """
+    生成只包含一页文本的pdf（Helvetica，ASCII）
+    """
+    def escape(line: str) -> str:
+        return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    stream_lines = ["BT", "/F1 10 Tf", "14 TL", "50 800 Td"]
+    for line in text.splitlines():
+        stream_lines.append(f"({escape(line)}) Tj T*")
+    stream_lines.append("ET")
+    stream = "\n".join(stream_lines).encode("latin-1", "replace")
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def load_pdf_corpus(pdf_dir: Optional[str], count: int, seed: int = 0) -> List[Tuple[str, bytes]]:
+    """
+    读取pdf_dir中的pdf简历，为空时生成count份
+    :return: [(文件名, pdf内容)]
+    """
+    if pdf_dir:
+        corpus = []
+        for filename in sorted(os.listdir(pdf_dir)):
+            if filename.lower().endswith(".pdf"):
+                with open(os.path.join(pdf_dir, filename), "rb") as f:
+                    corpus.append((filename, f.read()))
+        if corpus:
+            return corpus
+    return [(f"resume_{i}.pdf", make_pdf(make_resume_text(i, seed))) for i in range(count)]
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """
+    最近秩法分位数
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, -(-len(ordered) * p // 100) - 1))
+    return ordered[int(rank)]
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {"count": len(values), "mean": round(sum(values) / len(values), 1) if values else None,
+            "p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99)}
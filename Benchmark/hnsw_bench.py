@@ -0,0 +1,145 @@
+"""
+HNSW参数扫描：在由ks_data模板生成的语料上，对每组(space, M, construction_ef, search_ef)建立集合，
+以精确检索（numpy暴力计算，同一距离）为基准统计recall@k，并统计单次查询延迟（p50/p95）和构建耗时。
+语料与入库规则一致（按句子切块），向量预先计算一次，各组参数共用，只测量索引本身。
+查询从模板的分类名、标签和句子中抽取（带少量扰动，避免与文档完全相同）。
+运行：python -m Benchmark.hnsw_bench --docs 10000 --m 16,32 --construction-ef 100,200 --search-ef 10,50,100 [--hash-embedding]
+选定参数后用KsBuilder构建：python -m KnowledgeSystem.KsBuilder build --space l2 --m 16 --construction-ef 100 --search-ef 50
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+
+from Benchmark.fixtures import chunk_documents, get_embedding_function, load_ks_templates, summarize, \
+    synthesize_documents
+from KnowledgeSystem.KsBuilder import HNSW_SPACES, hnsw_metadata
+
+
+def _make_queries(count: int, seed: int) -> List[str]:
+    rnd = random.Random(seed)
+    templates = load_ks_templates()
+    categories = sorted({m["分类"] for _, m in templates if m.get("分类")})
+    tags = sorted({t.strip() for _, m in templates for t in str(m.get("标签", "")).split(",") if t.strip()})
+    sentences = [text.split("。")[0] for text, _ in templates if len(text.split("。")[0]) >= 10]
+    pool = categories + tags + sentences
+    queries = []
+    for _ in range(count):
+        query = rnd.choice(pool)
+        if len(query) > 8 and rnd.random() < 0.5:
+            # 截取片段，模拟关键词只覆盖文档一部分的查询
+            start = rnd.randrange(len(query) - 6)
+            query = query[start:start + rnd.randint(6, 20)]
+        queries.append(query)
+    return queries
+
+
+def exact_neighbors(vectors: np.ndarray, queries: np.ndarray, k: int, space: str) -> np.ndarray:
+    """
+    精确最近邻（与ChromaDB各距离的定义一致）
+    :return: 每个查询的前k个文档下标
+    """
+    dots = queries @ vectors.T
+    if space == "cosine":
+        norms = np.linalg.norm(vectors, axis=1)
+        query_norms = np.linalg.norm(queries, axis=1)
+        distances = 1.0 - dots / (np.outer(query_norms, norms) + 1e-12)
+    elif space == "ip":
+        distances = 1.0 - dots
+    else:
+        distances = (queries ** 2).sum(axis=1)[:, None] + (vectors ** 2).sum(axis=1)[None, :] - 2 * dots
+    top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(top, np.argsort(np.take_along_axis(distances, top, axis=1), axis=1), axis=1)
+
+
+def bench_config(client, ids: List[str], vectors: np.ndarray, query_vectors: np.ndarray, truth: np.ndarray, k: int,
+                 hnsw: dict, batch_size: int = 5000) -> dict:
+    """
+    按一组HNSW参数建立集合并测量
+    """
+    name = f"hnsw_bench_{int(time.time() * 1000)}"
+    start = time.perf_counter()
+    collection = client.create_collection(name, metadata=hnsw, embedding_function=None)
+    for offset in range(0, len(ids), batch_size):
+        collection.add(ids=ids[offset:offset + batch_size], embeddings=vectors[offset:offset + batch_size])
+    build_s = time.perf_counter() - start
+
+    id_index = {doc_id: i for i, doc_id in enumerate(ids)}
+    latencies, recalls = [], []
+    collection.query(query_embeddings=query_vectors[:1], n_results=k, include=[])  # 预热
+    for query, expected in zip(query_vectors, truth):
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=query[None, :], n_results=k, include=[])
+        latencies.append(round((time.perf_counter() - start) * 1000, 3))
+        found = {id_index[doc_id] for doc_id in result["ids"][0]}
+        recalls.append(len(found & set(expected.tolist())) / k)
+    client.delete_collection(name)
+    return {**{key.split(":", 1)[1]: value for key, value in hnsw.items()},
+            "build_s": round(build_s, 2), "recall": round(float(np.mean(recalls)), 4),
+            "latency_ms": summarize(latencies)}
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HNSW参数扫描：recall@k与查询延迟")
+    parser.add_argument("--docs", type=int, default=10000, help="生成的文档数（切块后的文本块数约为3-4倍）")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10, help="recall@k的k（KsUser默认取n_results*5=10个候选）")
+    parser.add_argument("--space", default="l2", help=f"距离，逗号分隔，可选{HNSW_SPACES}")
+    parser.add_argument("--m", default="16,32")
+    parser.add_argument("--construction-ef", default="100,200")
+    parser.add_argument("--search-ef", default="10,50,100")
+    parser.add_argument("--hash-embedding", action="store_true", help="使用离线哈希向量函数（无需下载模型）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="将结果保存为JSON文件")
+    args = parser.parse_args()
+
+    import chromadb
+
+    embedding_function = get_embedding_function(args.hash_embedding)
+    ids, documents, _ = chunk_documents(*synthesize_documents(args.docs, args.seed))
+    print(f"计算{len(ids)}个文本块和{args.queries}个查询的向量...")
+    vectors = np.vstack([np.asarray(v, dtype=np.float32) for v in embedding_function(documents)])
+    query_vectors = np.vstack([np.asarray(v, dtype=np.float32)
+                               for v in embedding_function(_make_queries(args.queries, args.seed))])
+
+    work_dir = tempfile.mkdtemp(prefix="hnsw_bench_")
+    results = []
+    try:
+        client = chromadb.PersistentClient(path=os.path.join(work_dir, "chroma_db"))
+        for space in (s.strip() for s in args.space.split(",") if s.strip()):
+            truth = exact_neighbors(vectors, query_vectors, args.k, space)
+            for m, construction_ef, search_ef in itertools.product(
+                    _int_list(args.m), _int_list(args.construction_ef), _int_list(args.search_ef)):
+                result = bench_config(client, ids, vectors, query_vectors, truth, args.k,
+                                      hnsw_metadata(space, m, construction_ef, search_ef))
+                results.append(result)
+                print(f"space={space} M={m} construction_ef={construction_ef} search_ef={search_ef}："
+                      f"recall@{args.k}={result['recall']:.4f}，p50 {result['latency_ms']['p50']}ms，"
+                      f"p95 {result['latency_ms']['p95']}ms，构建{result['build_s']}秒")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n{len(ids)}个文本块，recall@{args.k}与p95延迟：")
+    print(f"{'space':<8}{'M':>5}{'c_ef':>7}{'s_ef':>7}{'recall':>9}{'p50ms':>9}{'p95ms':>9}{'构建s':>8}")
+    for r in sorted(results, key=lambda r: (r["space"], -r["recall"], r["latency_ms"]["p95"])):
+        print(f"{r['space']:<8}{r['M']:>5}{r['construction_ef']:>7}{r['search_ef']:>7}{r['recall']:>9.4f}"
+              f"{r['latency_ms']['p50']:>9}{r['latency_ms']['p95']:>9}{r['build_s']:>8}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"chunks": len(ids), "k": args.k, "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
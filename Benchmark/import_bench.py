@@ -0,0 +1,98 @@
+"""
+冷启动导入耗时检查：在新的Python进程中导入API模块（main）和AI工作进程模块（ResumeOptimization），
+测量导入耗时（多次取中位数），并检查导入时没有加载外部依赖的客户端库（openai、neo4j、chromadb、langchain_community）。
+外部依赖应在首次使用或启动预热时才导入和构造（见dependencies.LazyDependency）。
+超出耗时预算或导入了不应导入的库时以非零状态码退出，可放入CI。
+-X importtime输出中自身耗时最高的模块会一并打印，便于定位新增的导入开销。
+运行：python -m Benchmark.import_bench --budget-ms 1500 [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ("main", "ResumeOptimization")
+# 导入时不应加载的库（首次使用时才导入）
+LAZY_MODULES = ("openai", "neo4j", "chromadb", "langchain_community")
+
+_PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - start) * 1000
+loaded = [m for m in {lazy!r} if m in sys.modules]
+print(f"{{elapsed:.1f}}|{{','.join(loaded)}}")
+"""
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = ROOT_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    env.setdefault("LOG_LEVEL", "WARNING")
+    return env
+
+
+def measure(module: str) -> Tuple[float, List[str]]:
+    """
+    在新进程中导入一次模块
+    :return: (导入耗时毫秒, 已加载的延迟导入库)
+    """
+    proc = subprocess.run([sys.executable, "-c", _PROBE.format(module=module, lazy=LAZY_MODULES)],
+                          cwd=ROOT_DIR, env=_env(), capture_output=True, text=True, timeout=120)
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入{module}失败：{proc.stderr.strip()[-500:]}")
+    elapsed, _, loaded = proc.stdout.strip().splitlines()[-1].partition("|")
+    return float(elapsed), [m for m in loaded.split(",") if m]
+
+
+def top_imports(module: str, count: int = 10) -> List[Tuple[str, int]]:
+    """
+    -X importtime中自身耗时最高的模块
+    :return: [(模块名, 自身耗时微秒)]
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=ROOT_DIR, env=_env(), capture_output=True, text=True, timeout=120)
+    own: Dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        own[name.strip()] = int(self_us)
+    return sorted(own.items(), key=lambda item: -item[1])[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动导入耗时检查")
+    parser.add_argument("--modules", default=",".join(MODULES), help="逗号分隔的模块名")
+    parser.add_argument("--budget-ms", type=float, default=1500, help="每个模块导入耗时中位数的上限（毫秒）")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="打印自身耗时最高的模块数，0为不打印")
+    args = parser.parse_args()
+
+    failed = False
+    for module in (m.strip() for m in args.modules.split(",") if m.strip()):
+        samples, loaded = [], set()
+        for _ in range(args.runs):
+            elapsed, lazy_loaded = measure(module)
+            samples.append(elapsed)
+            loaded.update(lazy_loaded)
+        median = statistics.median(samples)
+        over_budget = median > args.budget_ms
+        failed = failed or over_budget or bool(loaded)
+        print(f"{module}：导入耗时中位数{median:.0f}ms（最小{min(samples):.0f}ms，预算{args.budget_ms:.0f}ms）"
+              f"{'，超出预算' if over_budget else ''}"
+              f"{f'，导入时加载了{sorted(loaded)}' if loaded else ''}")
+        if args.top:
+            for name, self_us in top_imports(module, args.top):
+                print(f"    {self_us / 1000:>8.1f}ms  {name}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
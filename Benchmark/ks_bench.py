@@ -0,0 +1,243 @@
+"""
+KsUser检索路径基准测试：分别测量search_similar_text的各检索路径
+    lexical  BM25词法检索（本地索引）
+    vector   向量检索（collection.query）
+    hybrid   词法 + 向量的倒数排名融合（含文本提取和过滤）
+以及完整的search_similar_text，在由ks_data模板生成的1k/10k/100k文档集合上统计延迟、内存（tracemalloc峰值）和召回率。
+查询分三类：category（有分类映射的关键词）、tag（元数据标签中的词）、sentence（模板中的句子）。
+召回率 = 返回结果中相关文档数 / min(n_results, 相关文档总数)：
+    category、tag的相关文档为元数据满足查询条件的文档；sentence的相关文档为该句子所属模板生成的文档。
+--concurrency N时另外用N个线程并发调用search_similar_text，分别测量关闭和开启跨任务查询合并（KsCoalescer）时的吞吐和延迟。
+集合默认按入库规则切块（KsChunker），--no-chunk时整篇入库，用于对比切块前后的延迟和召回率。
+运行：python -m Benchmark.ks_bench --sizes 1000,10000,100000 [--hash-embedding] [--no-chunk] [--output res.json]
+     python -m Benchmark.ks_bench --baseline res.json    # p95延迟比基线慢超过--tolerance时返回非零退出码
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+from Benchmark.fixtures import build_fixture_collection, get_embedding_function, load_ks_templates, summarize
+from KnowledgeSystem.KsCoalescer import COALESCE_MS
+from KnowledgeSystem.KsEmbedding import EmbeddingService
+from KnowledgeSystem.KsUser import KsUser
+
+PATHS = ["lexical", "vector", "hybrid", "search_similar_text"]
+
+
+def _make_queries(ks: KsUser, templates: List[Tuple[str, dict]], count: int, seed: int) -> Dict[str, list]:
+    """
+    生成各类查询及其相关性判断函数
+    :return: {查询类别: [(查询文本, 判断元数据是否相关的函数)]}
+    """
+    rnd = random.Random(seed)
+    categories = {m.get("分类") for _, m in templates}
+    mapped = [(keyword, category) for keyword, category in ks.keyword_to_category.items() if category in categories]
+    tags = sorted({t.strip() for _, m in templates for t in str(m.get("标签", "")).split(",") if t.strip()})
+    sentences = [(text.split("。")[0], index) for index, (text, _) in enumerate(templates)
+                 if len(text.split("。")[0]) >= 10]
+
+    queries = {}
+    if mapped:
+        queries["category"] = [(keyword, lambda m, c=category: m.get("分类") == c)
+                               for keyword, category in (rnd.choice(mapped) for _ in range(count))]
+    if tags:
+        queries["tag"] = [(tag, lambda m, t=tag: any(isinstance(m.get(f), str) and t in m.get(f)
+                                                      for f in ("分类", "标签", "维度")))
+                          for tag in (rnd.choice(tags) for _ in range(count))]
+    if sentences:
+        queries["sentence"] = [(sentence, lambda m, i=index: m.get("template_index") == i)
+                               for sentence, index in (rnd.choice(sentences) for _ in range(count))]
+    return queries
+
+
+def _measure(fn: Callable, args: tuple) -> Tuple[float, int, object]:
+    """
+    :return: (耗时毫秒, tracemalloc峰值字节, 返回值)
+    """
+    tracemalloc.reset_peak()
+    start_current, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    return elapsed_ms, max(0, peak - start_current), result
+
+
+def _bench_concurrent(ks: KsUser, keyword_sets: List[List[str]], concurrency: int, n_results: int,
+                      coalesce_ms: float) -> dict:
+    """
+    concurrency个线程并发调用search_similar_text，模拟同一工作进程内同时处理的多个任务
+    :return: 吞吐（次/秒）和延迟分布
+    """
+    ks.coalescer.window_ms = coalesce_ms
+    latencies = []
+
+    def call(keywords):
+        start = time.perf_counter()
+        ks.search_similar_text(keywords, n_results)
+        latencies.append(round((time.perf_counter() - start) * 1000, 3))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, keyword_sets))
+    elapsed = time.perf_counter() - start
+    return {"coalesce_ms": coalesce_ms, "qps": round(len(keyword_sets) / elapsed, 1),
+            "latency_ms": summarize(latencies)}
+
+
+def bench_size(n_docs: int, queries_per_path: int, n_results: int, hash_embedding: bool, seed: int,
+               chunked: bool = True, concurrency: int = 0) -> dict:
+    work_dir = tempfile.mkdtemp(prefix="ks_bench_")
+    try:
+        start = time.perf_counter()
+        embedding_function = get_embedding_function(hash_embedding)
+        collection = build_fixture_collection(work_dir, n_docs, embedding_function, seed=seed, chunked=chunked)
+        build_s = time.perf_counter() - start
+        start = time.perf_counter()
+        ks = KsUser(collection=collection, chroma_path=os.path.join(work_dir, "chroma_db"),
+                    embedding_service=EmbeddingService(embedding_function, cache_path=None))
+        index_s = time.perf_counter() - start
+        all_metadatas = ks.lexical_index.metadatas
+
+        def lexical(query):
+            return [ks.lexical_index.get(doc_id) for doc_id, _ in ks.lexical_index.search(query, n_results)]
+
+        def vector(query):
+            return [(doc, metadata) for _, doc, metadata in ks._vector_search([query], n_results)[0]]
+
+        def hybrid(query):
+            return ks._hybrid_rank(query, ks._vector_search([query], n_results * 5)[0], n_results)
+
+        fns = {"lexical": lexical, "vector": vector, "hybrid": hybrid}
+        report = {"docs": n_docs, "chunks": collection.count(), "build_s": round(build_s, 2),
+                  "lexical_index_s": round(index_s, 2), "paths": {}}
+        queries = _make_queries(ks, load_ks_templates(), queries_per_path, seed)
+        # search_similar_text每次传入一个分类关键词和一个标签词
+        mixed = [([q for q, _ in group],) for group in
+                 zip(*[queries[kind] for kind in ("category", "tag") if kind in queries])]
+
+        tracemalloc.start()
+        try:
+            runs = [(f"{path}/{kind}", fns[path], [((q,), rel) for q, rel in items])
+                    for path in ("lexical", "vector", "hybrid") for kind, items in queries.items()]
+            runs.append(("search_similar_text", lambda keywords: ks.search_similar_text(keywords, n_results),
+                         [(args, None) for args in mixed]))
+            for name, fn, items in runs:
+                if not items:
+                    continue
+                _measure(fn, items[0][0])  # 预热
+                latencies, peaks, recalls = [], [], []
+                for args, is_relevant in items:
+                    elapsed_ms, peak, result = _measure(fn, args)
+                    latencies.append(round(elapsed_ms, 3))
+                    peaks.append(peak)
+                    if is_relevant is not None:
+                        expected = min(n_results, sum(1 for m in all_metadatas if is_relevant(m)))
+                        if expected:
+                            hits = sum(1 for _, metadata in result if isinstance(metadata, dict) and is_relevant(metadata))
+                            recalls.append(min(1.0, hits / expected))
+                report["paths"][name] = {
+                    "latency_ms": summarize(latencies),
+                    "peak_mem_kb": {"mean": round(sum(peaks) / len(peaks) / 1024, 1),
+                                    "max": round(max(peaks) / 1024, 1)},
+                    "recall": round(sum(recalls) / len(recalls), 3) if recalls else None,
+                }
+        finally:
+            tracemalloc.stop()
+
+        if concurrency > 1 and mixed:
+            # 并发调用数取单线程查询的若干倍，保证每个线程有足够的调用
+            keyword_sets = [args[0] for args in mixed] * max(1, concurrency * 20 // len(mixed))
+            report["concurrency"] = {
+                "threads": concurrency,
+                "coalesce_off": _bench_concurrent(ks, keyword_sets, concurrency, n_results, 0),
+                "coalesce_on": _bench_concurrent(ks, keyword_sets, concurrency, n_results, COALESCE_MS or 2),
+            }
+        return report
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _print_report(reports: List[dict]):
+    print(f"{'文档数':>8} {'路径/查询类别':<20}{'平均ms':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'峰值内存KB':>12}{'召回率':>8}")
+    for report in reports:
+        for path, r in report["paths"].items():
+            latency = r["latency_ms"]
+            recall = "-" if r["recall"] is None else f"{r['recall']:.3f}"
+            print(f"{report['docs']:>8} {path:<20}{latency['mean']:>10}{latency['p50']:>10}{latency['p95']:>10}"
+                  f"{latency['p99']:>10}{r['peak_mem_kb']['max']:>12}{recall:>8}")
+    for report in reports:
+        concurrency = report.get("concurrency")
+        if not concurrency:
+            continue
+        for mode, label in (("coalesce_off", "合并关闭"), ("coalesce_on", "合并开启")):
+            r = concurrency[mode]
+            print(f"{report['docs']:>8} {concurrency['threads']}线程并发 {label}（{r['coalesce_ms']}ms）："
+                  f"吞吐{r['qps']}次/秒，p50 {r['latency_ms']['p50']}ms，p99 {r['latency_ms']['p99']}ms")
+
+
+def _check_regression(reports: List[dict], baseline_path: str, tolerance: float) -> List[str]:
+    """
+    与基线比较p95延迟和召回率
+    :return: 回归项描述列表
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {r["docs"]: r for r in json.load(f)}
+    regressions = []
+    for report in reports:
+        base = baseline.get(report["docs"])
+        if not base:
+            continue
+        for path, r in report["paths"].items():
+            b = base["paths"].get(path)
+            if not b:
+                continue
+            if r["latency_ms"]["p95"] > b["latency_ms"]["p95"] * (1 + tolerance):
+                regressions.append(f"{report['docs']}文档 {path} p95：{b['latency_ms']['p95']} -> {r['latency_ms']['p95']}ms")
+            if r["recall"] is not None and b["recall"] is not None and r["recall"] < b["recall"] - 0.01:
+                regressions.append(f"{report['docs']}文档 {path} 召回率：{b['recall']} -> {r['recall']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KsUser检索路径基准测试")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="集合文档数，逗号分隔")
+    parser.add_argument("--queries", type=int, default=50, help="每条路径的查询数")
+    parser.add_argument("--n-results", type=int, default=2)
+    parser.add_argument("--hash-embedding", action="store_true", help="使用离线哈希向量函数（无需下载模型）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-chunk", action="store_true", help="文档整篇入库（切块前的旧集合）")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发测试的线程数，小于2时不测试")
+    parser.add_argument("--output", default=None, help="将结果保存为JSON文件（可作为基线）")
+    parser.add_argument("--baseline", default=None, help="基线JSON文件")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的p95延迟增幅")
+    args = parser.parse_args()
+
+    reports = []
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        print(f"构建{size}文档的集合并测试...")
+        reports.append(bench_size(size, args.queries, args.n_results, args.hash_embedding, args.seed,
+                                   not args.no_chunk, args.concurrency))
+    _print_report(reports)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+    if args.baseline and os.path.exists(args.baseline):
+        regressions = _check_regression(reports, args.baseline, args.tolerance)
+        for item in regressions:
+            print(f"性能回归：{item}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+本地大模型桩：模拟OpenAI兼容接口（client.chat.completions.create）的前缀缓存计费和首字延迟，
+用于在不调用真实服务的情况下比较不同提示词布局的输入成本和延迟。
+前缀缓存按固定tokens数的块计算：请求的前k个块与之前任一请求的前k个块完全相同时，这k个块按缓存价格计费。
+tokens数按字符粗略估算（中文约1字符1token）。
+"""
+import hashlib
+import time
+from types import SimpleNamespace
+from typing import List
+
+
+class PrefixCacheStub(object):
+    """
+    带前缀缓存计费的大模型桩
+    """
+    def __init__(self, price_input: float = 4.0, price_cached: float = 1.0, price_output: float = 16.0,
+                 block_tokens: int = 64, ttft_base_ms: float = 200.0, prefill_ms_per_token: float = 0.15,
+                 cached_ms_per_token: float = 0.01, output_tokens: int = 200, reply: str = "桩回复：85分。",
+                 simulate_latency: bool = False):
+        """
+        :param price_input: 未命中缓存的输入价格（元/百万tokens）
+        :param price_cached: 命中缓存的输入价格（元/百万tokens）
+        :param price_output: 输出价格（元/百万tokens）
+        :param block_tokens: 前缀缓存的块大小（tokens）
+        :param ttft_base_ms: 首字延迟的固定部分（毫秒）
+        :param prefill_ms_per_token: 未命中缓存的每个输入token的预填充耗时（毫秒）
+        :param cached_ms_per_token: 命中缓存的每个输入token的耗时（毫秒）
+        :param output_tokens: 每次回复的输出tokens数
+        :param reply: 回复内容
+        :param simulate_latency: 是否真的等待首字延迟
+        """
+        self.price_input = price_input
+        self.price_cached = price_cached
+        self.price_output = price_output
+        self.block_tokens = block_tokens
+        self.ttft_base_ms = ttft_base_ms
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.cached_ms_per_token = cached_ms_per_token
+        self.output_tokens = output_tokens
+        self.reply = reply
+        self.simulate_latency = simulate_latency
+
+        self._cached_blocks = set()
+        self.calls: List[dict] = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    @staticmethod
+    def serialize(messages: List[dict]) -> str:
+        """
+        将消息列表序列化为模型看到的文本
+        """
+        return "".join(f"<|{m['role']}|>{m['content']}<|end|>" for m in messages)
+
+    def _cached_prefix_tokens(self, text: str) -> int:
+        """
+        计算命中缓存的前缀tokens数，并把本次请求的所有前缀块加入缓存
+        """
+        h = hashlib.sha1()
+        hit_blocks = 0
+        prefix_hit = True
+        for start in range(0, len(text) - self.block_tokens + 1, self.block_tokens):
+            h.update(text[start:start + self.block_tokens].encode("utf-8"))
+            digest = h.copy().digest()
+            if prefix_hit and digest in self._cached_blocks:
+                hit_blocks += 1
+            else:
+                prefix_hit = False
+                self._cached_blocks.add(digest)
+        return hit_blocks * self.block_tokens
+
+    def create(self, model: str = "", messages: List[dict] = None, **kwargs):
+        text = self.serialize(messages or [])
+        prompt_tokens = len(text)
+        cached_tokens = self._cached_prefix_tokens(text)
+        uncached_tokens = prompt_tokens - cached_tokens
+
+        ttft_ms = (self.ttft_base_ms + uncached_tokens * self.prefill_ms_per_token
+                   + cached_tokens * self.cached_ms_per_token)
+        input_cost = (uncached_tokens * self.price_input + cached_tokens * self.price_cached) / 1e6
+        output_cost = self.output_tokens * self.price_output / 1e6
+        self.calls.append({"model": model, "prompt_tokens": prompt_tokens, "cached_tokens": cached_tokens,
+                           "ttft_ms": ttft_ms, "input_cost": input_cost, "output_cost": output_cost})
+        if self.simulate_latency:
+            time.sleep(ttft_ms / 1000)
+
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=self.output_tokens,
+                                total_tokens=prompt_tokens + self.output_tokens, cached_tokens=cached_tokens,
+                                prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens))
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=self.reply))],
+            usage=usage,
+        )
+
+    def summary(self) -> dict:
+        """
+        汇总所有调用的平均输入成本、首字延迟和缓存命中率
+        """
+        n = len(self.calls) or 1
+        prompt_tokens = sum(c["prompt_tokens"] for c in self.calls)
+        cached_tokens = sum(c["cached_tokens"] for c in self.calls)
+        ttfts = sorted(c["ttft_ms"] for c in self.calls)
+        return {
+            "calls": len(self.calls),
+            "avg_prompt_tokens": prompt_tokens / n,
+            "cache_hit_ratio": cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+            "avg_input_cost": sum(c["input_cost"] for c in self.calls) / n,
+            "avg_ttft_ms": sum(ttfts) / n,
+            "p95_ttft_ms": ttfts[min(len(ttfts) - 1, int(0.95 * len(ttfts)))] if ttfts else 0.0,
+        }
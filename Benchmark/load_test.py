@@ -0,0 +1,382 @@
+"""
+端到端压测：启动FastAPI服务和N个AIWorker，外部依赖全部替换为本地服务：
+    大模型：兼容OpenAI接口的HTTP桩（Benchmark.llm_stub，可配置首字延迟、输出速度和tokens计费）
+    redis：本地redis-server（找不到时使用REDIS_HOST/REDIS_PORT指向的实例）
+    知识库：由ks_data模板生成的ChromaDB集合
+    知识图谱、搜索工具：Benchmark.fixtures中的桩
+按设定的到达率（泊松过程）回放pdf简历，统计吞吐量、端到端延迟p50/p95/p99和各阶段耗时（来自task_trace:{task_id}）。
+运行：python -m Benchmark.load_test --workers 4 --rate 2 --requests 100 [--pdf-dir 简历目录] [--hash-embedding]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+from Benchmark.fixtures import (FakeSearch, FixtureGraph, build_fixture_collection, get_embedding_function,
+                                load_pdf_corpus, summarize, COLLECTION_NAME)
+from Benchmark.llm_stub import PrefixCacheStub
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STAGES = ["pdf_parse", "enqueue", "queue_wait", "clean", "keyword_extract", "ks_search", "web_search_resume",
+          "job_context", "kg_search", "web_search_else", "llm_generate", "result_write"]
+
+
+class FakeLLMServer(object):
+    """
+    兼容OpenAI chat.completions接口的HTTP大模型桩。按提示词识别任务类型返回合适格式的回复：
+    简历清洗原样返回简历，关键词提取返回<#>分隔的关键词，其余返回带分数的建议
+    """
+    def __init__(self, port: int, tokens_per_s: float = 50.0, output_tokens: int = 600, **stub_kwargs):
+        """
+        :param port: 监听端口
+        :param tokens_per_s: 输出速度（tokens/秒），输出耗时 = 输出tokens数 / 输出速度
+        :param output_tokens: 打分+优化等回复的输出tokens数
+        :param stub_kwargs: PrefixCacheStub的参数（价格、首字延迟等）
+        """
+        from LLMs.KimiUser import _KEYWORD_EXTRACT_PROMPT, _RESUME_CLEAN_PROMPT
+        self._clean_prompt = _RESUME_CLEAN_PROMPT
+        self._keyword_prompt = _KEYWORD_EXTRACT_PROMPT
+        self.tokens_per_s = tokens_per_s
+        self.output_tokens = output_tokens
+        self.stub = PrefixCacheStub(output_tokens=output_tokens, simulate_latency=False, **stub_kwargs)
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+
+    def _reply(self, messages: List[dict]) -> tuple[str, int]:
+        systems = [m["content"] for m in messages if m["role"] == "system"]
+        user = messages[-1]["content"] if messages else ""
+        if self._clean_prompt in systems:
+            resume = user.split("：", 1)[-1]
+            return resume, len(resume)
+        if self._keyword_prompt in systems:
+            return "成熟私营企业/互联网大厂<#>研发/工程/技术类<#>技术算法类竞赛<#>知名企业核心岗位实习", 40
+        return "综合评分：85分。\n优化建议：突出项目成果的量化指标，补充与岗位相关的技术栈。", self.output_tokens
+
+    def complete(self, body: dict) -> dict:
+        messages = body.get("messages") or []
+        with self._lock:
+            response = self.stub.create(model=body.get("model", ""), messages=messages)
+            ttft_ms = self.stub.calls[-1]["ttft_ms"]
+        content, completion_tokens = self._reply(messages)
+        time.sleep(ttft_ms / 1000 + completion_tokens / self.tokens_per_s)
+        usage = response.usage
+        return {
+            "id": f"chatcmpl-stub-{len(self.stub.calls)}", "object": "chat.completion", "created": int(time.time()),
+            "model": body.get("model", ""),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": usage.prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": usage.prompt_tokens + completion_tokens, "cached_tokens": usage.cached_tokens,
+                      "prompt_tokens_details": {"cached_tokens": usage.cached_tokens}},
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, data: dict, status: int = 200):
+                body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                if not self.path.endswith("/chat/completions"):
+                    self._send({"error": {"message": "not found"}}, 404)
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                self._send(server.complete(json.loads(self.rfile.read(length))))
+
+            def do_GET(self):
+                with server._lock:
+                    self._send(server.stub.summary())
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="fake-llm", daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_redis(port: int):
+    """
+    启动不持久化的本地redis-server，未安装时返回None
+    """
+    binary = shutil.which("redis-server")
+    if not binary:
+        return None
+    proc = subprocess.Popen([binary, "--port", str(port), "--save", "", "--appendonly", "no"],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(0.5)
+    return proc
+
+
+def _wait_http(url: str, timeout: float = 60.0):
+    import httpx
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code < 500:
+                return
+        except Exception:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"服务未在{timeout}秒内就绪：{url}")
+
+
+def run_worker(fixture_dir: str, hash_embedding: bool, search_latency_ms: float, graph_latency_ms: float):
+    """
+    压测用的AI工作进程：知识库指向固定数据集合，知识图谱和搜索工具替换为桩
+    """
+    # 知识库指向固定数据目录中的集合（词法索引也从该目录加载）
+    os.chdir(fixture_dir)
+    os.environ["KS_CHROMA_PATH"] = os.path.join(fixture_dir, "chroma_db")
+    import chromadb
+    import ResumeOptimization
+
+    from KnowledgeSystem.KsEmbedding import EmbeddingService
+    from KnowledgeSystem.KsUser import KsUser
+
+    embedding_function = get_embedding_function(hash_embedding)
+    client = chromadb.PersistentClient(path=os.path.join(fixture_dir, "chroma_db"))
+    ResumeOptimization.ks_user.set(KsUser(
+        collection=client.get_collection(COLLECTION_NAME, embedding_function=embedding_function),
+        chroma_path=os.path.join(fixture_dir, "chroma_db"),
+        embedding_service=EmbeddingService(embedding_function, cache_path=None)))
+    ResumeOptimization.kg.set(FixtureGraph(graph_latency_ms))
+    ResumeOptimization.ddg.set(FakeSearch(search_latency_ms))
+    ResumeOptimization.main()
+
+
+class LoadTest(object):
+    """
+    压测编排：启动依赖和进程，按到达率提交任务，收集结果
+    """
+    def __init__(self, args):
+        self.args = args
+        self.procs: List[subprocess.Popen] = []
+        self.submitted: Dict[str, float] = {}
+        self.completed: Dict[str, float] = {}
+        self.submit_ms: List[float] = []
+        self.rejected = 0
+
+    def _env(self, redis_port: int, llm_port: int, work_dir: str) -> dict:
+        env = dict(os.environ)
+        env.update({
+            "REDIS_HOST": self.args.redis_host, "REDIS_PORT": str(redis_port),
+            "KIMI_BASE_URL": f"http://127.0.0.1:{llm_port}/v1", "KIMI_API_KEY": "stub",
+            "TRACE_FILE": os.path.join(work_dir, "traces.jsonl"),
+            "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+            "PYTHONPATH": ROOT_DIR + os.pathsep + env.get("PYTHONPATH", ""),
+        })
+        return env
+
+    def _listen(self, client, stop: threading.Event):
+        """
+        订阅结果通知，记录每个任务的完成时间
+        """
+        from redis_client import RES_NOTIFY_CHANNEL
+        pubsub = client.pubsub()
+        pubsub.subscribe(RES_NOTIFY_CHANNEL)
+        while not stop.is_set():
+            message = pubsub.get_message(ignore_subscribe_messages=True, timeout=0.5)
+            if message:
+                self.completed.setdefault(message["data"], time.time())
+        pubsub.close()
+
+    async def _submit(self, http, url: str, name: str, pdf: bytes):
+        start = time.time()
+        try:
+            response = await http.post(url, files={"file": (name, pdf, "application/pdf")},
+                                       data={"job_name": self.args.job_name, "job_description": self.args.job_description,
+                                             "more_info": "暂无", "user_request": "暂无",
+                                             "tenant_id": f"tenant{random.randrange(self.args.tenants)}"})
+            data = response.json()
+        except Exception:
+            self.rejected += 1
+            return
+        self.submit_ms.append((time.time() - start) * 1000)
+        if response.status_code == 200 and data.get("status") == "success":
+            self.submitted[data["message"]] = start
+        else:
+            self.rejected += 1
+
+    async def _replay(self, api_port: int, corpus):
+        """
+        开环泊松到达：不等待上一请求返回
+        """
+        import httpx
+        rnd = random.Random(self.args.seed)
+        url = f"http://127.0.0.1:{api_port}/resume_optimization"
+        async with httpx.AsyncClient(timeout=60) as http:
+            tasks = []
+            for i in range(self.args.requests):
+                name, pdf = corpus[i % len(corpus)]
+                tasks.append(asyncio.create_task(self._submit(http, url, name, pdf)))
+                await asyncio.sleep(rnd.expovariate(self.args.rate))
+            await asyncio.gather(*tasks)
+
+    def run(self) -> dict:
+        import redis
+
+        args = self.args
+        work_dir = tempfile.mkdtemp(prefix="resume_load_test_")
+        redis_port = args.redis_port
+        redis_proc = _start_redis(redis_port) if args.redis_host in ("localhost", "127.0.0.1") else None
+        if redis_proc:
+            self.procs.append(redis_proc)
+        else:
+            redis_port = int(os.getenv("REDIS_PORT", "6379"))
+            print(f"未找到redis-server，使用已有redis：{args.redis_host}:{redis_port}（不会清空数据）")
+
+        llm_port = _free_port()
+        llm = FakeLLMServer(llm_port, tokens_per_s=args.llm_tokens_per_s, output_tokens=args.output_tokens,
+                            ttft_base_ms=args.llm_ttft_ms, prefill_ms_per_token=args.llm_prefill_ms_per_token)
+        llm.start()
+
+        print(f"生成固定数据知识库：{work_dir}")
+        build_fixture_collection(work_dir, args.ks_docs, get_embedding_function(args.hash_embedding))
+
+        env = self._env(redis_port, llm_port, work_dir)
+        for i in range(args.workers):
+            worker_env = dict(env, METRICS_PORT=str(_free_port()))
+            self.procs.append(subprocess.Popen(
+                [sys.executable, "-m", "Benchmark.load_test", "--role", "worker", "--fixture-dir", work_dir,
+                 "--search-latency-ms", str(args.search_latency_ms), "--graph-latency-ms", str(args.graph_latency_ms)]
+                + (["--hash-embedding"] if args.hash_embedding else []),
+                cwd=ROOT_DIR, env=worker_env))
+        api_port = _free_port()
+        self.procs.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(api_port),
+             "--workers", str(args.api_workers)], cwd=ROOT_DIR, env=env))
+
+        client = redis.Redis(host=args.redis_host, port=redis_port, decode_responses=True)
+        stop = threading.Event()
+        listener = threading.Thread(target=self._listen, args=(client, stop), daemon=True)
+        try:
+            _wait_http(f"http://127.0.0.1:{api_port}/queue_stats")
+            listener.start()
+            corpus = load_pdf_corpus(args.pdf_dir, min(args.requests, 50), args.seed)
+            print(f"开始压测：{args.requests}个请求，到达率{args.rate}/秒，工作进程{args.workers}个")
+            started = time.time()
+            asyncio.run(self._replay(api_port, corpus))
+            deadline = time.time() + args.drain_timeout
+            while time.time() < deadline and any(t not in self.completed for t in self.submitted):
+                time.sleep(0.5)
+            return self._report(client, llm, started)
+        finally:
+            stop.set()
+            for proc in reversed(self.procs):
+                proc.terminate()
+            for proc in self.procs:
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+            llm.stop()
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _report(self, client, llm: FakeLLMServer, started: float) -> dict:
+        done = [t for t in self.submitted if t in self.completed]
+        e2e_ms = [(self.completed[t] - self.submitted[t]) * 1000 for t in done]
+        elapsed = (max(self.completed[t] for t in done) - started) if done else 0.0
+
+        pipe = client.pipeline(transaction=False)
+        for task_id in done:
+            pipe.hgetall(f"task_trace:{task_id}")
+        stages: Dict[str, List[float]] = {}
+        for trace in pipe.execute():
+            for stage_name, ms in trace.items():
+                stages.setdefault(stage_name, []).append(float(ms))
+
+        return {
+            "requests": self.args.requests,
+            "accepted": len(self.submitted),
+            "rejected": self.rejected,
+            "completed": len(done),
+            "throughput_per_s": round(len(done) / elapsed, 3) if elapsed else 0.0,
+            "submit_ms": summarize(self.submit_ms),
+            "end_to_end_ms": summarize(e2e_ms),
+            "stages_ms": {s: summarize(stages[s]) for s in STAGES + sorted(set(stages) - set(STAGES)) if s in stages},
+            "llm": llm.stub.summary(),
+        }
+
+
+def _print_report(report: dict):
+    print(f"\n请求{report['requests']}，接受{report['accepted']}，拒绝{report['rejected']}，完成{report['completed']}，"
+          f"吞吐量{report['throughput_per_s']}/秒")
+    print(f"{'指标':<20}{'次数':>8}{'平均':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    rows = [("提交接口", report["submit_ms"]), ("端到端", report["end_to_end_ms"])]
+    rows += [(s, v) for s, v in report["stages_ms"].items()]
+    for name, s in rows:
+        print(f"{name:<20}{s['count']:>8}" + "".join(f"{(v if v is not None else '-'):>10}"
+                                                      for v in (s["mean"], s["p50"], s["p95"], s["p99"])))
+    llm = report["llm"]
+    print(f"大模型调用{llm['calls']}次，平均输入{llm['avg_prompt_tokens']:.0f}tokens，"
+          f"缓存命中率{llm['cache_hit_ratio']:.1%}，平均输入成本{llm['avg_input_cost']:.6f}元")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="简历打分+优化端到端压测")
+    parser.add_argument("--role", choices=["driver", "worker"], default="driver")
+    parser.add_argument("--workers", type=int, default=2, help="AI工作进程数")
+    parser.add_argument("--api-workers", type=int, default=1, help="uvicorn工作进程数")
+    parser.add_argument("--rate", type=float, default=1.0, help="到达率（请求/秒）")
+    parser.add_argument("--requests", type=int, default=50, help="请求总数")
+    parser.add_argument("--tenants", type=int, default=4, help="模拟的租户数")
+    parser.add_argument("--pdf-dir", default=None, help="pdf简历目录，为空时生成ASCII简历")
+    parser.add_argument("--job-name", default="数据分析师")
+    parser.add_argument("--job-description", default="负责业务数据分析与建模，熟悉SQL和Python")
+    parser.add_argument("--ks-docs", type=int, default=None, help="知识库文档数，为空时只使用模板原文")
+    parser.add_argument("--hash-embedding", action="store_true", help="使用离线哈希向量函数（无需下载模型）")
+    parser.add_argument("--redis-host", default="127.0.0.1")
+    parser.add_argument("--redis-port", type=int, default=6399, help="本地redis-server端口")
+    parser.add_argument("--llm-ttft-ms", type=float, default=300.0, help="大模型首字延迟固定部分")
+    parser.add_argument("--llm-prefill-ms-per-token", type=float, default=0.1)
+    parser.add_argument("--llm-tokens-per-s", type=float, default=60.0, help="大模型输出速度")
+    parser.add_argument("--output-tokens", type=int, default=600, help="打分+优化回复的输出tokens数")
+    parser.add_argument("--search-latency-ms", type=float, default=300.0)
+    parser.add_argument("--graph-latency-ms", type=float, default=5.0)
+    parser.add_argument("--drain-timeout", type=float, default=300.0, help="提交完成后等待任务处理完的最长秒数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fixture-dir", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--output", default=None, help="将报告保存为JSON文件")
+    args = parser.parse_args()
+
+    if args.role == "worker":
+        run_worker(args.fixture_dir, args.hash_embedding, args.search_latency_ms, args.graph_latency_ms)
+        return
+
+    report = LoadTest(args).run()
+    _print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+提示词布局对比：旧布局（任务要求与变化内容拼在一条用户消息中）与新布局（固定前缀 + 变化后缀）
+在模拟前缀缓存计费的本地桩上的每次调用输入成本和首字延迟。
+运行：python -m Benchmark.prompt_cache_bench --jobs 5 --resumes 20
+"""
+import argparse
+import random
+from typing import List
+
+from Benchmark.llm_stub import PrefixCacheStub
+from LLMs.KimiUser import KimiUser, _SYSTEM_PROMPT
+
+_OLD_SCORE_INSTRUCTION = KimiUser.resume_score_messages("", "")[1]["content"].replace(
+    "用户上传的内容在用户消息中给出。", "用户上传的内容如下：")
+_OLD_CLEAN_INSTRUCTION = KimiUser.resume_clean_messages("")[1]["content"].replace("用户简历在用户消息中给出。", "")
+_OLD_KEYWORD_INSTRUCTION = KimiUser.keyword_extract_messages("")[1]["content"]
+
+
+def legacy_resume_clean_messages(resume: str) -> List[dict]:
+    return [{"role": "system", "content": _SYSTEM_PROMPT},
+            {"role": "user", "content": f"{_OLD_CLEAN_INSTRUCTION}以下为用户简历：{resume}"}]
+
+
+def legacy_keyword_extract_messages(all_text: str) -> List[dict]:
+    return [{"role": "system", "content": _SYSTEM_PROMPT},
+            {"role": "user", "content": f"{_OLD_KEYWORD_INSTRUCTION}内容文本如下：{all_text}"}]
+
+
+def legacy_resume_score_messages(resume_text, job_description, ks_info, kg_info, tools_reply, user_request,
+                                 more_info) -> List[dict]:
+    # 旧布局：简历在岗位信息之前，且全部内容与任务要求拼在同一条用户消息中
+    return [{"role": "system", "content": _SYSTEM_PROMPT},
+            {"role": "user", "content":
+                f"{_OLD_SCORE_INSTRUCTION}简历内容：{resume_text}。岗位名称及描述：{job_description}。"
+                f"知识库里的相关信息和打分依据：{ks_info}。知识图谱提供的岗位能力画像：{kg_info}"
+                f"搜索工具返回的信息：{tools_reply}。公司名称及其他信息：{more_info}。"
+                f"用户备注或特殊需求：{user_request}"}]
+
+
+def make_workload(jobs: int, resumes: int, seed: int = 0) -> List[dict]:
+    """
+    生成jobs个岗位、每个岗位resumes份简历的任务（同岗位任务交错到达）
+    """
+    rnd = random.Random(seed)
+    skills = ["Java", "Python", "SQL", "Redis", "React", "FastAPI", "Pytorch", "Neo4j", "Docker", "Linux"]
+    awards = ["挑战杯", "大创", "数学竞赛一等奖", "ACM区域赛铜奖", "数字创新大赛三等奖"]
+    job_list = []
+    for j in range(jobs):
+        job_list.append({
+            "job": f"岗位{j}：AI应用开发工程师  岗位职责：" + "；".join(
+                f"{k + 1}.负责{rnd.choice(skills)}相关模块的设计与开发" for k in range(12)),
+            "more_info": f"公司{j}：" + "专注于智能物流系统一站式解决方案，" * 8,
+            "kg_info": " ".join(rnd.sample(skills, 8)),
+            "tools_reply": "暂无###暂无",
+        })
+    tasks = []
+    for r in range(resumes):
+        for job in job_list:
+            resume = (f"姓名：翟**{r} 年龄：20 合肥工业大学 信息管理与信息系统。技能：" + "，".join(rnd.sample(skills, 6))
+                      + "。项目经历：" + "基于LLM的智能招聘助手系统，负责后端与知识图谱构建。" * rnd.randint(4, 8)
+                      + "比赛：" + "，".join(rnd.sample(awards, 3)))
+            tasks.append({**job, "resume": resume, "ks_info": f"【实习】 1. [知名企业核心岗位实习] 示例{r}",
+                          "user_request": "暂无"})
+    return tasks
+
+
+def run_layout(tasks: List[dict], legacy: bool, **stub_kwargs) -> dict:
+    """
+    按简历清洗、关键词提取、打分+优化的顺序对每个任务调用桩，返回各类调用的汇总
+    """
+    stubs = {"简历清洗": PrefixCacheStub(**stub_kwargs), "关键词提取": PrefixCacheStub(**stub_kwargs),
+             "打分+优化": PrefixCacheStub(**stub_kwargs)}
+    for t in tasks:
+        if legacy:
+            clean = legacy_resume_clean_messages(t["resume"])
+            keyword = legacy_keyword_extract_messages(f"岗位名称：{t['job']}。其他信息：{t['more_info']}。简历内容：{t['resume']}。")
+            score = legacy_resume_score_messages(t["resume"], t["job"], t["ks_info"], t["kg_info"], t["tools_reply"],
+                                                 t["user_request"], t["more_info"])
+        else:
+            clean = KimiUser.resume_clean_messages(t["resume"])
+            keyword = KimiUser.keyword_extract_messages(f"岗位名称：{t['job']}。其他信息：{t['more_info']}。简历内容：{t['resume']}。")
+            score = KimiUser.resume_score_messages(t["resume"], t["job"], t["ks_info"], t["kg_info"], t["tools_reply"],
+                                                   t["user_request"], t["more_info"])
+        stubs["简历清洗"].create(messages=clean)
+        stubs["关键词提取"].create(messages=keyword)
+        stubs["打分+优化"].create(messages=score)
+    return {name: stub.summary() for name, stub in stubs.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="提示词前缀缓存布局对比")
+    parser.add_argument("--jobs", type=int, default=5, help="岗位数")
+    parser.add_argument("--resumes", type=int, default=20, help="每个岗位的简历数")
+    parser.add_argument("--block-tokens", type=int, default=64, help="前缀缓存块大小")
+    args = parser.parse_args()
+
+    tasks = make_workload(args.jobs, args.resumes)
+    results = {"旧布局": run_layout(tasks, legacy=True, block_tokens=args.block_tokens),
+               "新布局": run_layout(tasks, legacy=False, block_tokens=args.block_tokens)}
+
+    print(f"任务数：{len(tasks)}（{args.jobs}个岗位 × {args.resumes}份简历）")
+    print(f"{'布局':<6}{'调用':<8}{'平均输入tokens':>14}{'缓存命中率':>10}{'平均输入成本(元)':>18}{'平均首字延迟(ms)':>18}{'p95首字延迟(ms)':>16}")
+    for layout, summary in results.items():
+        for name, s in summary.items():
+            print(f"{layout:<6}{name:<8}{s['avg_prompt_tokens']:>14.0f}{s['cache_hit_ratio']:>10.1%}"
+                  f"{s['avg_input_cost']:>18.6f}{s['avg_ttft_ms']:>18.1f}{s['p95_ttft_ms']:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -143,7 +143,7 @@ class KgUser():
 
             len_count = len(counts)
             log.info(f"拆分去重（重复值进行计数）后结果总数：{len_count}")
-            log.info(f"全词汇出现次数：{counts}")
+            log.debug(f"全词汇出现次数：{counts}")
 
             # 根据结果总数计算分位数。
             if len_count < 20:
@@ -219,7 +219,7 @@ class KgUser():
 
             len_count = len(counts)
             log.info(f"拆分去重（重复值进行计数）后结果总数：{len_count}")
-            log.info(f"全词汇出现次数：{counts}")
+            log.debug(f"全词汇出现次数：{counts}")
 
             # 根据结果总数计算分位数。
             if len_count < 20:
@@ -0,0 +1,240 @@
+"""
+知识库检索后端：统一各进程打开知识库的方式
+    KS_BACKEND=local   本进程内的PersistentClient（默认）。每个工作进程各自加载向量索引
+    KS_BACKEND=server  所有工作进程通过HttpClient访问同一个本地Chroma服务进程（KS_CHROMA_HOST、KS_CHROMA_PORT），
+                       向量索引只在服务进程中加载一份。启动服务：chroma run --path <KS_CHROMA_PATH> --port 8000
+    KS_BACKEND=mmap    只读的内存映射索引：版本集合的向量导出为{集合名}.mmap/vectors.npy，各进程以mmap方式打开，
+                       共享操作系统页缓存，检索为矩阵乘法的精确最近邻。文本和元数据存于同目录的records.sqlite3，
+                       只按需读取前k个结果的记录，不整体载入各进程内存。导出由KsBuilder构建版本时完成
+知识库目录KS_CHROMA_PATH默认为项目根目录下的chroma_db（绝对路径），不再随启动时的工作目录变化。
+"""
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from logger import get_logger
+
+log = get_logger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHROMA_PATH = os.path.abspath(os.getenv("KS_CHROMA_PATH", os.path.join(PROJECT_ROOT, "chroma_db")))
+BACKEND_MODE = os.getenv("KS_BACKEND", "local")
+CHROMA_HOST = os.getenv("KS_CHROMA_HOST", "127.0.0.1")
+CHROMA_PORT = int(os.getenv("KS_CHROMA_PORT", "8000"))
+
+BACKEND_MODES = ("local", "server", "mmap")
+# 内存映射索引的记录文件（行号、id、文本、元数据JSON）
+RECORDS_FILE = "records.sqlite3"
+
+
+class MmapCollection(object):
+    """
+    内存映射的只读集合，实现KsUser和词法索引用到的集合接口（name、count、query、get）
+    距离与导出时集合的space一致（l2为平方欧氏距离，cosine为1-余弦相似度，ip为1-内积），检索结果与ChromaDB精确检索相同
+    记录（id、文本、元数据）按行号存于records.sqlite3，查询时只读取命中的行
+    """
+    def __init__(self, name: str, directory: str):
+        self.name = name
+        with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.space = manifest.get("space", "l2")
+        self.metadata = manifest.get("metadata") or {}
+        self.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        self.norms = np.load(os.path.join(directory, "norms.npy"), mmap_mode="r")
+        # 只读打开，多个线程共用一个连接（加锁）
+        self._db = sqlite3.connect(f"file:{os.path.join(directory, RECORDS_FILE)}?mode=ro", uri=True,
+                                   check_same_thread=False)
+        self._db_lock = threading.Lock()
+
+    def count(self) -> int:
+        return int(self.vectors.shape[0])
+
+    def _records(self, sql: str, params: list) -> List[tuple]:
+        with self._db_lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _load_rows(self, indices: List[int]) -> Dict[int, tuple]:
+        """
+        按行号读取记录
+        :return: 行号 -> (id, 文本, 元数据)
+        """
+        rows = {}
+        # sqlite单条语句的参数个数有上限，分批查询
+        for start in range(0, len(indices), 500):
+            part = indices[start:start + 500]
+            for idx, doc_id, document, metadata in self._records(
+                    f"SELECT idx, id, document, metadata FROM records WHERE idx IN ({','.join('?' * len(part))})",
+                    part):
+                rows[idx] = (doc_id, document, json.loads(metadata) if metadata else None)
+        return rows
+
+    def _distances(self, query: np.ndarray) -> np.ndarray:
+        dots = self.vectors @ query
+        if self.space == "cosine":
+            query_norm = np.linalg.norm(query) or 1.0
+            return 1.0 - dots / (np.where(self.norms == 0, 1.0, self.norms) * query_norm)
+        if self.space == "ip":
+            return 1.0 - dots
+        return self.norms ** 2 + float(query @ query) - 2 * dots
+
+    def query(self, query_embeddings=None, n_results: int = 10, include: List[str] = None, **kwargs) -> dict:
+        if query_embeddings is None:
+            raise ValueError("内存映射索引只支持query_embeddings查询")
+        tops, distances = [], []
+        n_results = min(n_results, self.count())
+        for query in query_embeddings:
+            query_distances = self._distances(np.asarray(query, dtype=np.float32))
+            if n_results < len(query_distances):
+                top = np.argpartition(query_distances, n_results - 1)[:n_results]
+            else:
+                top = np.arange(len(query_distances))
+            top = top[np.argsort(query_distances[top])]
+            tops.append([int(i) for i in top])
+            distances.append([float(query_distances[i]) for i in top])
+        # 所有查询命中的记录一次读出
+        rows = self._load_rows(sorted({i for top in tops for i in top}))
+        return {"ids": [[rows[i][0] for i in top] for top in tops],
+                "documents": [[rows[i][1] for i in top] for top in tops],
+                "metadatas": [[rows[i][2] for i in top] for top in tops],
+                "distances": distances}
+
+    def get(self, ids: List[str] = None, where: Dict = None, limit: int = None, offset: int = None,
+            include: List[str] = None, **kwargs) -> dict:
+        sql, params = "SELECT id, document, metadata FROM records", []
+        conditions = []
+        if ids is not None:
+            conditions.append(f"id IN ({','.join('?' * len(ids))})")
+            params.extend(ids)
+        for key, value in (where or {}).items():
+            conditions.append("json_extract(metadata, ?) = ?")
+            params.extend([f'$."{key}"', value])
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY idx LIMIT ? OFFSET ?"
+        params.extend([-1 if limit is None else limit, offset or 0])
+        rows = self._records(sql, params)
+        return {"ids": [r[0] for r in rows], "documents": [r[1] for r in rows],
+                "metadatas": [json.loads(r[2]) if r[2] else None for r in rows]}
+
+
+class KsBackend(object):
+    """
+    知识库后端：提供ChromaDB客户端（版本别名、构建）和检索用的集合
+    """
+    def __init__(self, mode: str = BACKEND_MODE, chroma_path: str = CHROMA_PATH, host: str = CHROMA_HOST,
+                 port: int = CHROMA_PORT):
+        """
+        :param mode: local / server / mmap
+        :param chroma_path: 知识库目录（local模式的数据库、词法索引和内存映射索引所在目录）
+        :param host: server模式的Chroma服务地址
+        :param port: server模式的Chroma服务端口
+        """
+        if mode not in BACKEND_MODES:
+            raise ValueError(f"未知的知识库后端：{mode}，可选{BACKEND_MODES}")
+        self.mode = mode
+        self.chroma_path = os.path.abspath(chroma_path)
+        self.host = host
+        self.port = port
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """
+        ChromaDB客户端。mmap模式下只用于读取版本别名，不加载向量索引
+        """
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import chromadb
+                    if self.mode == "server":
+                        self._client = chromadb.HttpClient(host=self.host, port=self.port)
+                    else:
+                        self._client = chromadb.PersistentClient(path=self.chroma_path)
+                    log.info(f"知识库后端：{self.mode}，"
+                             f"{f'{self.host}:{self.port}' if self.mode == 'server' else self.chroma_path}")
+        return self._client
+
+    def mmap_dir(self, name: str) -> str:
+        return os.path.join(self.chroma_path, f"{name}.mmap")
+
+    def open_collection(self, name: str):
+        """
+        打开检索用的集合。mmap模式下打开导出的内存映射索引，不存在时退回ChromaDB集合
+        """
+        if self.mode == "mmap":
+            directory = self.mmap_dir(name)
+            if os.path.exists(os.path.join(directory, "manifest.json")) \
+                    and os.path.exists(os.path.join(directory, RECORDS_FILE)):
+                return MmapCollection(name, directory)
+            log.warning(f"{name}没有内存映射索引（或为旧格式），使用ChromaDB集合。可运行KsBuilder export-mmap导出")
+        return self.client.get_collection(name=name)
+
+    def export_mmap(self, collection, batch_size: int = 5000) -> str:
+        """
+        将集合的向量、文本和元数据导出为内存映射索引（先写临时目录再替换，读取方不会看到写了一半的文件）
+        记录按批写入sqlite，行号与向量矩阵的行对应
+        :return: 导出目录
+        """
+        directory = self.mmap_dir(collection.name)
+        tmp_dir = f"{directory}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        db = sqlite3.connect(os.path.join(tmp_dir, RECORDS_FILE))
+        try:
+            db.execute("CREATE TABLE records (idx INTEGER PRIMARY KEY, id TEXT NOT NULL, document TEXT, metadata TEXT)")
+            vectors = []
+            offset = 0
+            while True:
+                batch = collection.get(include=["embeddings", "documents", "metadatas"], limit=batch_size,
+                                       offset=offset)
+                if not len(batch["ids"]):
+                    break
+                db.executemany("INSERT INTO records (idx, id, document, metadata) VALUES (?, ?, ?, ?)",
+                               [(offset + i, doc_id, document,
+                                 json.dumps(metadata, ensure_ascii=False) if metadata is not None else None)
+                                for i, (doc_id, document, metadata)
+                                in enumerate(zip(batch["ids"], batch["documents"], batch["metadatas"]))])
+                vectors.extend(np.asarray(v, dtype=np.float32) for v in batch["embeddings"])
+                offset += len(batch["ids"])
+            db.execute("CREATE INDEX records_id ON records (id)")
+            db.commit()
+        finally:
+            db.close()
+
+        matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        metadata = dict(collection.metadata or {})
+        np.save(os.path.join(tmp_dir, "vectors.npy"), matrix)
+        np.save(os.path.join(tmp_dir, "norms.npy"), np.linalg.norm(matrix, axis=1).astype(np.float32)
+                if len(matrix) else np.zeros(0, dtype=np.float32))
+        with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump({"name": collection.name, "count": offset, "dim": int(matrix.shape[1]) if len(matrix) else 0,
+                       "space": metadata.get("hnsw:space", "l2"), "metadata": metadata}, f, ensure_ascii=False)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp_dir, directory)
+        log.info(f"内存映射索引已导出：{directory}，{offset}个文本块")
+        return directory
+
+    def remove_mmap(self, name: str):
+        shutil.rmtree(self.mmap_dir(name), ignore_errors=True)
+
+
+_default_backend: Optional[KsBackend] = None
+_default_lock = threading.Lock()
+
+
+def get_backend() -> KsBackend:
+    """
+    进程内共享的默认后端（按环境变量配置）
+    """
+    global _default_backend
+    if _default_backend is None:
+        with _default_lock:
+            if _default_backend is None:
+                _default_backend = KsBackend()
+    return _default_backend
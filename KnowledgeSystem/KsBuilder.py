@@ -1,38 +1,164 @@
 """
-构建知识库
+构建知识库：蓝绿重建
+    1. build_version：将ks_data中的全部文件写入新的版本集合res_opt_documents_v{n}，并构建该版本的词法索引
+    2. validate：检查文档数、每个源文件是否入库、词法索引是否一致、抽样检索是否有结果
+    3. activate：校验通过后将别名指向新版本，线上KsUser在下次刷新时切换；旧版本保留用于回滚
+命令行：
+    python -m KnowledgeSystem.KsBuilder [build] [--no-activate]    构建、校验并切换到新版本
+    python -m KnowledgeSystem.KsBuilder list | activate 集合名 | rollback | prune [--keep 2] | export-mmap [集合名]
+向量索引（HNSW）参数：距离space、图的连接数M、构建时的construction_ef、检索时的search_ef，
+由环境变量KS_HNSW_SPACE（默认l2）、KS_HNSW_M（16）、KS_HNSW_CONSTRUCTION_EF（100）、KS_HNSW_SEARCH_EF（100）或build的命令行参数指定，
+默认值与ChromaDB一致。参数对召回率和延迟的影响可用Benchmark/hnsw_bench.py在当前语料规模下测量。
+知识库后端为server时通过Chroma服务构建；为mmap时用本地数据库构建，并为新版本导出内存映射索引（见KsBackend）。
 """
+import argparse
 import uuid
 import json
-import chromadb
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Tuple
 import os
 from logger import get_logger
+from KnowledgeSystem.KsLexicalIndex import KsLexicalIndex
+from KnowledgeSystem.KsChunker import chunk_text, CHUNK_SENTENCES, CHUNK_OVERLAP, CHUNK_MAX_CHARS
+from KnowledgeSystem.KsVersions import KsCollectionAlias, version_name
+from KnowledgeSystem.KsBackend import KsBackend, BACKEND_MODE, CHROMA_PATH, PROJECT_ROOT
+
+KS_DATA_DIR = os.path.join(PROJECT_ROOT, "KnowledgeSystem", "ks_data")
+
+HNSW_SPACE = os.getenv("KS_HNSW_SPACE", "l2")
+HNSW_M = int(os.getenv("KS_HNSW_M", "16"))
+HNSW_CONSTRUCTION_EF = int(os.getenv("KS_HNSW_CONSTRUCTION_EF", "100"))
+HNSW_SEARCH_EF = int(os.getenv("KS_HNSW_SEARCH_EF", "100"))
+HNSW_SPACES = ("l2", "cosine", "ip")
+
+
+def hnsw_metadata(space: str = HNSW_SPACE, m: int = HNSW_M, construction_ef: int = HNSW_CONSTRUCTION_EF,
+                  search_ef: int = HNSW_SEARCH_EF) -> Dict[str, Any]:
+    """
+    创建集合时的HNSW参数（ChromaDB集合元数据）
+    Args:
+        space: 距离，l2 / cosine / ip
+        m: 每个节点的最大连接数，越大召回率越高、内存和构建时间越多
+        construction_ef: 构建时的候选数，越大图质量越好、构建越慢
+        search_ef: 检索时的候选数，越大召回率越高、检索越慢
+    """
+    if space not in HNSW_SPACES:
+        raise ValueError(f"未知的距离：{space}，可选{HNSW_SPACES}")
+    return {"hnsw:space": space, "hnsw:M": m, "hnsw:construction_ef": construction_ef, "hnsw:search_ef": search_ef}
 
 log = get_logger()
 
 
-# 持久化客户端
-client = chromadb.PersistentClient(path="./chroma_db")
-
-# 创建或获取集合
-try:
-    collection = client.get_collection(name="res_opt_documents")
-except Exception as e:
-    if "not found" in str(e).lower() or "does not exist" in str(e).lower():
-        collection = client.create_collection(name="res_opt_documents")
-    else:
-        raise e
-
 class KsBuilder:
-    def __init__(self):
-        pass
+    def __init__(self, chroma_path: str = CHROMA_PATH, chunk_sentences: int = CHUNK_SENTENCES,
+                 chunk_overlap: int = CHUNK_OVERLAP, chunk_max_chars: int = CHUNK_MAX_CHARS,
+                 backend: KsBackend = None, hnsw: Dict[str, Any] = None):
+        """
+        Args:
+            chroma_path: 知识库目录（首次使用时才打开）
+            chunk_sentences: 每块最多包含的句子数
+            chunk_overlap: 相邻块重叠的句子数
+            chunk_max_chars: 每块最大字符数
+            backend: 知识库后端，为空时按KS_BACKEND创建（mmap为只读后端，构建时使用本地数据库）
+            hnsw: 新版本集合的HNSW参数（见hnsw_metadata），为空时使用环境变量配置
+        """
+        self.backend = backend or KsBackend("server" if BACKEND_MODE == "server" else "local", chroma_path)
+        self.chroma_path = self.backend.chroma_path
+        self.chunk_sentences = chunk_sentences
+        self.chunk_overlap = chunk_overlap
+        self.chunk_max_chars = chunk_max_chars
+        self.hnsw = hnsw or hnsw_metadata()
+
+    @property
+    def client(self):
+        return self.backend.client
+
+    @property
+    def alias(self) -> KsCollectionAlias:
+        return KsCollectionAlias(self.client)
+
+    def build_version(self, file_paths: List[str]):
+        """
+        构建新的版本集合：写入全部文件并构建词法索引。构建期间线上使用的版本不受影响
+        Args:
+            file_paths: 知识文件路径列表
+        Returns:
+            新版本集合
+        """
+        name = version_name(self.alias.next_version())
+        collection = self.client.create_collection(
+            name=name, metadata={"built_at": time.strftime("%Y-%m-%d %H:%M:%S"), **self.hnsw})
+        log.info(f"开始构建知识库版本：{name}，HNSW参数：{self.hnsw}")
+        for file_path in file_paths:
+            log.info(f"处理文件: {file_path}")
+            self.save_txt_to_db(file_path, collection)
+        self.build_lexical_index(collection)
+        if BACKEND_MODE == "mmap":
+            self.backend.export_mmap(collection)
+        return collection
+
+    def validate(self, collection, file_paths: List[str], sample_size: int = 5) -> List[str]:
+        """
+        校验版本集合
+        Returns:
+            问题列表，为空表示校验通过
+        """
+        problems = []
+        count = collection.count()
+        if count == 0:
+            return [f"{collection.name}中没有文档"]
+
+        for file_path in file_paths:
+            found = collection.get(where={"source_file": os.path.basename(file_path)}, limit=1)
+            if not found["ids"]:
+                problems.append(f"{os.path.basename(file_path)}没有写入任何文档")
+
+        index = KsLexicalIndex.load(KsLexicalIndex.index_path(self.chroma_path, collection.name))
+        if index is None or len(index) != count:
+            problems.append(f"词法索引与集合文档数不一致：{len(index) if index else 0} != {count}")
+
+        # 抽样检索：用样本文档的分类作为查询，应能检索到结果
+        sample = collection.get(limit=sample_size, include=["metadatas"])
+        queries = [m.get("分类") for m in sample["metadatas"] if isinstance(m, dict) and m.get("分类")]
+        if queries:
+            results = collection.query(query_texts=queries, n_results=1)
+            empty = [q for q, ids in zip(queries, results["ids"]) if not ids]
+            if empty:
+                problems.append(f"抽样检索无结果：{empty}")
+        return problems
+
+    def chunk_item(self, doc_id: str, text: str, metadata: Dict[str, Any]) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """
+        将一条知识切成句子窗口块，每块的元数据记录原文档id和块序号
+        Returns:
+            [(块id, 块文本, 块元数据)]
+        """
+        chunks = chunk_text(text, self.chunk_sentences, self.chunk_overlap, self.chunk_max_chars)
+        return [(f"{doc_id}#{i}", chunk,
+                 {**metadata, "parent_id": doc_id, "chunk_index": i, "chunk_count": len(chunks)})
+                for i, chunk in enumerate(chunks)]
 
-    def save_txt_to_db(self, file_path: str):
+    def prune(self, keep: int = 2) -> List[str]:
+        """
+        删除旧版本集合及其词法索引文件，保留最新的keep个版本以及当前和上一个生效的版本
+        """
+        removed = self.alias.prune(keep)
+        for name in removed:
+            path = KsLexicalIndex.index_path(self.chroma_path, name)
+            if os.path.exists(path):
+                os.remove(path)
+            self.backend.remove_mmap(name)
+        return removed
+
+    def save_txt_to_db(self, file_path: str, collection=None):
         """
-        将.txt文件存入数据库
+        将.txt文件存入数据库，每条知识按句子切块后入库
         Args:
             file_path: txt文件路径，文件内容应为JSON数组格式
+            collection: 目标集合，一般为build_version创建的新版本。为空时写入当前生效的集合（增量更新，线上可见中间状态）
         """
+        if collection is None:
+            collection = self.client.get_or_create_collection(self.alias.active())
         try:
             # 读取文件内容
             with open(file_path, 'r', encoding='utf-8') as f:
@@ -69,9 +195,10 @@ class KsBuilder:
                     # 生成唯一ID
                     doc_id = f"{os.path.basename(file_path)}_{i}_{str(uuid.uuid4())[:8]}"
 
-                    documents.append(text)
-                    metadatas.append(processed_metadata)
-                    ids.append(doc_id)
+                    for chunk_id, chunk, chunk_metadata in self.chunk_item(doc_id, text, processed_metadata):
+                        documents.append(chunk)
+                        metadatas.append(chunk_metadata)
+                        ids.append(chunk_id)
 
             # 批量插入数据
             if documents:
@@ -91,7 +218,7 @@ class KsBuilder:
                     ids=ids
                 )
 
-                log.info(f"成功从 {file_path} 添加 {len(documents)} 个文档到数据库")
+                log.info(f"成功从 {file_path} 添加 {len(data)} 条知识（{len(documents)} 个文本块）到数据库")
             else:
                 log.warning(f"文件 {file_path} 中没有有效的数据条目")
 
@@ -100,6 +227,17 @@ class KsBuilder:
         except Exception as e:
             log.error(f"处理文件 {file_path} 时发生错误: {e}")
 
+    def build_lexical_index(self, collection=None):
+        """
+        根据集合中的全部文档重建词法索引（BM25），保存在集合旁。写入文档后调用
+        Args:
+            collection: 集合，为空时为当前生效的集合
+        """
+        if collection is None:
+            collection = self.client.get_collection(self.alias.active())
+        index = KsLexicalIndex.build_from_collection(collection)
+        index.save(KsLexicalIndex.index_path(self.chroma_path, collection.name))
+
     def _process_metadata_for_chromadb(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
         """
         处理元数据，将不支持的类型转换为ChromaDB支持的格式
@@ -170,20 +308,68 @@ class KsBuilder:
         return parsed
 
 
-# 使用示例
-if __name__ == "__main__":
-    ks = KsBuilder()
-
-    folder_path = "ks_data"
-
+def _data_files(folder_path: str) -> List[str]:
     filenames = []
-    for filename in os.listdir(folder_path):
+    for filename in sorted(os.listdir(folder_path)):
         file_path = os.path.join(folder_path, filename)
         if os.path.isfile(file_path) and filename.endswith('.txt'):
             filenames.append(file_path)
+    return filenames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="知识库构建与版本管理")
+    parser.add_argument("--chroma-path", default=CHROMA_PATH)
+    sub = parser.add_subparsers(dest="command")
+    build = sub.add_parser("build", help="构建新版本（默认命令）")
+    build.add_argument("--data", default=KS_DATA_DIR, help="知识文件目录")
+    build.add_argument("--no-activate", action="store_true", help="只构建和校验，不切换")
+    build.add_argument("--space", default=HNSW_SPACE, choices=HNSW_SPACES)
+    build.add_argument("--m", type=int, default=HNSW_M)
+    build.add_argument("--construction-ef", type=int, default=HNSW_CONSTRUCTION_EF)
+    build.add_argument("--search-ef", type=int, default=HNSW_SEARCH_EF)
+    sub.add_parser("list", help="列出版本")
+    activate = sub.add_parser("activate", help="切换到指定版本")
+    activate.add_argument("name")
+    sub.add_parser("rollback", help="回滚到上一个版本")
+    prune = sub.add_parser("prune", help="删除旧版本")
+    prune.add_argument("--keep", type=int, default=2)
+    export = sub.add_parser("export-mmap", help="导出内存映射索引（默认为当前版本）")
+    export.add_argument("name", nargs="?")
+    args = parser.parse_args()
+
+    hnsw = None
+    if args.command == "build":
+        hnsw = hnsw_metadata(args.space, args.m, args.construction_ef, args.search_ef)
+    ks = KsBuilder(args.chroma_path, hnsw=hnsw)
+    alias = ks.alias
+    if args.command == "list":
+        print(f"当前版本：{alias.active()}，上一个版本：{alias.previous()}")
+        for version in alias.versions():
+            collection = ks.client.get_collection(version_name(version))
+            hnsw = {k: v for k, v in (collection.metadata or {}).items() if k.startswith("hnsw:")}
+            print(f"  {collection.name}：{collection.count()}个文本块，HNSW参数：{hnsw}")
+    elif args.command == "activate":
+        alias.activate(args.name)
+    elif args.command == "rollback":
+        alias.rollback()
+    elif args.command == "prune":
+        ks.prune(args.keep)
+    elif args.command == "export-mmap":
+        ks.backend.export_mmap(ks.client.get_collection(args.name or alias.active()))
+    else:
+        file_paths = _data_files(getattr(args, "data", KS_DATA_DIR))
+        collection = ks.build_version(file_paths)
+        problems = ks.validate(collection, file_paths)
+        if problems:
+            for problem in problems:
+                log.error(f"知识库版本{collection.name}校验失败：{problem}")
+            raise SystemExit(1)
+        log.info(f"知识库版本{collection.name}校验通过，共{collection.count()}个文本块")
+        if not getattr(args, "no_activate", False):
+            alias.activate(collection.name)
+        log.info("所有文件处理完成")
 
-    for file_path in filenames:
-        log.info(f"处理文件: {file_path}")
-        ks.save_txt_to_db(file_path)
 
-    log.info("所有文件处理完成")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+知识库文本切分：入库时按中文句子边界切成带重叠的小块，每块单独向量化
+    清洗：去除元数据行、过短的行、方括号和大括号内容（原先在检索时对每个命中文档做）
+    切分：按[。！？；\n]分句（保留句末标点），每块最多window句、相邻块重叠overlap句，超过max_chars的句子在逗号等处再切
+    过滤：过短或含排版说明等低质量标记的块不入库
+块的元数据：原文档元数据 + parent_id（原文档id）、chunk_index（块序号）、chunk_count（块数）。
+配置：环境变量KS_CHUNK_SENTENCES（默认2）、KS_CHUNK_OVERLAP（默认1）、KS_CHUNK_MAX_CHARS（默认150）
+"""
+import os
+import re
+from typing import List
+
+CHUNK_SENTENCES = int(os.getenv("KS_CHUNK_SENTENCES", "2"))
+CHUNK_OVERLAP = int(os.getenv("KS_CHUNK_OVERLAP", "1"))
+CHUNK_MAX_CHARS = int(os.getenv("KS_CHUNK_MAX_CHARS", "150"))
+MIN_CHUNK_CHARS = 20
+
+_SENTENCE_RE = re.compile(r"[^。！？；\n]+[。！？；]?")
+_CLAUSE_END_RE = re.compile(r"[，,、：:]")
+
+# 常见的元数据行模式
+_METADATA_PATTERNS = [
+    r'^[0-9]+\.[0-9]+',  # 数字.数字
+    r'^[①②③④⑤]',       # 带圈数字
+    r'^[一二三四五六七八九十]、',  # 中文数字
+    r'^tags?:',           # tags: 标签
+    r'^metadata:',        # metadata:
+    r'^维度:',            # 维度:
+    r'^分类:',            # 分类:
+    r'^标签:',            # 标签:
+    r'^排版样式',         # 排版样式
+    r'^项目包装',         # 项目包装
+    r'^内容表达优化',     # 内容表达优化
+]
+
+# 低质量文本标记
+_LOW_QUALITY_INDICATORS = ['排版样式', '项目包装', '内容表达优化', '参与度低', '一、', '二、', '三、', '四、']
+
+
+def is_metadata_line(line: str) -> bool:
+    """
+    判断一行是否是元数据
+    """
+    line_lower = line.lower()
+    return any(re.match(pattern, line_lower) for pattern in _METADATA_PATTERNS)
+
+
+def core_content(document: str) -> str:
+    """
+    获取文档的核心内容（去除元数据、标签等）
+    """
+    if not document:
+        return ""
+
+    content_lines = []
+    for line in document.split('\n'):
+        line = line.strip()
+        if not line or is_metadata_line(line):
+            continue
+        # 跳过过短或无意义的行
+        if len(line) < 10 and not any(char in line for char in ['、', '，', '。']):
+            continue
+        content_lines.append(line)
+
+    content = re.sub(r'\s+', ' ', " ".join(content_lines))
+    content = re.sub(r'\[.*?\]', '', content)  # 移除括号内容
+    content = re.sub(r'\{.*?\}', '', content)  # 移除大括号内容
+    return content.strip()
+
+
+def is_low_quality(text: str) -> bool:
+    """
+    判断文本是否是低质量的
+    """
+    if len(text) < MIN_CHUNK_CHARS:
+        return True
+    return any(indicator in text for indicator in _LOW_QUALITY_INDICATORS)
+
+
+def clean_fragment(text: str, max_length: int = CHUNK_MAX_CHARS) -> str:
+    """
+    清理文本片段：合并空白，超长时尽量在句号处截断
+    """
+    if not text:
+        return ""
+
+    text = re.sub(r'\s+', ' ', text).strip()
+    if len(text) > max_length:
+        end_pos = text.rfind('。', 0, max_length)
+        if end_pos > max_length // 2:
+            text = text[:end_pos + 1]
+        else:
+            text = text[:max_length - 3] + "..."
+    return text
+
+
+def split_sentences(text: str, max_chars: int = CHUNK_MAX_CHARS) -> List[str]:
+    """
+    按中文句子边界分句，保留句末标点；超过max_chars的句子在逗号、顿号、冒号处再切，仍超长时按长度硬切
+    """
+    sentences = []
+    for sentence in _SENTENCE_RE.findall(text or ""):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        while len(sentence) > max_chars:
+            cut = max((m.end() for m in _CLAUSE_END_RE.finditer(sentence, 0, max_chars)), default=0)
+            if cut < max_chars // 2:
+                cut = max_chars
+            sentences.append(sentence[:cut])
+            sentence = sentence[cut:].strip()
+        if sentence:
+            sentences.append(sentence)
+    return sentences
+
+
+def chunk_text(text: str, window: int = CHUNK_SENTENCES, overlap: int = CHUNK_OVERLAP,
+               max_chars: int = CHUNK_MAX_CHARS) -> List[str]:
+    """
+    将文档切成句子窗口
+    :param window: 每块最多包含的句子数
+    :param overlap: 相邻块重叠的句子数（小于window）
+    :param max_chars: 每块最大字符数，达到时提前结束当前块
+    :return: 清洗、过滤后的块文本列表
+    """
+    window = max(1, window)
+    overlap = max(0, min(overlap, window - 1))
+    sentences = split_sentences(core_content(text), max_chars)
+
+    chunks = []
+    start = 0
+    while start < len(sentences):
+        end = start + 1
+        length = len(sentences[start])
+        while end < len(sentences) and end - start < window and length + len(sentences[end]) <= max_chars:
+            length += len(sentences[end])
+            end += 1
+        chunk = "".join(sentences[start:end])
+        if not is_low_quality(chunk):
+            chunks.append(chunk)
+        if end >= len(sentences):
+            break
+        # 下一块从当前块末尾回退overlap句开始，且至少前进一句
+        start = max(start + 1, end - overlap)
+    return chunks
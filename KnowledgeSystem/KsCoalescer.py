@@ -0,0 +1,102 @@
+"""
+知识库查询合并器：同一工作进程内并发任务的关键词检索合并为一次ChromaDB查询
+    调用方提交一组关键词后阻塞等待；后台线程收集KS_COALESCE_MS毫秒（默认2）内的全部请求，
+    或关键词数达到KS_COALESCE_MAX_KEYWORDS（默认64）时立即发出，去重后调用一次批量查询函数，再按关键词把结果分发给各调用方
+    单次请求的额外等待不超过合并窗口，每批关键词数有上限，批量查询耗时不会随并发无限增长
+KS_COALESCE_MS=0时不合并，调用方直接查询。
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+from logger import get_logger
+from metrics import KS_QUERY_BATCH
+
+log = get_logger(__name__)
+
+COALESCE_MS = float(os.getenv("KS_COALESCE_MS", "2"))
+COALESCE_MAX_KEYWORDS = int(os.getenv("KS_COALESCE_MAX_KEYWORDS", "64"))
+# 等待合并查询结果的最长时间（秒）
+COALESCE_TIMEOUT = 60
+
+
+class KsCoalescer(object):
+    """
+    跨任务的批量查询合并器，线程安全
+    """
+    def __init__(self, query_fn: Callable[[List[str], int], List[list]], window_ms: float = COALESCE_MS,
+                 max_keywords: int = COALESCE_MAX_KEYWORDS):
+        """
+        :param query_fn: 批量查询函数，query_fn(关键词列表, 每个关键词的结果数) -> 与关键词一一对应的结果列表
+        :param window_ms: 合并窗口（毫秒），为0时不合并
+        :param max_keywords: 每批最多的关键词数
+        """
+        self.query_fn = query_fn
+        self.window_ms = window_ms
+        self.max_keywords = max_keywords
+
+        # 待合并的请求：(关键词列表, 结果数, Future)
+        self._pending: List[tuple] = []
+        self._pending_keywords = 0
+        self._cond = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+
+    def query(self, keywords: List[str], n_results: int) -> List[list]:
+        """
+        查询一组关键词，与其他线程同时提交的请求合并执行
+        :return: 与keywords一一对应的结果列表
+        """
+        if not keywords:
+            return []
+        if self.window_ms <= 0:
+            return self.query_fn(keywords, n_results)
+
+        future = Future()
+        with self._cond:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._batch_loop, name="ks-coalescer", daemon=True)
+                self._worker.start()
+            self._pending.append((keywords, n_results, future))
+            self._pending_keywords += len(keywords)
+            self._cond.notify()
+        return future.result(timeout=COALESCE_TIMEOUT)
+
+    def _batch_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # 第一个请求到达后等待合并窗口，期间到达的请求并入本批
+                deadline = time.monotonic() + self.window_ms / 1000
+                while self._pending_keywords < self.max_keywords:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, keywords = [], 0
+                while self._pending and (not batch or keywords + len(self._pending[0][0]) <= self.max_keywords):
+                    request = self._pending.pop(0)
+                    batch.append(request)
+                    keywords += len(request[0])
+                self._pending_keywords -= keywords
+            self._execute(batch)
+
+    def _execute(self, batch: List[tuple]):
+        """
+        去重后执行一次批量查询。结果数取本批最大值，再按各请求的结果数截断
+        """
+        unique = list(dict.fromkeys(keyword for keywords, _, _ in batch for keyword in keywords))
+        n_results = max(n for _, n, _ in batch)
+        KS_QUERY_BATCH.observe(len(batch), unit="requests")
+        KS_QUERY_BATCH.observe(len(unique), unit="keywords")
+        try:
+            results = dict(zip(unique, self.query_fn(unique, n_results)))
+        except Exception as e:
+            log.error(f"合并查询失败，请求数{len(batch)}，关键词数{len(unique)}：{e}")
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        for keywords, n, future in batch:
+            future.set_result([results[keyword][:n] for keyword in keywords])
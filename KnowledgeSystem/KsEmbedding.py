@@ -0,0 +1,231 @@
+"""
+向量服务：关键词向量缓存 + 并发请求合批
+    内存：LRU，最多KS_EMBEDDING_CACHE_SIZE个（默认10000）
+    磁盘：sqlite（KS_EMBEDDING_CACHE_PATH，默认知识库目录下的embedding_cache.sqlite3），按向量模型名区分，进程重启后仍可命中
+    合批：缓存未命中的文本进入待计算队列，后台线程每KS_EMBEDDING_BATCH_MS毫秒（默认5）或攒满KS_EMBEDDING_MAX_BATCH个（默认64）
+         计算一次；并发任务请求同一文本时共享同一次计算
+知识库检索的关键词（"国有企业"、"实习"、"竞赛"等）在大量任务间重复，命中缓存后检索时直接把向量作为query_embeddings传给ChromaDB。
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from KnowledgeSystem.KsBackend import CHROMA_PATH
+from logger import get_logger
+from metrics import CACHE_REQUESTS
+
+log = get_logger(__name__)
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("KS_EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_PATH = os.getenv("KS_EMBEDDING_CACHE_PATH", os.path.join(CHROMA_PATH, "embedding_cache.sqlite3"))
+EMBEDDING_BATCH_MS = float(os.getenv("KS_EMBEDDING_BATCH_MS", "5"))
+EMBEDDING_MAX_BATCH = int(os.getenv("KS_EMBEDDING_MAX_BATCH", "64"))
+# 等待合批计算结果的最长时间（秒）
+EMBEDDING_TIMEOUT = 60
+
+
+class EmbeddingService(object):
+    """
+    带缓存和合批的向量服务，线程安全
+    """
+    def __init__(self, embedding_function=None, cache_path: Optional[str] = EMBEDDING_CACHE_PATH,
+                 cache_size: int = EMBEDDING_CACHE_SIZE, batch_ms: float = EMBEDDING_BATCH_MS,
+                 max_batch: int = EMBEDDING_MAX_BATCH, model_name: str = None):
+        """
+        :param embedding_function: 向量函数，输入文本列表返回向量列表。为空时使用ChromaDB默认向量函数（与知识库一致）
+        :param cache_path: sqlite缓存文件路径，为空时只使用内存缓存
+        :param cache_size: 内存LRU容量
+        :param batch_ms: 合批等待时间（毫秒）
+        :param max_batch: 每批最多计算的文本数
+        :param model_name: 磁盘缓存中区分向量模型的名称，为空时取向量函数的name()
+        """
+        self._embedding_function = embedding_function
+        self.cache_path = cache_path
+        self.cache_size = cache_size
+        self.batch_ms = batch_ms
+        self.max_batch = max_batch
+        self._model_name = model_name
+
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+
+        # 待计算的文本 -> [Future, 是否写入磁盘缓存]，同一文本只计算一次
+        self._pending: "OrderedDict[str, list]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+
+    @property
+    def embedding_function(self):
+        if self._embedding_function is None:
+            with self._cond:
+                if self._embedding_function is None:
+                    from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+                    self._embedding_function = DefaultEmbeddingFunction()
+        return self._embedding_function
+
+    @property
+    def model_name(self) -> str:
+        if self._model_name is None:
+            name = getattr(self.embedding_function, "name", None)
+            self._model_name = str(name() if callable(name) else name or type(self.embedding_function).__name__)
+        return self._model_name
+
+    def embed(self, texts: List[str], persist: bool = True) -> List[np.ndarray]:
+        """
+        获取文本向量：内存缓存 -> 磁盘缓存 -> 合批计算
+        :param texts: 文本列表
+        :param persist: 新计算的向量是否写入磁盘缓存（一次性文本如聊天问题可设为False）
+        :return: 与texts一一对应的float32向量
+        """
+        vectors: Dict[str, np.ndarray] = {}
+        unique = list(dict.fromkeys(texts))
+
+        with self._memory_lock:
+            for text in unique:
+                vector = self._memory.get(text)
+                if vector is not None:
+                    self._memory.move_to_end(text)
+                    vectors[text] = vector
+
+        missing = [text for text in unique if text not in vectors]
+        if missing and self.cache_path:
+            for text, vector in self._load(missing).items():
+                vectors[text] = vector
+                self._remember(text, vector)
+
+        missing = [text for text in unique if text not in vectors]
+        hits = len(unique) - len(missing)
+        if hits:
+            CACHE_REQUESTS.inc(hits, cache="embedding", result="hit")
+        if missing:
+            CACHE_REQUESTS.inc(len(missing), cache="embedding", result="miss")
+            futures = self._submit(missing, persist)
+            for text, future in zip(missing, futures):
+                vectors[text] = future.result(timeout=EMBEDDING_TIMEOUT)
+
+        return [vectors[text] for text in texts]
+
+    def _remember(self, text: str, vector: np.ndarray):
+        with self._memory_lock:
+            self._memory[text] = vector
+            self._memory.move_to_end(text)
+            while len(self._memory) > self.cache_size:
+                self._memory.popitem(last=False)
+
+    def _submit(self, texts: List[str], persist: bool) -> List[Future]:
+        """
+        将文本加入待计算队列，已在队列中的文本复用同一个Future
+        """
+        futures = []
+        with self._cond:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._batch_loop, name="embedding-batcher", daemon=True)
+                self._worker.start()
+            for text in texts:
+                entry = self._pending.get(text)
+                if entry is None:
+                    entry = self._pending[text] = [Future(), persist]
+                else:
+                    entry[1] = entry[1] or persist
+                futures.append(entry[0])
+            self._cond.notify()
+        return futures
+
+    def _batch_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # 等待合批窗口，期间其他任务的请求会并入本批
+                deadline = time.monotonic() + self.batch_ms / 1000
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = []
+                while self._pending and len(batch) < self.max_batch:
+                    batch.append(self._pending.popitem(last=False))
+            self._compute(batch)
+
+    def _compute(self, batch: List[tuple]):
+        texts = [text for text, _ in batch]
+        try:
+            vectors = [np.asarray(v, dtype=np.float32) for v in self.embedding_function(texts)]
+        except Exception as e:
+            log.error(f"向量计算失败，文本数{len(texts)}：{e}")
+            for _, (future, _) in batch:
+                future.set_exception(e)
+            return
+
+        persisted = {}
+        for (text, (future, persist)), vector in zip(batch, vectors):
+            self._remember(text, vector)
+            if persist:
+                persisted[text] = vector
+            future.set_result(vector)
+        if persisted and self.cache_path:
+            self._save(persisted)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(self.cache_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.cache_path, check_same_thread=False, timeout=10)
+            # WAL模式下多个工作进程可以同时读写
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS embeddings "
+                       "(model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (model, text))")
+            self._db = db
+        return self._db
+
+    def _load(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        try:
+            with self._db_lock:
+                db = self._connect()
+                rows = []
+                # sqlite单条语句的参数个数有上限，分批查询
+                for start in range(0, len(texts), 500):
+                    part = texts[start:start + 500]
+                    rows.extend(db.execute(
+                        f"SELECT text, vector FROM embeddings WHERE model = ? AND text IN ({','.join('?' * len(part))})",
+                        [self.model_name, *part]).fetchall())
+            return {text: np.frombuffer(blob, dtype=np.float32) for text, blob in rows}
+        except Exception as e:
+            log.error(f"向量磁盘缓存读取失败：{e}")
+            return {}
+
+    def _save(self, vectors: Dict[str, np.ndarray]):
+        try:
+            with self._db_lock:
+                db = self._connect()
+                with db:
+                    db.executemany("INSERT OR REPLACE INTO embeddings (model, text, vector) VALUES (?, ?, ?)",
+                                   [(self.model_name, text, vector.tobytes()) for text, vector in vectors.items()])
+        except Exception as e:
+            log.error(f"向量磁盘缓存写入失败：{e}")
+
+
+_default_service: Optional[EmbeddingService] = None
+_default_lock = threading.Lock()
+
+
+def get_embedding_service() -> EmbeddingService:
+    """
+    进程内共享的默认向量服务（ChromaDB默认向量函数），知识库检索和语义缓存共用
+    """
+    global _default_service
+    if _default_service is None:
+        with _default_lock:
+            if _default_service is None:
+                _default_service = EmbeddingService()
+    return _default_service
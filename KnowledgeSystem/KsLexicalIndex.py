@@ -0,0 +1,172 @@
+"""
+知识库词法索引：基于字符二元组的BM25，与ChromaDB集合一一对应
+    索引文件：{chroma_db目录}/{集合名}.lexical.pkl，由KsBuilder在写入集合后重建
+    分词：中文按字符二元组（单字词保留单字），英文和数字按整词（小写）
+    索引内容：文档文本 + 元数据中的分类、标签、维度（元数据权重更高）
+短中文关键词（如"挑战杯"、"大创"）向量检索容易漏召回，按二元组匹配可以稳定命中。
+"""
+import math
+import os
+import pickle
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from logger import get_logger
+
+log = get_logger(__name__)
+
+# 参与索引的元数据字段及其重复次数（相当于字段权重）
+METADATA_FIELDS = {"分类": 3, "标签": 2, "维度": 1}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[一-鿿]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词：中文连续片段切成字符二元组（长度为1时保留单字），英文数字按整词
+    """
+    tokens = []
+    for piece in _TOKEN_RE.findall((text or "").lower()):
+        if piece[0].isascii():
+            tokens.append(piece)
+        elif len(piece) == 1:
+            tokens.append(piece)
+        else:
+            tokens.extend(piece[i:i + 2] for i in range(len(piece) - 1))
+    return tokens
+
+
+def index_text(document: str, metadata: Optional[dict]) -> str:
+    """
+    文档参与索引的完整文本（文本 + 加权的元数据字段）
+    """
+    parts = [document or ""]
+    if isinstance(metadata, dict):
+        for field, weight in METADATA_FIELDS.items():
+            value = metadata.get(field)
+            if isinstance(value, str) and value:
+                parts.extend([value] * weight)
+    return " ".join(parts)
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    倒数排名融合：score(d) = Σ 1 / (k + rank_i(d))，rank从1开始
+    :param rankings: 多路检索结果，每路为按相关性排序的文档id列表
+    :return: [(文档id, 融合分数)]，按分数降序
+    """
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class KsLexicalIndex(object):
+    """
+    BM25词法索引。保存文档原文和元数据，词法命中的文档无需再访问ChromaDB
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[dict] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.doc_lengths: List[int] = []
+        self.avg_length = 0.0
+        self._id_index: Dict[str, int] = {}
+
+    @classmethod
+    def build(cls, ids: List[str], documents: List[str], metadatas: List[dict], **kwargs) -> "KsLexicalIndex":
+        index = cls(**kwargs)
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for i, (document, metadata) in enumerate(zip(documents, metadatas)):
+            counts = Counter(tokenize(index_text(document, metadata)))
+            index.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings[term].append((i, tf))
+        index.ids = list(ids)
+        index.documents = list(documents)
+        index.metadatas = [m if isinstance(m, dict) else {} for m in metadatas]
+        index.postings = dict(postings)
+        index.avg_length = sum(index.doc_lengths) / len(index.doc_lengths) if index.doc_lengths else 0.0
+        index._id_index = {doc_id: i for i, doc_id in enumerate(index.ids)}
+        return index
+
+    @classmethod
+    def build_from_collection(cls, collection, batch_size: int = 5000, **kwargs) -> "KsLexicalIndex":
+        """
+        从ChromaDB集合分批读取全部文档构建索引
+        """
+        ids, documents, metadatas = [], [], []
+        offset = 0
+        while True:
+            batch = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            ids.extend(batch["ids"])
+            documents.extend(batch["documents"])
+            metadatas.extend(batch["metadatas"])
+            offset += len(batch["ids"])
+        return cls.build(ids, documents, metadatas, **kwargs)
+
+    @staticmethod
+    def index_path(chroma_path: str, collection_name: str) -> str:
+        return os.path.join(chroma_path, f"{collection_name}.lexical.pkl")
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"k1": self.k1, "b": self.b, "ids": self.ids, "documents": self.documents,
+                         "metadatas": self.metadatas, "postings": self.postings,
+                         "doc_lengths": self.doc_lengths}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        log.info(f"词法索引已保存：{path}，文档数{len(self.ids)}，词项数{len(self.postings)}")
+
+    @classmethod
+    def load(cls, path: str) -> Optional["KsLexicalIndex"]:
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        index = cls(k1=data["k1"], b=data["b"])
+        index.ids, index.documents, index.metadatas = data["ids"], data["documents"], data["metadatas"]
+        index.postings, index.doc_lengths = data["postings"], data["doc_lengths"]
+        index.avg_length = sum(index.doc_lengths) / len(index.doc_lengths) if index.doc_lengths else 0.0
+        index._id_index = {doc_id: i for i, doc_id in enumerate(index.ids)}
+        return index
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: str, n_results: int = 10) -> List[Tuple[str, float]]:
+        """
+        BM25检索
+        :return: [(文档id, 分数)]，按分数降序
+        """
+        n_docs = len(self.ids)
+        if not n_docs:
+            return []
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for i, tf in posting:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[i] / (self.avg_length or 1))
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:n_results]
+        return [(self.ids[i], score) for i, score in top]
+
+    def get(self, doc_id: str) -> Optional[Tuple[str, dict]]:
+        """
+        :return: (文档原文, 元数据)，不存在时返回None
+        """
+        i = self._id_index.get(doc_id)
+        if i is None:
+            return None
+        return self.documents[i], self.metadatas[i]
@@ -2,18 +2,68 @@
 使用知识库
 """
 
-import chromadb
+import os
+import threading
+import time
 from typing import List, Dict, Any, Tuple, Optional
 import re
 from logger import get_logger
+from metrics import CHROMA_QUERY
+from KnowledgeSystem.KsLexicalIndex import KsLexicalIndex, reciprocal_rank_fusion
+from KnowledgeSystem.KsChunker import core_content, clean_fragment, is_low_quality
+from KnowledgeSystem.KsEmbedding import EmbeddingService, get_embedding_service
+from KnowledgeSystem.KsCoalescer import KsCoalescer, COALESCE_MS
+from KnowledgeSystem.KsVersions import KsCollectionAlias
+from KnowledgeSystem.KsBackend import KsBackend, get_backend
 
 log = get_logger()
 
+# 检查知识库版本别名是否切换的间隔（秒）
+ALIAS_REFRESH_S = float(os.getenv("KS_ALIAS_REFRESH_S", "30"))
+# 向量检索结果参与融合的最低余弦相似度。0.75与原先按l2距离计算的阈值0.5（平方距离不超过0.5）等价
+VECTOR_MIN_SIMILARITY = float(os.getenv("KS_VECTOR_MIN_SIMILARITY", "0.75"))
+
+
+def vector_similarity(distance: float, space: str = "l2") -> float:
+    """
+    将ChromaDB返回的距离换算为余弦相似度，按集合的hnsw:space：
+        l2      平方欧氏距离，单位向量下 d = 2 - 2cos，相似度为 1 - d/2
+        cosine  d = 1 - cos，相似度为 1 - d
+        ip      d = 1 - 内积，单位向量下内积即余弦相似度，相似度为 1 - d
+    默认向量函数输出单位向量；未归一化的向量在l2、ip下只是近似值
+    """
+    if space == "l2":
+        return 1.0 - distance / 2.0
+    return 1.0 - distance
+
 
 class KsUser:
-    def __init__(self):
-        self.client = chromadb.PersistentClient(path="./chroma_db")
-        self.collection = self.client.get_collection(name="res_opt_documents")
+    def __init__(self, collection=None, lexical_index: KsLexicalIndex = None, chroma_path: str = None,
+                 vector_min_similarity: float = VECTOR_MIN_SIMILARITY, embedding_service: EmbeddingService = None,
+                 coalesce_ms: float = COALESCE_MS, backend: KsBackend = None):
+        """
+        :param collection: 知识库集合，为空时通过后端打开别名指向的当前版本，并定期检查版本切换
+                           （基准测试可传入固定数据集合，此时不检查版本切换）
+        :param lexical_index: 词法索引，为空时加载知识库目录中与集合对应的索引文件，不存在或已过期时从集合构建
+        :param embedding_service: 关键词向量服务，为空时使用进程内共享的默认服务（须与集合的向量函数一致）
+        :param coalesce_ms: 并发任务向量检索的合并窗口（毫秒），为0时每次检索单独查询
+        :param chroma_path: 知识库目录（词法索引所在目录），为空时为后端的目录
+        :param vector_min_similarity: 向量检索结果参与融合的最低余弦相似度（按集合的hnsw:space换算，见vector_similarity）
+        :param backend: 知识库后端（local/server/mmap），为空时使用按环境变量配置的进程内共享后端
+        """
+        self.backend = backend or get_backend()
+        self.alias = None
+        if collection is None:
+            self.alias = KsCollectionAlias(self.backend.client)
+            collection = self.backend.open_collection(self.alias.active())
+        self.collection = collection
+        self.chroma_path = chroma_path or self.backend.chroma_path
+        self._refresh_lock = threading.Lock()
+        self._refreshed_at = time.monotonic()
+        self.vector_min_similarity = vector_min_similarity
+        self.embedding_service = embedding_service or get_embedding_service()
+        self.coalescer = KsCoalescer(self._query_vectors, window_ms=coalesce_ms)
+        self.lexical_index = lexical_index or self._load_lexical_index(self.collection)
 
         # 扩展的关键词到分类映射表
         self.keyword_to_category = {
@@ -130,201 +180,185 @@ class KsUser:
             "一等奖": "专业技能/学科类竞赛",    # 新增
         }
 
+    def _load_lexical_index(self, collection) -> KsLexicalIndex:
+        """
+        加载集合对应的词法索引，文档数与集合不一致时重新构建
+        """
+        path = KsLexicalIndex.index_path(self.chroma_path, collection.name)
+        index = KsLexicalIndex.load(path)
+        count = collection.count()
+        if index is None or len(index) != count:
+            log.warning(f"词法索引不存在或与集合不一致，从集合构建（{count}个文档）")
+            index = KsLexicalIndex.build_from_collection(collection)
+        return index
+
+    def refresh(self) -> bool:
+        """
+        读取版本别名，指向的版本变化时加载新版本的集合和词法索引
+        :return: 是否切换了版本
+        """
+        if self.alias is None:
+            return False
+        name = self.alias.active()
+        if name == self.collection.name:
+            return False
+        collection = self.backend.open_collection(name)
+        lexical_index = self._load_lexical_index(collection)
+        # 新版本全部加载完成后再替换；替换瞬间正在进行的检索可能混用新旧版本，只影响该次融合结果
+        old_name = self.collection.name
+        self.collection, self.lexical_index = collection, lexical_index
+        log.info(f"知识库版本已切换：{old_name} -> {name}，{len(lexical_index)}个文本块")
+        return True
+
+    def _maybe_refresh(self):
+        """
+        每ALIAS_REFRESH_S秒检查一次版本切换，由一个检索线程执行，其他线程继续使用当前版本
+        """
+        if self.alias is None or time.monotonic() - self._refreshed_at < ALIAS_REFRESH_S:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self._refreshed_at = time.monotonic()
+            self.refresh()
+        except Exception as e:
+            log.error(f"知识库版本检查失败，继续使用{self.collection.name}: {e}")
+        finally:
+            self._refresh_lock.release()
+
     def search_similar_text(self, query_texts: List[str], n_results: int = 2) -> List[str]:
         """
-        对批量名词/关键词进行相似性搜索，返回相关描述
+        对批量名词/关键词进行混合检索（BM25词法检索 + 向量检索，倒数排名融合），返回相关描述。
+        全部关键词的向量检索合并为一次ChromaDB查询，词法检索在本地索引中完成。
+        知识库按句子切块入库（见KsChunker），命中的块直接作为描述返回
         """
         try:
-            if not query_texts:
+            keywords = [k.strip() for k in (query_texts or []) if k and k.strip()]
+            if not keywords:
                 return []
+            self._maybe_refresh()
 
-            all_results = []
-
-            for keyword in query_texts:
-                keyword = keyword.strip()
-                if not keyword:
-                    continue
-
-                keyword_results = self._search_single_keyword(keyword, n_results)
-                all_results.extend(keyword_results)
+            try:
+                vector_hits = self._vector_search(keywords, n_results * 5)
+            except Exception as e:
+                log.error(f"向量检索失败，仅使用词法检索: {e}")
+                vector_hits = [[] for _ in keywords]
 
+            all_results = []
+            for keyword, hits in zip(keywords, vector_hits):
+                all_results.extend(self._hybrid_search_keyword(keyword, hits, n_results))
             return all_results
 
         except Exception as e:
             log.error(f"搜索出错: {e}")
             return []
 
-    def _search_single_keyword(self, keyword: str, n_results: int) -> List[str]:
+    def _vector_search(self, keywords: List[str], n_candidates: int) -> List[List[Tuple[str, str, Dict]]]:
         """
-        搜索单个关键词
+        批量向量检索，与同一进程内其他任务同时发起的检索合并为一次ChromaDB查询
+        :return: 每个关键词的[(文档id, 文档, 元数据)]，按相似度降序
         """
-        # 1. 首先检查是否是映射的关键词
-        if keyword in self.keyword_to_category:
-            category = self.keyword_to_category[keyword]
-            results = self._search_by_exact_category(category, n_results)
-            if results:
-                return self._format_keyword_results(keyword, results, "分类映射")
-
-        # 2. 尝试模糊匹配分类
-        category_results = self._search_by_fuzzy_category(keyword, n_results)
-        if category_results:
-            return self._format_keyword_results(keyword, category_results, "分类匹配")
-
-        # 3. 最后尝试相似性搜索（提高阈值）
-        similarity_results = self._search_by_high_quality_similarity(keyword, n_results)
-        if similarity_results:
-            return self._format_keyword_results(keyword, similarity_results, "相似性搜索")
-
-        # 4. 没有找到结果
-        return [f"关键词 '{keyword}'：未找到相关描述"]
+        return self.coalescer.query(keywords, n_candidates)
 
-    def _search_by_exact_category(self, category: str, n_results: int) -> List[Tuple[str, Dict]]:
+    def _query_vectors(self, keywords: List[str], n_candidates: int) -> List[List[Tuple[str, str, Dict]]]:
         """
-        根据精确分类搜索
+        执行一次批量向量查询，过滤相似度低于vector_min_similarity的结果。关键词向量由向量服务提供（缓存 + 合批）
+        :return: 每个关键词的[(文档id, 文档, 元数据)]，按相似度降序
         """
-        try:
-            docs = self.collection.get(
-                where={"分类": category},
-                limit=n_results
+        embeddings = self.embedding_service.embed(keywords)
+        collection = self.collection
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+        with CHROMA_QUERY.time(op="query"):
+            results = collection.query(
+                query_embeddings=embeddings,
+                n_results=n_candidates,
+                include=["documents", "metadatas", "distances"]
             )
 
-            return self._extract_clean_results(docs)
-        except Exception as e:
-            log.debug(f"精确分类搜索失败: {e}")
-            return []
-
-    def _search_by_fuzzy_category(self, keyword: str, n_results: int) -> List[Tuple[str, Dict]]:
+        hits = []
+        for i in range(len(keywords)):
+            keyword_hits = []
+            ids = results["ids"][i] if results.get("ids") else []
+            docs = results["documents"][i] if results.get("documents") else []
+            metadatas = results["metadatas"][i] if results.get("metadatas") else []
+            distances = results["distances"][i] if results.get("distances") else []
+            for doc_id, doc, metadata, distance in zip(ids, docs, metadatas, distances):
+                if vector_similarity(distance, space) >= self.vector_min_similarity:
+                    keyword_hits.append((doc_id, doc, metadata))
+            hits.append(keyword_hits)
+        return hits
+
+    def _hybrid_search_keyword(self, keyword: str, vector_hits: List[Tuple[str, str, Dict]],
+                               n_results: int) -> List[str]:
         """
-        模糊匹配分类
+        单个关键词的混合检索结果（格式化后）
         """
-        try:
-            # 获取所有分类
-            all_docs = self.collection.get()
-
-            matched_docs = []
-            seen_texts = set()
-
-            for doc, metadata in zip(all_docs['documents'], all_docs['metadatas']):
-                if not isinstance(metadata, dict):
-                    continue
-
-                # 检查分类、标签、维度等字段
-                category = metadata.get('分类', '')
-                tags = metadata.get('标签', '')
-                dimension = metadata.get('维度', '')
-
-                # 检查关键词是否出现在这些字段中
-                search_fields = [category, tags, dimension]
-                for field in search_fields:
-                    if isinstance(field, str) and keyword in field:
-                        # 提取干净的文本
-                        clean_text = self._extract_clean_content(doc, keyword)
-                        if clean_text and clean_text not in seen_texts:
-                            matched_docs.append((clean_text, metadata))
-                            seen_texts.add(clean_text)
-                            break
-
-                if len(matched_docs) >= n_results:
-                    break
-
-            return matched_docs
-        except Exception as e:
-            log.debug(f"模糊分类搜索失败: {e}")
-            return []
+        results = self._hybrid_rank(keyword, vector_hits, n_results)
+        if results:
+            return self._format_keyword_results(keyword, results, "混合检索")
+        return [f"关键词 '{keyword}'：未找到相关描述"]
 
-    def _search_by_high_quality_similarity(self, keyword: str, n_results: int) -> List[Tuple[str, Dict]]:
+    def _hybrid_rank(self, keyword: str, vector_hits: List[Tuple[str, str, Dict]],
+                     n_results: int) -> List[Tuple[str, Dict]]:
         """
-        高质量相似性搜索（提高阈值）
+        单个关键词的词法检索，并与向量检索结果融合。关键词有分类映射时，分类名一并参与词法检索
+        :return: [(干净的文本, 元数据)]
         """
-        try:
-            # 使用更高的n_results进行搜索，然后严格过滤
-            results = self.collection.query(
-                query_texts=[keyword],
-                n_results=n_results * 5,  # 搜索更多结果以便筛选
-                include=["documents", "metadatas", "distances"]
-            )
-
-            if not results['documents'] or not results['documents'][0]:
-                return []
-
-            high_quality_results = []
-            seen_texts = set()
-
-            docs = results['documents'][0]
-            metadatas = results['metadatas'][0] if results['metadatas'] else []
-            distances = results['distances'][0] if results['distances'] else []
+        lexical_query = keyword
+        if keyword in self.keyword_to_category:
+            lexical_query = f"{keyword} {self.keyword_to_category[keyword]}"
+        lexical_ranking = [doc_id for doc_id, _ in self.lexical_index.search(lexical_query, n_results * 5)]
+        vector_docs = {doc_id: (doc, metadata) for doc_id, doc, metadata in vector_hits}
 
-            for doc, metadata, distance in zip(docs, metadatas, distances):
-                # 计算相似度
-                similarity = 1.0 - distance if distance <= 1.0 else 1.0 / (1.0 + distance)
+        results = []
+        seen_texts, seen_parents = set(), set()
+        for doc_id, _ in reciprocal_rank_fusion([lexical_ranking, [h[0] for h in vector_hits]]):
+            entry = self.lexical_index.get(doc_id) or vector_docs.get(doc_id)
+            if not entry:
+                continue
+            doc, metadata = entry
+            metadata = metadata if isinstance(metadata, dict) else {}
 
-                # 设置高阈值（0.5）
-                if similarity < 0.5:
+            if metadata.get("parent_id"):
+                # 入库时已切块清洗，直接返回块文本；同一原文档只取排名最高的块
+                clean_text = doc
+                if metadata["parent_id"] in seen_parents:
                     continue
-
-                # 提取干净的文本内容
+                seen_parents.add(metadata["parent_id"])
+            else:
+                # 未切块的旧文档：提取干净的文本内容，过滤低质量文本
                 clean_text = self._extract_clean_content(doc, keyword)
-                if not clean_text or len(clean_text) < 20:  # 太短的文本质量不高
-                    continue
-
-                # 检查文本质量（避免提取到元数据）
-                if self._is_low_quality_text(clean_text):
+                if not clean_text or is_low_quality(clean_text):
                     continue
+            text_hash = hash(clean_text[:100])
+            if text_hash in seen_texts:
+                continue
+            seen_texts.add(text_hash)
 
-                # 去重
-                text_hash = hash(clean_text[:100])  # 使用前100个字符的hash作为去重依据
-                if text_hash in seen_texts:
-                    continue
-
-                high_quality_results.append((clean_text, metadata))
-                seen_texts.add(text_hash)
-
-                if len(high_quality_results) >= n_results:
-                    break
-
-            return high_quality_results
-
-        except Exception as e:
-            log.debug(f"高质量相似性搜索失败: {e}")
-            return []
-
-    def _extract_clean_results(self, docs_result) -> List[Tuple[str, Dict]]:
-        """
-        从查询结果中提取干净的内容
-        """
-        results = []
-        if not docs_result or not docs_result['documents']:
-            return results
-
-        for doc, metadata in zip(docs_result['documents'], docs_result['metadatas']):
-            # 提取文档的核心内容（去除元数据和格式化信息）
-            clean_text = self._get_document_core_content(doc)
-            if clean_text:
-                results.append((clean_text, metadata))
-
+            results.append((clean_text, metadata))
+            if len(results) >= n_results:
+                break
         return results
 
     def _extract_clean_content(self, document: str, keyword: str = "") -> str:
         """
-        提取干净的文档内容
+        提取未切块的旧文档的干净内容
         """
         if not document:
             return ""
 
         # 1. 获取核心内容
-        core_content = self._get_document_core_content(document)
-        if not core_content:
+        content = core_content(document)
+        if not content:
             return ""
 
         # 2. 如果有关键词，优先提取包含关键词的部分
         if keyword:
-            sentences = re.split(r'[。！？；\n]', core_content)
             keyword_sentences = []
-
-            for sentence in sentences:
+            for sentence in re.split(r'[。！？；\n]', content):
                 sentence = sentence.strip()
                 if sentence and keyword in sentence:
-                    clean_sentence = self._clean_text_fragment(sentence)
+                    clean_sentence = clean_fragment(sentence)
                     if clean_sentence:
                         keyword_sentences.append(clean_sentence)
 
@@ -333,115 +367,7 @@ class KsUser:
                 return " ".join(keyword_sentences[:2])
 
         # 3. 如果没有关键词或没找到包含关键词的句子，返回开头部分
-        return self._clean_text_fragment(core_content[:200])
-
-    def _get_document_core_content(self, document: str) -> str:
-        """
-        获取文档的核心内容（去除元数据、标签等）
-        """
-        if not document:
-            return ""
-
-        # 清理常见的元数据格式
-        lines = document.split('\n')
-        content_lines = []
-
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-
-            # 跳过明显是元数据的行
-            if self._is_metadata_line(line):
-                continue
-
-            # 跳过过短或无意义的行
-            if len(line) < 10 and not any(char in line for char in ['、', '，', '。']):
-                continue
-
-            content_lines.append(line)
-
-        # 合并内容
-        core_content = " ".join(content_lines)
-
-        # 进一步清理
-        core_content = re.sub(r'\s+', ' ', core_content)
-        core_content = re.sub(r'\[.*?\]', '', core_content)  # 移除括号内容
-        core_content = re.sub(r'\{.*?\}', '', core_content)  # 移除大括号内容
-
-        return core_content.strip()
-
-    def _is_metadata_line(self, line: str) -> bool:
-        """
-        判断一行是否是元数据
-        """
-        # 常见的元数据模式
-        metadata_patterns = [
-            r'^[0-9]+\.[0-9]+',  # 数字.数字
-            r'^[①②③④⑤]',       # 带圈数字
-            r'^[一二三四五六七八九十]、',  # 中文数字
-            r'^tags?:',           # tags: 标签
-            r'^metadata:',        # metadata:
-            r'^维度:',            # 维度:
-            r'^分类:',            # 分类:
-            r'^标签:',            # 标签:
-            r'^排版样式',         # 排版样式
-            r'^项目包装',         # 项目包装
-            r'^内容表达优化',     # 内容表达优化
-        ]
-
-        line_lower = line.lower()
-        for pattern in metadata_patterns:
-            if re.match(pattern, line_lower):
-                return True
-
-        return False
-
-    def _is_low_quality_text(self, text: str) -> bool:
-        """
-        判断文本是否是低质量的
-        """
-        if len(text) < 20:
-            return True
-
-        # 检查是否包含常见的不相关内容
-        low_quality_indicators = [
-            '排版样式',
-            '项目包装',
-            '内容表达优化',
-            '参与度低',
-            '一、',
-            '二、',
-            '三、',
-            '四、',
-        ]
-
-        for indicator in low_quality_indicators:
-            if indicator in text:
-                return True
-
-        return False
-
-    def _clean_text_fragment(self, text: str, max_length: int = 150) -> str:
-        """
-        清理文本片段
-        """
-        if not text:
-            return ""
-
-        # 清理空白字符
-        text = re.sub(r'\s+', ' ', text).strip()
-
-        # 截断到合适长度
-        if len(text) > max_length:
-            # 尝试在句子边界处截断
-            end_pos = text.rfind('。', 0, max_length)
-            if end_pos > max_length // 2:
-                text = text[:end_pos+1]
-            else:
-                text = text[:max_length-3] + "..."
-
-        return text
+        return clean_fragment(content[:200])
 
     def _format_keyword_results(self, keyword: str, results: List[Tuple[str, Dict]], source: str) -> List[str]:
         """
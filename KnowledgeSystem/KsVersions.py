@@ -0,0 +1,121 @@
+"""
+知识库版本管理：蓝绿重建 + 别名切换
+    版本集合：res_opt_documents_v{n}，由KsBuilder离线构建并校验，构建期间线上检索不受影响
+    别名集合：res_opt_documents_alias，只用其元数据保存指针：
+        active：当前生效的版本集合名，previous：上一个生效的版本（用于回滚），activated_at：切换时间
+    KsUser按固定间隔读取别名，发现切换后加载新版本（集合 + 词法索引），工作进程无需重启。
+    旧版本保留，回滚只需交换active和previous；prune删除active、previous之外的旧版本。
+别名不存在时（尚未使用版本管理的知识库）使用未带版本号的res_opt_documents集合。
+"""
+import re
+import time
+from typing import List, Optional
+
+from logger import get_logger
+
+log = get_logger(__name__)
+
+BASE_COLLECTION = "res_opt_documents"
+
+
+def version_name(version: int, base_name: str = BASE_COLLECTION) -> str:
+    return f"{base_name}_v{version}"
+
+
+class KsCollectionAlias(object):
+    """
+    版本集合的别名指针
+    """
+    def __init__(self, client, base_name: str = BASE_COLLECTION):
+        """
+        :param client: ChromaDB客户端
+        :param base_name: 集合基础名称
+        """
+        self.client = client
+        self.base_name = base_name
+        self.alias_name = f"{base_name}_alias"
+        self._version_re = re.compile(rf"^{re.escape(base_name)}_v(\d+)$")
+
+    def _collection_names(self) -> List[str]:
+        # 不同版本的chromadb返回集合对象或集合名
+        return [getattr(c, "name", c) for c in self.client.list_collections()]
+
+    def _pointer(self) -> dict:
+        try:
+            return dict(self.client.get_collection(self.alias_name).metadata or {})
+        except Exception:
+            return {}
+
+    def versions(self) -> List[int]:
+        """
+        已存在的版本号，升序
+        """
+        versions = []
+        for name in self._collection_names():
+            match = self._version_re.match(name)
+            if match:
+                versions.append(int(match.group(1)))
+        return sorted(versions)
+
+    def next_version(self) -> int:
+        versions = self.versions()
+        return versions[-1] + 1 if versions else 1
+
+    def active(self) -> str:
+        """
+        当前生效的集合名。别名不存在时为未带版本号的基础集合
+        """
+        return self._pointer().get("active") or self.base_name
+
+    def previous(self) -> Optional[str]:
+        return self._pointer().get("previous")
+
+    def activate(self, name: str):
+        """
+        将别名指向name，原生效版本记为previous
+        """
+        current = self.active()
+        if name == current:
+            log.info(f"知识库版本{name}已是当前版本")
+            return
+        self.client.get_collection(name)  # 确认集合存在
+        self._set_pointer(active=name, previous=current)
+        log.info(f"知识库版本切换：{current} -> {name}")
+
+    def rollback(self) -> str:
+        """
+        回滚到上一个生效的版本
+        :return: 回滚后生效的集合名
+        """
+        pointer = self._pointer()
+        if not pointer.get("previous"):
+            raise ValueError("没有可回滚的知识库版本")
+        self.client.get_collection(pointer["previous"])
+        self._set_pointer(active=pointer["previous"], previous=pointer["active"])
+        log.info(f"知识库版本回滚：{pointer['active']} -> {pointer['previous']}")
+        return pointer["previous"]
+
+    def prune(self, keep: int = 2) -> List[str]:
+        """
+        删除旧版本，保留最新的keep个版本以及active、previous
+        :return: 已删除的集合名
+        """
+        pointer = self._pointer()
+        protected = {pointer.get("active"), pointer.get("previous")}
+        versions = self.versions()
+        removed = []
+        for version in versions[:max(0, len(versions) - keep)]:
+            name = version_name(version, self.base_name)
+            if name in protected:
+                continue
+            self.client.delete_collection(name)
+            removed.append(name)
+            log.info(f"已删除旧知识库版本：{name}")
+        return removed
+
+    def _set_pointer(self, active: str, previous: Optional[str]):
+        metadata = {"active": active, "activated_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+        if previous:
+            metadata["previous"] = previous
+        alias = self.client.get_or_create_collection(self.alias_name)
+        alias.modify(metadata=metadata)
@@ -1,57 +1,175 @@
 """
 使用api调用Kimi模型
+提示词布局：固定不变的系统提示词和任务要求放在最前面，作为可命中服务端上下文缓存的前缀；
+随任务变化的内容放在最后一条用户消息中。变化内容按共享程度排列：岗位相关信息在前，简历相关信息在后，
+使同一岗位的任务共享更长的缓存前缀。
 """
+import os
 from typing import List
 
 from openai import OpenAI
 from logger import get_logger
+from LLMs.llm_usage import record_usage
 
 log = get_logger()
 
+KIMI_MODEL = "kimi-k2-turbo-preview"
+# 接口地址，可通过环境变量指向兼容OpenAI接口的其他服务（如压测用的本地大模型桩）
+KIMI_BASE_URL = os.getenv("KIMI_BASE_URL", "https://api.moonshot.cn/v1")
+
+_SYSTEM_PROMPT = (
+    "你是 Kimi，由 Moonshot AI 提供的人工智能助手，你更擅长中文和英文的对话。你会为用户提供安全，有帮助，准确的回答。"
+    "同时，你会拒绝一切涉及恐怖主义，种族歧视，黄色暴力等问题的回答。Moonshot AI 为专有名词，不可翻译成其他语言。"
+)
+
+_RESUME_CLEAN_PROMPT = (
+    "请严格按照以下要求为用户简历进行内容清洗，去除用户敏感信息"
+    "清洗要求：将用户的电话号码，邮箱，qq号，住址，微信号等敏感信息去除。用户名称只保留姓氏，名用*代替。年龄保留。"
+    "返回格式：直接给出并只允许给出清洗后的完整简历文本内容（原封不动的返回除去用户所有敏感信息后的剩余内容）。"
+    "禁止在回复时在简历文本前后说其他任何话语（如“我明白了”等），不修改清洗后的简历的任何内容。"
+    "用户简历在用户消息中给出。"
+)
+
+_RESUME_SCORE_PROMPT = (
+    "你是一名专业的经验丰富的简历分析师，擅长从企业的真实需求和偏好出发为高校学生的简历打分并给出优化建议，帮助他们"
+    "更容易的找到一份好工作。请根据用户给出的简历内容、岗位名称及描述、知识库里的相关信息、知识图谱提供的岗位能力画像，公司名称及其他信息"
+    "等内容（如内容为暂无则忽略该项，根据其他内容打分。知识库和知识图谱里的内容如有不相干或明显不正确的的语句则忽略），为以下简历"
+    "公正地打分，并给出打出这个分数的原因和详细完整可行的优化建议，从短期的简历表达方式优化到中长期的知识技能提升等。"
+    "注意观察当前时间避免判断错用户的年龄和毕业年份。"
+    "回复的内容需要包括："
+    "（1）简历的分数及其得分分析（从多种角度或维度进行综合分析）。（2）打分的原因。（3）详细完整可行的优化建议。"
+    "（4）其他内容。如鼓励或表扬用户，回复用户的特殊需求等。请牢记满分为100分。60为及格分：可以尝试投递，大概率"
+    "进面试，但想要入职还需长期的提升。75分为良好分：有机会能够入职，可以尝试冲刺。90分为优秀分：非常优秀且适合，"
+    "大概率能够成功入职。请注意用户是否与岗位要求的工作经验等硬性条件相匹配。不同类型的企业，不同行业对岗位的招聘"
+    "需求和偏好有所区别，请根据真实的招聘偏好做出正确公正的评价。如果用户上传的内容非常奇怪，和简历打分及优化任务"
+    "完全不沾边，请向用户温和地表示自己是简历打分+优化助手，同时专心回复用户给出的奇怪的内容。用户上传的内容在用户消息中给出。"
+)
+
+_KEYWORD_EXTRACT_PROMPT = (
+    "请严格按照要求为用户消息中的文本（包括用户简历，岗位信息，企业信息等内容）进行内容关键语句提取，"
+    "用于知识库检索和浏览器搜索。内容提取方向：[企业类型, 岗位类型, 岗位所在行业, 学术科研经历, 学科竞赛经历, "
+    "社会实践与领导力经历,企业相关实践经历]等。"
+    "提取要求：简洁清晰完整。每一个关键语句不包含过多的信息点。一个提取方向可以有多条关键语句。如有其他值得搜索的"
+    "语句但不在提取方向里也可以加入。"
+    "返回格式：直接给出并只允许给出全部相关联的关键词或语句。每条语句间严格用<#>分割。例如：aa。<#>b，b。<#>cc？"
+    "禁止在回复时在关键词前后说其他任何话语（如“我明白了”等）。"
+)
+
+_CHAT_PROMPT = (
+    "请结合历史聊天信息（如存在），用户的简历打分+优化结果（包括岗位信息，"
+    "用户简历内容，打分结果及建议等）（如存在），严格遵守给出的打分结果（如存在），回答用户说的话。"
+    "如果用户说的话和简历优化无关，请向用户温和地表示自己是简历打分+优化助手，同时专心回复用户给出的内容。"
+)
+
+_HISTORY_SUMMARY_PROMPT = (
+    "请将已有摘要和新的聊天记录合并为一段简洁的聊天摘要，保留用户的问题要点、已给出的关键结论和建议，"
+    "不超过500字。直接给出并只允许给出摘要内容。"
+)
+
+
 class KimiUser():
     def __init__(self):
         try:
             self.client = OpenAI(
-                api_key="sk-MRWJvmsoYTNxYdDDMmJfk0tnJqg5u3XPZyKBGKPDFU2sjzHQ",
-                base_url="https://api.moonshot.cn/v1",
+                api_key=os.getenv("KIMI_API_KEY", "sk-MRWJvmsoYTNxYdDDMmJfk0tnJqg5u3XPZyKBGKPDFU2sjzHQ"),
+                base_url=KIMI_BASE_URL,
             )
             log.info("Kimi大模型连接成功")
         except Exception as e:
             log.error(f"Kimi大模型连接失败！原因：{e}")
 
-    def kimi_resume_clean(self, resume:str)->str:
+    def _chat(self, task: str, messages: List[dict], **kwargs) -> str:
+        """
+        调用大模型并记录tokens用量（包括上下文缓存命中的tokens）
+        :param task: 任务名称，用于日志
+        :param messages: 消息列表
+        :return: 回复内容
+        """
+        response = self.client.chat.completions.create(
+            model=KIMI_MODEL,
+            messages=messages,
+            **kwargs
+        )
+        record_usage("kimi", task, getattr(response, "usage", None))
+        return response.choices[0].message.content
+
+    @staticmethod
+    def resume_clean_messages(resume: str) -> List[dict]:
+        return [
+            {"role": "system", "content": _SYSTEM_PROMPT},
+            {"role": "system", "content": _RESUME_CLEAN_PROMPT},
+            {"role": "user", "content": f"以下为用户简历：{resume}"},
+        ]
+
+    @staticmethod
+    def resume_score_messages(resume_text: str, job_description: str, ks_info: str = "暂无", kg_info: str = "暂无",
+                              tools_reply: str = "暂无", user_request: str = "暂无",
+                              more_info: str = "暂无") -> List[dict]:
+        return [
+            {"role": "system", "content": _SYSTEM_PROMPT},
+            {"role": "system", "content": _RESUME_SCORE_PROMPT},
+            {"role": "user", "content":
+                f"岗位名称及描述：{job_description}。公司名称及其他信息：{more_info}。"
+                f"知识图谱提供的岗位能力画像：{kg_info}。搜索工具返回的信息：{tools_reply}。"
+                f"知识库里的相关信息和打分依据：{ks_info}。简历内容：{resume_text}。"
+                f"用户备注或特殊需求：{user_request}"},
+        ]
+
+    @staticmethod
+    def keyword_extract_messages(all_text: str) -> List[dict]:
+        return [
+            {"role": "system", "content": _SYSTEM_PROMPT},
+            {"role": "system", "content": _KEYWORD_EXTRACT_PROMPT},
+            {"role": "user", "content": f"内容文本如下：{all_text}"},
+        ]
+
+    @staticmethod
+    def chat_messages(history_chat_record: str, user_prompt: str, res_opt_record: str) -> List[dict]:
+        return [
+            {"role": "system", "content": _SYSTEM_PROMPT},
+            {"role": "system", "content": _CHAT_PROMPT},
+            {"role": "user", "content":
+                f"##用户的简历打分+优化结果：{res_opt_record}。##历史聊天信息：{history_chat_record}。"
+                f"##用户说的话：{user_prompt}"},
+        ]
+
+    @staticmethod
+    def session_chat_messages(res_opt_record: str, summary: str, history: List[dict],
+                              user_prompt: str) -> List[dict]:
+        # 同一会话中简历打分+优化结果不变，历史聊天只在末尾追加，每轮都能命中上一轮的缓存前缀
+        messages = [
+            {"role": "system", "content": _SYSTEM_PROMPT},
+            {"role": "system", "content": _CHAT_PROMPT},
+            {"role": "system", "content": f"##用户的简历打分+优化结果：{res_opt_record}"},
+        ]
+        if summary:
+            messages.append({"role": "system", "content": f"##更早的历史聊天信息摘要：{summary}"})
+        messages.extend(history)
+        messages.append({"role": "user", "content": user_prompt})
+        return messages
+
+    def kimi_resume_clean(self, resume:str, raise_errors: bool = False)->str:
         """
         该方法的主要作用是清洗简历内容，去除用户敏感信息
         :param resume: 简历文本
+        :param raise_errors: 失败时抛出异常而不是返回默认内容（由调用方重试）
         :return: 清洗后的简历文本
         """
         try:
-            response = self.client.chat.completions.create(
-                model="kimi-k2-turbo-preview",
-                messages=[
-                    {"role": "system",
-                     "content":
-                         "你是 Kimi，由 Moonshot AI 提供的人工智能助手，你更擅长中文和英文的对话。你会为用户提供安全，有帮助，准确的回答。"
-                         "同时，你会拒绝一切涉及恐怖主义，种族歧视，黄色暴力等问题的回答。Moonshot AI 为专有名词，不可翻译成其他语言。"},
-                    {"role": "user", "content":
-                        f"请严格按照以下要求为用户简历进行内容清洗，去除用户敏感信息"
-                        f"清洗要求：将用户的电话号码，邮箱，qq号，住址，微信号等敏感信息去除。用户名称只保留姓氏，名用*代替。年龄保留。"
-                        f"返回格式：直接给出并只允许给出清洗后的完整简历文本内容（原封不动的返回除去用户所有敏感信息后的剩余内容）。"
-                        f"禁止在回复时在简历文本前后说其他任何话语（如“我明白了”等），不修改清洗后的简历的任何内容。"
-                        f"以下为用户简历：{resume}"},
-                ],
-                stream=False
-            )
+            res = self._chat("简历清洗", self.resume_clean_messages(resume), stream=False)
             log.info("Kimi大模型简历清洗完成")
         except Exception as e:
             log.error(f"Kimi大模型简历清洗失败！原因：{e}")
+            if raise_errors:
+                raise
             return "Kimi大模型简历清洗失败！暂无不包含用户敏感信息的简历文本。"
 
-        return response.choices[0].message.content
+        return res
 
 
     def getKimiResponses(self,resume_text:str, job_description:str, ks_info:str = "暂无", kg_info:str = "暂无",
-                        tools_reply:str = "暂无", user_request:str = "暂无", more_info:str = "暂无")->str:
+                        tools_reply:str = "暂无", user_request:str = "暂无", more_info:str = "暂无",
+                        raise_errors: bool = False)->str:
         """
         该方法主要职责：根据所有信息给简历打分并给出建议。是项目主方法。
         :param resume_text: 简历内容
@@ -61,79 +179,44 @@ class KimiUser():
         :param tools_reply: 搜索工具返回的信息
         :param user_request: 用户备注或特殊需求
         :param more_info: 公司名称及其他信息
+        :param raise_errors: 失败时抛出异常而不是返回默认内容（由调用方重试）
         :return: Kimi的答复。
         """
         try:
-            completion = self.client.chat.completions.create(
-                model="kimi-k2-turbo-preview",
-                messages=[
-                    {"role": "system",
-                     "content":
-                         "你是 Kimi，由 Moonshot AI 提供的人工智能助手，你更擅长中文和英文的对话。你会为用户提供安全，有帮助，准确的回答。"
-                         "同时，你会拒绝一切涉及恐怖主义，种族歧视，黄色暴力等问题的回答。Moonshot AI 为专有名词，不可翻译成其他语言。"},
-                    {"role": "user", "content":
-                        f"你是一名专业的经验丰富的简历分析师，擅长从企业的真实需求和偏好出发为高校学生的简历打分并给出优化建议，帮助他们"
-                        f"更容易的找到一份好工作。请根据用户给出的简历内容、岗位名称及描述、知识库里的相关信息、知识图谱提供的岗位能力画像，公司名称及其他信息"
-                        f"等内容（如内容为暂无则忽略该项，根据其他内容打分。知识库和知识图谱里的内容如有不相干或明显不正确的的语句则忽略），为以下简历"
-                        f"公正地打分，并给出打出这个分数的原因和详细完整可行的优化建议，从短期的简历表达方式优化到中长期的知识技能提升等。"
-                        f"注意观察当前时间避免判断错用户的年龄和毕业年份。"
-                        f"回复的内容需要包括："
-                        f"（1）简历的分数及其得分分析（从多种角度或维度进行综合分析）。（2）打分的原因。（3）详细完整可行的优化建议。"
-                        f"（4）其他内容。如鼓励或表扬用户，回复用户的特殊需求等。请牢记满分为100分。60为及格分：可以尝试投递，大概率"
-                        f"进面试，但想要入职还需长期的提升。75分为良好分：有机会能够入职，可以尝试冲刺。90分为优秀分：非常优秀且适合，"
-                        f"大概率能够成功入职。请注意用户是否与岗位要求的工作经验等硬性条件相匹配。不同类型的企业，不同行业对岗位的招聘"
-                        f"需求和偏好有所区别，请根据真实的招聘偏好做出正确公正的评价。如果用户上传的内容非常奇怪，和简历打分及优化任务"
-                        f"完全不沾边，请向用户温和地表示自己是简历打分+优化助手，同时专心回复用户给出的奇怪的内容。用户上传的内容如下："
-                        f"简历内容：{resume_text}。岗位名称及描述：{job_description}。"
-                        f"知识库里的相关信息和打分依据：{ks_info}。知识图谱提供的岗位能力画像：{kg_info}"
-                        f"搜索工具返回的信息：{tools_reply}。公司名称及其他信息：{more_info}。"
-                        f"用户备注或特殊需求：{user_request}"}
-                ],
-                temperature=0.3,
-            )
+            res = self._chat("简历打分+优化",
+                             self.resume_score_messages(resume_text, job_description, ks_info, kg_info,
+                                                        tools_reply, user_request, more_info),
+                             temperature=0.3)
             log.info("Kimi大模型简历打分+优化完成")
         except Exception as e:
             log.error(f"Kimi大模型简历打分+优化失败！原因：{e}")
+            if raise_errors:
+                raise
             return "Kimi大模型简历打分+优化失败！"
 
-        return completion.choices[0].message.content
+        return res
 
 
-    def kimi_ks_keyword_extract(self, all_text:str)-> List[str]:
+    def kimi_ks_keyword_extract(self, all_text:str, raise_errors: bool = False)-> List[str]:
         """
         该方法的主要作用是简历内容和关键词提取，用于知识库检索。提取方向如下：
         ["企业类型", "岗位类型", "岗位所在行业", "学术科研经历", "学科竞赛经历", "社会实践与领导力经历",
         "企业相关实践经历"]
         :param all_text: 全部内容文本
+        :param raise_errors: 失败时抛出异常而不是返回默认内容（由调用方重试）
         :return: 关键词列表
         """
         try:
-            response = self.client.chat.completions.create(
-                model="kimi-k2-turbo-preview",
-                messages=[
-                    {"role": "system",
-                     "content":
-                         "你是 Kimi，由 Moonshot AI 提供的人工智能助手，你更擅长中文和英文的对话。你会为用户提供安全，有帮助，准确的回答。"
-                         "同时，你会拒绝一切涉及恐怖主义，种族歧视，黄色暴力等问题的回答。Moonshot AI 为专有名词，不可翻译成其他语言。"},
-                    {"role": "user", "content":
-                        f"请严格按照要求为以下文本（包括用户简历，岗位信息，企业信息等内容）进行内容关键语句提取，"
-                        f"用于知识库检索和浏览器搜索。内容提取方向：[企业类型, 岗位类型, 岗位所在行业, 学术科研经历, 学科竞赛经历, "
-                        f"社会实践与领导力经历,企业相关实践经历]等。"
-                        f"提取要求：简洁清晰完整。每一个关键语句不包含过多的信息点。一个提取方向可以有多条关键语句。如有其他值得搜索的"
-                        f"语句但不在提取方向里也可以加入。"
-                        f"返回格式：直接给出并只允许给出全部相关联的关键词或语句。每条语句间严格用<#>分割。例如：aa。<#>b，b。<#>cc？"
-                        f"禁止在回复时在关键词前后说其他任何话语（如“我明白了”等）。"
-                        f"内容文本如下：{all_text}"},
-                ],
-                stream=False
-            )
+            res = self._chat("简历关键词提取", self.keyword_extract_messages(all_text), stream=False)
             log.info("Kimi大模型简历关键词提取完成")
         except Exception as e:
             log.error(f"Kimi大模型简历关键词提取失败！原因：{e}")
+            if raise_errors:
+                raise
             return ["企业类型", "岗位类型", "岗位所在行业", "学术科研经历", "学科竞赛经历", "社会实践与领导力经历",
         "企业相关实践经历"]
 
-        return response.choices[0].message.content.split("<#>")
+        return res.split("<#>")
 
 
     def kimi_resume_optimization_chat(self, history_chat_record: str, user_prompt: str, res_opt_record: str)->str:
@@ -144,32 +227,54 @@ class KimiUser():
         :param res_opt_record:
         :return: 回复
         """
-        log.info(history_chat_record)
-        log.info(user_prompt)
-        log.info(res_opt_record)
+        log.info(f"聊天输入长度：历史聊天信息{len(history_chat_record)}，用户说的话{len(user_prompt)}，"
+                 f"简历打分+优化结果{len(res_opt_record)}")
         try:
-            response = self.client.chat.completions.create(
-                model="kimi-k2-turbo-preview",
-                messages=[
-                    {"role": "system",
-                     "content":
-                         "你是 Kimi，由 Moonshot AI 提供的人工智能助手，你更擅长中文和英文的对话。你会为用户提供安全，有帮助，准确的回答。"
-                         "同时，你会拒绝一切涉及恐怖主义，种族歧视，黄色暴力等问题的回答。Moonshot AI 为专有名词，不可翻译成其他语言。"},
-                    {"role": "user", "content":
-                        f"请结合历史聊天信息（如存在），用户的简历打分+优化结果（包括岗位信息，"
-                        f"用户简历内容，打分结果及建议等）（如存在），严格遵守给出的打分结果（如存在），回答用户说的话。"
-                        f"如果用户说的话和简历优化无关，请向用户温和地表示自己是简历打分+优化助手，同时专心回复用户给出的内容。"
-                        f"##历史聊天信息：{history_chat_record}。##用户的简历打分+优化结果：{res_opt_record}。##用户说的话："
-                        f"{user_prompt}"},
-                ],
-                stream=False
-            )
+            res = self._chat("聊天", self.chat_messages(history_chat_record, user_prompt, res_opt_record),
+                             stream=False)
             log.info("kimi大模型聊天1任务回答完成")
-            return response.choices[0].message.content
+            return res
         except Exception as e:
             log.error(f"kimi大模型简历优化_聊天任务回答失败！原因：{e}")
             return "kimi大模型聊天任务回答失败！"
 
+
+    def kimi_resume_optimization_session_chat(self, res_opt_record: str, summary: str, history: List[dict],
+                                              user_prompt: str) -> str:
+        """
+        该方法主要作用是基于服务端聊天会话的简历打分优化任务聊天。历史聊天以多轮消息的形式传入，不再拼接进一条消息。
+        :param res_opt_record: 简历打分+优化结果
+        :param summary: 早期聊天的摘要
+        :param history: 近期聊天记录，每项为{"role": "user"/"assistant", "content": ..}
+        :param user_prompt: 用户说的话
+        :return: 回复
+        """
+        log.info(f"会话聊天输入：近期聊天{len(history)}条，用户说的话长度{len(user_prompt)}")
+        try:
+            res = self._chat("会话聊天", self.session_chat_messages(res_opt_record, summary, history, user_prompt),
+                             stream=False)
+            log.info("kimi大模型会话聊天任务回答完成")
+            return res
+        except Exception as e:
+            log.error(f"kimi大模型简历优化_会话聊天任务回答失败！原因：{e}")
+            return "kimi大模型聊天任务回答失败！"
+
+
+    def kimi_chat_history_summary(self, summary: str, history_text: str) -> str:
+        """
+        该方法主要作用是将较早的聊天记录合并进聊天摘要，控制每轮聊天的tokens数。
+        :param summary: 已有摘要
+        :param history_text: 待合并的聊天记录
+        :return: 新摘要
+        """
+        res = self._chat("聊天摘要", [
+            {"role": "system", "content": _SYSTEM_PROMPT},
+            {"role": "system", "content": _HISTORY_SUMMARY_PROMPT},
+            {"role": "user", "content": f"##已有摘要：{summary or '暂无'}。##新的聊天记录：{history_text}"},
+        ], temperature=0.3, stream=False)
+        log.info("kimi大模型聊天摘要完成")
+        return res
+
     # def kimi_resume_optimization_chat_stream(self, history_chat_record: str, user_prompt: str, res_opt_record: str):
     #     """
     #     该方法主要作用是关于简历打分优化任务的聊天。
@@ -1,5 +1,6 @@
 """
 使用api调用deepseek模型
+提示词布局与KimiUser一致：固定的系统提示词和任务要求在前（deepseek自动对相同前缀启用硬盘缓存），变化内容在最后一条用户消息中
 """
 
 import os
@@ -7,9 +8,35 @@ from typing import List
 
 from openai import OpenAI
 from logger import get_logger
+from LLMs.llm_usage import record_usage
 
 log = get_logger()
 
+_SYSTEM_PROMPT = "You are a helpful assistant"
+
+_RESUME_CLEAN_PROMPT = (
+    "请严格按照以下要求为用户简历进行内容清洗，去除用户敏感信息"
+    "清洗要求：将用户的电话号码，邮箱，qq号，住址，微信号等敏感信息去除。用户名称只保留姓氏，名用*代替。年龄保留。"
+    "返回格式：直接给出并只允许给出清洗后的完整简历文本内容（原封不动的返回除去用户所有敏感信息后的剩余内容）。"
+    "禁止在回复时在简历文本前后说其他任何话语（如“我明白了”等），不修改清洗后的简历的任何内容。"
+    "用户简历在用户消息中给出。"
+)
+
+_KEYWORD_EXTRACT_PROMPT = (
+    "请严格按照要求为用户消息中的文本（包括用户简历，岗位信息，企业信息等内容）进行内容关键语句提取，"
+    "用于知识库检索。内容提取方向：[企业类型, 岗位类型, 岗位所在行业, 学术科研经历, 学科竞赛经历, "
+    "社会实践与领导力经历,企业相关实践经历]"
+    "提取要求：简洁清晰完整。每一个关键语句不包含过多的信息点。一个提取方向可以有多条关键语句。"
+    "返回格式：直接给出并只允许给出全部相关联的关键词或语句。每条语句间严格用<#>分割。例如：aa。<#>b，b。<#>cc？"
+    "禁止在回复时在关键词前后说其他任何话语（如“我明白了”等）。"
+)
+
+_CHAT_PROMPT = (
+    "你是一名认真负责的学生就业规划助手。请结合历史聊天信息，用户的简历打分+优化结果（包括岗位信息，用户简历"
+    "内容，打分结果及建议等），严格遵守给出的打分结果（如存在），回答用户说的话。"
+    "如果没有前置信息，请不要随意称呼用户或编造其他虚假信息。如果用户说的话和简历优化无关，请向用户温和地表示自己是简历打分+优化助手，同时专心回复用户给出的内容。"
+)
+
 class deepseekUser():
     def __init__(self):
         try:
@@ -31,16 +58,13 @@ class deepseekUser():
             response = self.client.chat.completions.create(
                 model="deepseek-chat",
                 messages=[
-                    {"role": "system", "content": "You are a helpful assistant"},
-                    {"role": "user", "content":
-                        f"请严格按照以下要求为用户简历进行内容清洗，去除用户敏感信息"
-                        f"清洗要求：将用户的电话号码，邮箱，qq号，住址，微信号等敏感信息去除。用户名称只保留姓氏，名用*代替。年龄保留。"
-                        f"返回格式：直接给出并只允许给出清洗后的完整简历文本内容（原封不动的返回除去用户所有敏感信息后的剩余内容）。"
-                        f"禁止在回复时在简历文本前后说其他任何话语（如“我明白了”等），不修改清洗后的简历的任何内容。"
-                        f"以下为用户简历：{resume}"},
+                    {"role": "system", "content": _SYSTEM_PROMPT},
+                    {"role": "system", "content": _RESUME_CLEAN_PROMPT},
+                    {"role": "user", "content": f"以下为用户简历：{resume}"},
                 ],
                 stream=False
             )
+            record_usage("deepseek", "简历清洗", getattr(response, "usage", None))
             log.info("deepseek大模型简历清洗完成")
         except Exception as e:
             log.error(f"deepseek大模型简历清洗失败！原因：{e}")
@@ -60,18 +84,13 @@ class deepseekUser():
             response = self.client.chat.completions.create(
                 model="deepseek-chat",
                 messages=[
-                    {"role": "system", "content": "You are a helpful assistant"},
-                    {"role": "user", "content":
-                        f"请严格按照要求为以下文本（包括用户简历，岗位信息，企业信息等内容）进行内容关键语句提取，"
-                        f"用于知识库检索。内容提取方向：[企业类型, 岗位类型, 岗位所在行业, 学术科研经历, 学科竞赛经历, "
-                        f"社会实践与领导力经历,企业相关实践经历]"
-                        f"提取要求：简洁清晰完整。每一个关键语句不包含过多的信息点。一个提取方向可以有多条关键语句。"
-                        f"返回格式：直接给出并只允许给出全部相关联的关键词或语句。每条语句间严格用<#>分割。例如：aa。<#>b，b。<#>cc？"
-                        f"禁止在回复时在关键词前后说其他任何话语（如“我明白了”等）。"
-                        f"内容文本如下：{all_text}"},
+                    {"role": "system", "content": _SYSTEM_PROMPT},
+                    {"role": "system", "content": _KEYWORD_EXTRACT_PROMPT},
+                    {"role": "user", "content": f"内容文本如下：{all_text}"},
                 ],
                 stream=False
             )
+            record_usage("deepseek", "简历关键词提取", getattr(response, "usage", None))
             log.info("deepseek大模型简历关键词提取完成")
         except Exception as e:
             log.error(f"deepseek大模型简历关键词提取失败！原因：{e}")
@@ -88,23 +107,21 @@ class deepseekUser():
         :param res_opt_record:
         :return: 回复
         """
-        log.info(history_chat_record)
-        log.info(user_prompt)
-        log.info(res_opt_record)
+        log.info(f"聊天输入长度：历史聊天信息{len(history_chat_record)}，用户说的话{len(user_prompt)}，"
+                 f"简历打分+优化结果{len(res_opt_record)}")
         try:
             response = self.client.chat.completions.create(
                 model="deepseek-chat",
                 messages=[
-                    {"role": "system", "content": "You are a helpful assistant"},
+                    {"role": "system", "content": _SYSTEM_PROMPT},
+                    {"role": "system", "content": _CHAT_PROMPT},
                     {"role": "user", "content":
-                        f"你是一名认真负责的学生就业规划助手。请结合历史聊天信息，用户的简历打分+优化结果（包括岗位信息，用户简历"
-                        f"内容，打分结果及建议等），严格遵守给出的打分结果（如存在），回答用户说的话。"
-                        f"如果没有前置信息，请不要随意称呼用户或编造其他虚假信息。如果用户说的话和简历优化无关，请向用户温和地表示自己是简历打分+优化助手，同时专心回复用户给出的内容。"
-                        f"##历史聊天信息：{history_chat_record}。##用户的简历打分+优化结果：{res_opt_record}。##用户说的话："
-                        f"{user_prompt}"},
+                        f"##用户的简历打分+优化结果：{res_opt_record}。##历史聊天信息：{history_chat_record}。"
+                        f"##用户说的话：{user_prompt}"},
                 ],
                 stream=False
             )
+            record_usage("deepseek", "聊天", getattr(response, "usage", None))
             log.info("deepseek大模型聊天1任务回答完成")
             return response.choices[0].message.content
         except Exception as e:
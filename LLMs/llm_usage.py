@@ -0,0 +1,35 @@
+"""
+大模型tokens用量记录
+各服务商返回的上下文缓存命中tokens字段不同：
+    Kimi（Moonshot）：usage.cached_tokens 或 usage.prompt_tokens_details.cached_tokens
+    deepseek：usage.prompt_cache_hit_tokens
+"""
+from logger import get_logger
+from metrics import record_llm_usage
+
+log = get_logger(__name__)
+
+
+def record_usage(provider: str, task: str, usage) -> dict:
+    """
+    提取并记录一次调用的tokens用量
+    :param provider: 服务商名称，如kimi、deepseek
+    :param task: 任务名称，如简历清洗
+    :param usage: 接口返回的usage对象
+    :return: {"prompt_tokens": .., "cached_tokens": .., "completion_tokens": ..}
+    """
+    if usage is None:
+        return {}
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    cached_tokens = getattr(usage, "prompt_cache_hit_tokens", None)
+    if cached_tokens is None:
+        cached_tokens = getattr(usage, "cached_tokens", None)
+    if cached_tokens is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", 0) if details is not None else 0
+    cached_tokens = cached_tokens or 0
+
+    record_llm_usage(provider, prompt_tokens, cached_tokens, completion_tokens)
+    log.info(f"{provider}大模型{task}tokens用量：输入{prompt_tokens}（缓存命中{cached_tokens}），输出{completion_tokens}")
+    return {"prompt_tokens": prompt_tokens, "cached_tokens": cached_tokens, "completion_tokens": completion_tokens}
@@ -1,92 +1,158 @@
 """
 该类用于实现简历打分+优化功能
 """
+import os
+import threading
 import time
 from warnings import catch_warnings
 
 import json
+import re
 import concurrent.futures
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from redis_client import RedisClient
-from logger import get_logger
-
-from LLMs.KimiUser import KimiUser
-# from LLMs.deepseekUser import deepseekUser
-from KnowledgeGraph.KgUser import KgUser
-from KnowledgeSystem.KsUser import KsUser
-from KnowledgeSystem.KsBuilder import KsBuilder
-from Tools.DuckDuckGoUser import DuckDuckGoUser
+from task_scheduler import TaskScheduler, TASK_TYPE_RO
+from task_state import (TaskStateStore, STATE_CLEANING, STATE_RETRIEVING, STATE_GENERATING, STATE_DONE,
+                        STATE_FAILED)
+from task_checkpoint import TaskCheckpointStore
+from job_context_cache import JobContextCache
+from logger import get_logger, current_task_id
+from metrics import REGISTRY, STAGE_FAILURES, TASK_RETRIES, WORKER_INFLIGHT, start_metrics_server
+from tracing import init_tracing, stage, extract_context, record_queue_wait, submit_with_context, tracer
+from dependencies import LazyDependency, warm_up, readiness
 
 log = get_logger(__name__)
 
-kimi = KimiUser()
-# ds = deepseekUser()
-kg = KgUser()
-ks_user = KsUser()
-ks_builder = KsBuilder()
-ddg = DuckDuckGoUser()
+# 外部依赖在首次使用时才导入和构造（见dependencies），导入本模块不连接任何服务；main()启动时并行预热
+kimi = LazyDependency("kimi", "LLMs.KimiUser:KimiUser")
+# ds = LazyDependency("deepseek", "LLMs.deepseekUser:deepseekUser")
+kg = LazyDependency("kg", "KnowledgeGraph.KgUser:KgUser", check=lambda user: hasattr(user, "driver"))
+# 预热时计算一次向量，加载向量模型
+ks_user = LazyDependency("ks", "KnowledgeSystem.KsUser:KsUser",
+                         warm=lambda user: user.embedding_service.embed(["简历"], persist=False))
+ddg = LazyDependency("ddg", "Tools.DuckDuckGoUser:DuckDuckGoUser")
+# 处理任务必需、启动时预热的依赖（搜索工具当前未启用，不预热）
+DEPENDENCIES = (kimi, kg, ks_user)
+
+# 每个工作进程同时处理的任务数。任务大部分时间在等待大模型和检索，并发处理时知识库检索可跨任务合并（见KsCoalescer）
+WORKER_CONCURRENCY = int(os.getenv("AI_WORKER_CONCURRENCY", "4"))
+# 任务最多处理次数（含首次）。失败或工作进程失联后重新入队，已完成的阶段从检查点恢复（见task_checkpoint）
+TASK_MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", "3"))
+
+def _extract_score(res: str) -> str:
+    """
+    从简历打分+优化结果中提取分数（第一个“xx分”），未找到时返回空字符串
+    """
+    match = re.search(r"(\d{1,3})\s*分", res or "")
+    if match and int(match.group(1)) <= 100:
+        return match.group(1)
+    return ""
+
 
 class AIWorker:
     """AI任务处理工作进程"""
 
-    def __init__(self):
+    def __init__(self, task_types: list[int] = None, concurrency: int = WORKER_CONCURRENCY):
+        """
+        :param task_types: 本工作进程处理的任务类型，为空时处理全部已支持的任务类型。
+                           可为聊天类任务单独启动工作进程，避免其排在简历优化任务之后
+        :param concurrency: 同时处理的任务数，有空闲名额时才从队列取任务
+        """
         self.redis_client = RedisClient()
-        log.info("AI工作进程启动")
-
-    def _pdf_resume_clean(self, pdf:str, task_id:str)->str:
+        init_tracing("resume-worker", self.redis_client)
+        self.scheduler = TaskScheduler(self.redis_client)
+        REGISTRY.register_collector(self.scheduler.export_metrics)
+        self.job_cache = JobContextCache(self.redis_client)
+        self.states = TaskStateStore(self.redis_client)
+        self.checkpoints = TaskCheckpointStore(self.redis_client)
+        self.handlers = {TASK_TYPE_RO: self.process_resume_task}
+        if task_types:
+            self.handlers = {t: h for t, h in self.handlers.items() if t in task_types}
+        self.concurrency = max(1, concurrency)
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._inflight = 0
+        # 正在处理的任务的租约ID，由心跳线程续约
+        self._leases = set()
+        self._inflight_lock = threading.Lock()
+        log.info(f"AI工作进程启动，处理任务类型：{list(self.handlers)}，并发数：{self.concurrency}")
+
+    def _pdf_resume_clean(self, pdf:str, task_id:str, raise_errors:bool = False)->str:
         # pdf_text = ds.deepseek_resume_clean(pdf)
         # pdf_text = "暂无简历文本"
-        pdf_text = kimi.kimi_resume_clean(pdf)
+        with stage("clean"):
+            pdf_text = kimi.kimi_resume_clean(pdf, raise_errors=raise_errors)
         log.info(f"清洗简历成功。{task_id}")
         return pdf_text
 
 
-    def _keyword_extract(self, job_name:str, job_description:str, more_info:str, pdf_text:str)->list[str]:
+    def _keyword_extract(self, job_name:str, job_description:str, more_info:str, pdf_text:str,
+                         raise_errors:bool = False)->list[str]:
         # ks_keywords = ["暂无"]
-        ks_keywords = kimi.kimi_ks_keyword_extract(
-            f"岗位名称：{job_name}。岗位描述：{job_description}。其他信息：{more_info}。简历内容：{pdf_text}。")
+        with stage("keyword_extract"):
+            ks_keywords = kimi.kimi_ks_keyword_extract(
+                f"岗位名称：{job_name}。岗位描述：{job_description}。其他信息：{more_info}。简历内容：{pdf_text}。",
+                raise_errors=raise_errors)
         log.info(f"内容检索成功。关键词：{ks_keywords}")
         return ks_keywords
 
 
     def _ks_search(self, ks_keywords:list[str])->str:
         # ks_info = ["暂无"]
-        ks_info = ks_user.search_similar_text(ks_keywords)
-        log.info(f"知识库信息获取成功:{ks_info}")
+        with stage("ks_search", keywords=len(ks_keywords)):
+            ks_info = ks_user.search_similar_text(ks_keywords)
+        log.info(f"知识库信息获取成功：{len(ks_info)}条")
         return "###".join(ks_info)
 
 
     def _kg_search(self, job_name:str)->str:
         # kg_info = "暂无"
-        kg_info = ' '.join(kg.find_skill_txt(job_name))
-        log.info(f"知识图谱信息获取成功:{kg_info}")
+        with stage("kg_search"):
+            kg_info = ' '.join(kg.find_skill_txt(job_name))
+        log.info(f"知识图谱信息获取成功：{len(kg_info)}字符")
         return kg_info
 
 
     def _search_resume(self, keywords:list[str])->str:
-        tools_reply_resume = "暂无"
-        # tools_reply_resume = ddg.ddg_search_resume(keywords)
-        log.info(f"简历相关内容搜索完成:{tools_reply_resume}")
+        with stage("web_search_resume"):
+            tools_reply_resume = "暂无"
+            # tools_reply_resume = ddg.ddg_search_resume(keywords)
+        log.info(f"简历相关内容搜索完成：{len(tools_reply_resume)}字符")
         return tools_reply_resume
 
 
     def _search_else(self, job_name:str, job_description:str, more_info:str)->str:
-        tools_reply_else = "暂无"
-        # tools_reply_else = ddg.ddg_search_else([job_name, job_description, more_info])
-        log.info(f"简历无关内容搜索完成:{tools_reply_else}")
+        with stage("web_search_else"):
+            tools_reply_else = "暂无"
+            # tools_reply_else = ddg.ddg_search_else([job_name, job_description, more_info])
+        log.info(f"简历无关内容搜索完成：{len(tools_reply_else)}字符")
         return tools_reply_else
 
 
+    def _job_context(self, job_name:str, job_description:str, more_info:str)->tuple[str, str]:
+        """
+        获取只与岗位相关、与简历无关的信息：知识图谱信息，工具搜索（简历无关）结果。
+        同一岗位的任务（包括同一批量任务的子任务）共享缓存，并发任务只计算一次
+        :return: (kg_info, tools_reply_else)
+        """
+        def compute() -> dict:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                future_kg = submit_with_context(executor, self._kg_search, job_name)
+                future_else_search = submit_with_context(executor, self._search_else,
+                                                         job_name, job_description, more_info)
+                return {"kg_info": future_kg.result(), "tools_reply_else": future_else_search.result()}
+
+        with stage("job_context"):
+            context = self.job_cache.get_or_compute(job_name, job_description, more_info, compute)
+        return context["kg_info"], context["tools_reply_else"]
+
+
     def process_resume_task(self, task_data: dict):
         """处理简历分析任务"""
+        task_id = task_data.get("task_id")
+        batch_id = task_data.get("batch_id")
         try:
-            task_data_json = task_data[1]   # JSON格式。无法直接提取内容
-            # 解析JSON字符串为字典
-            task_data_dict = json.loads(task_data_json)
-
-            task_id = task_data_dict["task_id"]
-            task_info_dict = task_data_dict["task_info"]
+            task_info_dict = task_data["task_info"]
             pdf = task_info_dict["pdf全部文本"]
             job_name = task_info_dict["岗位名称"]
             job_description = task_info_dict["岗位描述"]
@@ -96,66 +162,191 @@ class AIWorker:
             # time.sleep(15)
             # return self.redis_client.input_res(task_id, "测试回复###$$$简历文本$$$###：简历内容为空")
 
+            self.states.update(task_id, STATE_CLEANING, batch_id=batch_id)
+
+            # 各阶段的输出保存为检查点，重试或被回收的任务跳过已完成的阶段。
+            # 还有重试机会时大模型调用失败直接抛出（重新入队），最后一次才退回默认内容
+            checkpoint = self.checkpoints.task(task_id)
+            raise_errors = int(task_data.get("attempt", 0)) + 1 < TASK_MAX_ATTEMPTS
+
             # 并行处理：
             # 1 简历清洗-->1.1 内容检索关键词-->1.1.1 知识库检索
             #                               1.1.2 工具搜索（简历相关）
-            # 2 知识图谱检索
-            # 3 工具搜索（简历无关）
+            # 2 岗位相关信息：知识图谱检索、工具搜索（简历无关）。同岗位任务共享缓存
             with ThreadPoolExecutor(max_workers=6) as executor:
                 # 提交所有并行任务
-                future_clean = executor.submit(self._pdf_resume_clean, pdf, task_id)
-                future_kg = executor.submit(self._kg_search, job_name)
-                future_else_search = executor.submit(self._search_else,job_name, job_description, more_info)
+                future_clean = submit_with_context(executor, checkpoint.run, "clean", self._pdf_resume_clean,
+                                                   pdf, task_id, raise_errors)
+                future_job = submit_with_context(executor, checkpoint.run, "job_context", self._job_context,
+                                                 job_name, job_description, more_info)
 
                 # 等待简历清洗任务完成，准备内容检索关键词任务
                 pdf_text = future_clean.result()
-                future_keywords = executor.submit(self._keyword_extract, job_name, job_description,
-                                                  more_info, pdf_text)
+                self.states.update(task_id, STATE_RETRIEVING)
+                future_keywords = submit_with_context(executor, checkpoint.run, "keywords", self._keyword_extract,
+                                                      job_name, job_description, more_info, pdf_text, raise_errors)
 
                 # 等待内容检索关键词任务完成，准备知识库检索、工具搜索（简历相关）任务
                 keywords = future_keywords.result()
-                future_ks = executor.submit(self._ks_search, keywords)
-                future_resume_search = executor.submit(self._search_resume, keywords)
+                future_ks = submit_with_context(executor, checkpoint.run, "ks_search", self._ks_search, keywords)
+                future_resume_search = submit_with_context(executor, checkpoint.run, "web_search_resume",
+                                                           self._search_resume, keywords)
 
                 ks_info = future_ks.result()
-                kg_info = future_kg.result()
+                kg_info, tools_reply_else = future_job.result()
                 tools_reply_resume = future_resume_search.result()
-                tools_reply_else = future_else_search.result()
 
 
             # 生成最终结果
+            self.states.update(task_id, STATE_GENERATING)
             # res = "暂无"
-            res = kimi.getKimiResponses(pdf_text, job_name+"  "+job_description, ks_info, kg_info,
-                                        tools_reply_resume+"###"+tools_reply_else, user_request, more_info)
-            res = res+"###$$$简历文本$$$###："+ pdf_text
+            def generate() -> str:
+                with stage("llm_generate"):
+                    return kimi.getKimiResponses(pdf_text, job_name+"  "+job_description, ks_info, kg_info,
+                                                 tools_reply_resume+"###"+tools_reply_else, user_request, more_info,
+                                                 raise_errors=raise_errors)
+            res = checkpoint.run("llm_generate", generate)
             log.info(f"简历任务处理完成。{task_id}")
-            self.redis_client.input_res(task_id, res)
-            log.info(f"简历任务上传完成。{task_id}")
-            log.info(f"简历任务上传完成。{res}")
+            meta = {"task_id": task_id, "job_name": job_name, "batch_id": batch_id,
+                    "finished_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+            with stage("result_write"):
+                # 比较并设置：任务已是最终状态时（租约被回收后已由其他工作进程完成）不再写入结果、不再计数
+                finished = self.states.finish(task_id, STATE_DONE, {
+                    "score": _extract_score(res),
+                    "suggestions": res,
+                    "resume": pdf_text,
+                    "meta": json.dumps(meta, ensure_ascii=False),
+                }, batch_id)
+            if finished is None:
+                # redis异常，结果未写入：保留检查点，由重试从检查点继续，不必重新调用大模型
+                raise RuntimeError("任务结果写入失败")
+            if finished is False:
+                log.warning(f"任务已由其他工作进程完成，丢弃本次结果。{task_id}")
+                return res
+            self.checkpoints.clear(task_id)
+            log.info(f"简历任务上传完成。{task_id}，结果长度：{len(res)}")
             return res
 
         except Exception as e:
-            log.error(f"处理简历任务失败。{task_data[1]["task_id"]}，错误信息：{e}")
-            return {"task_id": task_data[1]["task_id"], "status": "failed", "error": str(e)}
-
-    def start_working(self):
-        """开始处理任务"""
-        log.info("工作进程开始运行...")
+            log.error(f"处理简历任务失败。{task_id}，错误信息：{e}")
+            STAGE_FAILURES.inc(stage="task")
+            if self._retry(task_data, str(e), reason="error"):
+                return {"task_id": task_id, "status": "retrying", "error": str(e)}
+            return {"task_id": task_id, "status": "failed", "error": str(e)}
+
+    def _retry(self, task_data: dict, error: str, reason: str) -> bool:
+        """
+        任务处理失败或被回收后重新入队（attempt加1），次数用完时标记为失败
+        :param reason: error（处理失败）/reclaimed（工作进程失联，租约到期）
+        :return: 是否已重新入队
+        """
+        task_id = task_data.get("task_id")
+        batch_id = task_data.get("batch_id")
+        if self.states.is_final(task_id):
+            # 被回收的任务可能已由原工作进程完成，或另一次处理已结束
+            log.warning(f"任务已结束，不再重新入队。{task_id}，原因：{reason}")
+            return False
+        attempt = int(task_data.get("attempt", 0)) + 1
+        if attempt < TASK_MAX_ATTEMPTS:
+            task = dict(task_data, attempt=attempt)
+            task_type, tenant = int(task_data["task_type"]), task_data.get("tenant")
+            # 重新入队同样受排队数上限约束（不扣租户令牌），排队已满时不再重试
+            admission = self.scheduler.admit(task_type, tenant, rate_limited=False)
+            if not admission["admitted"]:
+                error = f"排队已满，未能重新入队：{error}"
+            elif self.scheduler.push(task, tenant=tenant, reserved=admission["reserved"]):
+                TASK_RETRIES.inc(task_type=task_type, reason=reason)
+                log.warning(f"任务重新入队，第{attempt + 1}次处理。{task_id}，原因：{reason}，{error[:200]}")
+                return True
+            elif admission["reserved"]:
+                self.scheduler.release(task_type)
+        self.states.finish(task_id, STATE_FAILED, batch_id=batch_id, error=error[:500])
+        return False
+
+    def _run_traced(self, task: dict):
+        """
+        在API进程传来的追踪上下文下处理任务：记录排队等待阶段，任务处理作为worker span
+        """
+        token = current_task_id.set(task.get("task_id", ""))
+        try:
+            parent = extract_context(task.get("trace_context"))
+            record_queue_wait(task, parent)
+            with tracer.start_as_current_span("worker", context=parent,
+                                              attributes={"task_id": task.get("task_id", ""),
+                                                          "task_type": int(task["task_type"])}):
+                return self.handlers[int(task["task_type"])](task)
+        finally:
+            current_task_id.reset(token)
+
+    def _track_inflight(self, task: dict, delta: int):
+        with self._inflight_lock:
+            self._inflight += delta
+            if delta > 0:
+                self._leases.add(self.scheduler.lease_id(task))
+            else:
+                self._leases.discard(self.scheduler.lease_id(task))
+            WORKER_INFLIGHT.set(self._inflight)
+
+    def _run_slot(self, task: dict):
+        """
+        在线程池中处理一个任务，结束后确认任务并释放名额
+        """
+        try:
+            return self._run_traced(task)
+        except Exception as e:
+            log.error(f"工作进程错误: {e}")
+        finally:
+            self.scheduler.ack(task)
+            self._track_inflight(task, -1)
+            self._slots.release()
+
+    def _heartbeat_loop(self):
+        """
+        心跳：为正在处理的任务续约，并回收其他工作进程租约已到期的任务
+        """
         while True:
+            time.sleep(self.scheduler.lease_s / 3)
             try:
-                resume_task = self.redis_client.popQueue_RO(timeout=5)
-                if resume_task:
-                    result = self.process_resume_task(resume_task)
-            except KeyboardInterrupt:
-                log.info("工作进程被用户中断")
-                break
+                with self._inflight_lock:
+                    leases = list(self._leases)
+                self.scheduler.extend(leases)
+                for task in self.scheduler.reclaim():
+                    log.warning(f"回收租约到期的任务：{task.get('task_id')}")
+                    self._retry(task, "处理该任务的工作进程失联", reason="reclaimed")
             except Exception as e:
-                log.error(f"工作进程错误: {e}")
-                time.sleep(1)  # 出错后休息1秒
+                log.error(f"工作进程心跳错误: {e}")
+
+    def start_working(self):
+        """开始处理任务：最多同时处理concurrency个任务，名额占满时不再取任务"""
+        log.info("工作进程开始运行...")
+        self.scheduler.migrate_legacy_queue()
+        threading.Thread(target=self._heartbeat_loop, name="worker-heartbeat", daemon=True).start()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="ai-task") as executor:
+            while True:
+                try:
+                    self._slots.acquire()
+                    try:
+                        task = self.scheduler.pop(list(self.handlers), timeout=5)
+                    except Exception:
+                        self._slots.release()
+                        raise
+                    if not task:
+                        self._slots.release()
+                        continue
+                    self._track_inflight(task, 1)
+                    executor.submit(self._run_slot, task)
+                except KeyboardInterrupt:
+                    log.info("工作进程被用户中断")
+                    break
+                except Exception as e:
+                    log.error(f"工作进程错误: {e}")
+                    time.sleep(1)  # 出错后休息1秒
 
 
 def main():
     worker = AIWorker()
+    start_metrics_server(ready_check=lambda: readiness(DEPENDENCIES))
+    warm_up(DEPENDENCIES)
     worker.start_working()
 
 if __name__ == "__main__":
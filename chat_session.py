@@ -0,0 +1,165 @@
+"""
+聊天会话类：服务端保存与简历打分+优化任务（task_id）绑定的聊天会话
+    chat_session:{task_id}            哈希。res_opt_record：简历打分+优化结果（只保存一次，压缩存储），summary：早期聊天摘要
+    chat_session:{task_id}:history    列表。近期聊天记录，每项为{"role": .., "content": ..}
+客户端每轮只需上传新的用户提示词。近期聊天记录超过tokens预算时，最早的若干轮被合并进摘要。
+"""
+import json
+import re
+from typing import Callable, List, Optional
+
+from redis.exceptions import WatchError
+
+from logger import get_logger
+from redis_client import RedisClient, encode_field, decode_field, join_res_fields
+
+log = get_logger(__name__)
+
+_CJK_RE = re.compile(r"[　-〿㐀-鿿＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算tokens数：中文字符及全角标点约1个token，其余字符约4个字符1个token
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class ChatSessionStore(object):
+    """
+    聊天会话存储
+    """
+    def __init__(self, redis_client: RedisClient = None, history_token_budget: int = 3000, ttl: int = 86400,
+                 max_write_attempts: int = 5):
+        """
+        :param redis_client: redis客户端，为空时新建
+        :param history_token_budget: 近期聊天记录的tokens预算，超出后将最早的聊天合并进摘要
+        :param ttl: 会话过期时间（秒），每轮聊天后刷新
+        :param max_write_attempts: 追加聊天时与其他请求冲突的最多重试次数
+        """
+        self.redis_client = redis_client or RedisClient()
+        self.client = self.redis_client.client
+        self.raw_client = self.redis_client.raw_client
+        self.history_token_budget = history_token_budget
+        self.ttl = ttl
+        self.max_write_attempts = max_write_attempts
+
+    @staticmethod
+    def _session_key(task_id: str) -> str:
+        return f"chat_session:{task_id}"
+
+    @staticmethod
+    def _history_key(task_id: str) -> str:
+        return f"chat_session:{task_id}:history"
+
+    def load(self, task_id: str) -> Optional[dict]:
+        """
+        读取会话。会话不存在时，使用该任务的简历打分+优化结果创建会话
+        :param task_id: 简历打分+优化任务id
+        :return: {"res_opt_record": .., "summary": .., "history": [..]}，任务结果不存在时返回None
+        """
+        pipe = self.raw_client.pipeline(transaction=False)
+        pipe.hgetall(self._session_key(task_id))
+        pipe.lrange(self._history_key(task_id), 0, -1)
+        session, history = pipe.execute()
+
+        if session:
+            return {
+                "res_opt_record": decode_field(session.get(b"res_opt_record")) or "",
+                "summary": decode_field(session.get(b"summary")) or "",
+                "history": [json.loads(decode_field(h)) for h in history],
+            }
+
+        fields = self.redis_client.get_res_fields(task_id, ["suggestions", "resume"])
+        if not fields:
+            return None
+        res_opt_record = join_res_fields(fields)
+        pipe = self.raw_client.pipeline(transaction=True)
+        pipe.hset(self._session_key(task_id), mapping={"res_opt_record": encode_field(res_opt_record),
+                                                       "summary": b""})
+        pipe.expire(self._session_key(task_id), self.ttl)
+        pipe.execute()
+        log.info(f"聊天会话创建成功 - 任务ID: {task_id}")
+        return {"res_opt_record": res_opt_record, "summary": "", "history": []}
+
+    def append_turn(self, task_id: str, session: dict, user_prompt: str, answer: str,
+                    summarize: Callable[[str, str], str] = None):
+        """
+        追加一轮聊天。近期聊天记录超过tokens预算时，将最早的若干轮合并进摘要。
+        同一会话可能同时有多轮聊天（重复提交、多个页面），读取-摘要-写入在WATCH下进行，
+        期间会话被修改时基于最新的聊天记录重新计算，只移出本次读取到并合并进摘要的聊天
+        :param task_id: 简历打分+优化任务id
+        :param session: load返回的会话，写入后更新为最新的聊天记录和摘要
+        :param user_prompt: 用户提示词
+        :param answer: 回复
+        :param summarize: 摘要函数 (已有摘要, 待合并的聊天记录文本) -> 新摘要。为空时直接丢弃最早的聊天
+        """
+        turns = [{"role": "user", "content": user_prompt}, {"role": "assistant", "content": answer}]
+        encoded_turns = [encode_field(json.dumps(t, ensure_ascii=False)) for t in turns]
+        session_key, history_key = self._session_key(task_id), self._history_key(task_id)
+        # 重试时待合并的内容往往不变，缓存摘要结果，避免重复调用大模型
+        summaries = {}
+
+        for _ in range(self.max_write_attempts):
+            with self.raw_client.pipeline(transaction=True) as pipe:
+                try:
+                    pipe.watch(session_key, history_key)
+                    summary = decode_field(pipe.hget(session_key, "summary")) or ""
+                    history: List[dict] = [json.loads(decode_field(h)) for h in pipe.lrange(history_key, 0, -1)]
+                    history += turns
+
+                    # 从最早的聊天开始移出，直到剩余部分不超过预算的一半，避免每轮都触发摘要
+                    total = sum(estimate_tokens(h["content"]) for h in history)
+                    drop = 0
+                    if total > self.history_token_budget:
+                        while drop < len(history) - len(turns) and total > self.history_token_budget // 2:
+                            total -= estimate_tokens(history[drop]["content"])
+                            drop += 1
+
+                    if drop:
+                        dropped_text = "\n".join(f"{h['role']}：{h['content']}" for h in history[:drop])
+                        if summarize and (summary, dropped_text) not in summaries:
+                            try:
+                                summaries[(summary, dropped_text)] = summarize(summary, dropped_text)
+                            except Exception as e:
+                                log.error(f"聊天记录摘要失败，直接丢弃最早的聊天。任务ID: {task_id}，错误: {e}")
+                        summary = summaries.get((summary, dropped_text), summary)
+
+                    pipe.multi()
+                    pipe.rpush(history_key, *encoded_turns)
+                    if drop:
+                        pipe.ltrim(history_key, drop, -1)
+                        pipe.hset(session_key, "summary", encode_field(summary))
+                    pipe.expire(session_key, self.ttl)
+                    pipe.expire(history_key, self.ttl)
+                    pipe.execute()
+                except WatchError:
+                    log.info(f"聊天会话写入冲突，重新计算 - 任务ID: {task_id}")
+                    continue
+            if drop:
+                log.info(f"聊天记录超出预算，合并{drop}条进摘要 - 任务ID: {task_id}")
+            session["history"] = history[drop:]
+            session["summary"] = summary
+            return
+
+        # 多次冲突时只追加本轮聊天，不移出任何聊天，留给下一轮合并
+        log.warning(f"聊天会话写入多次冲突，本轮不合并摘要 - 任务ID: {task_id}")
+        pipe = self.raw_client.pipeline(transaction=True)
+        pipe.rpush(history_key, *encoded_turns)
+        pipe.expire(session_key, self.ttl)
+        pipe.expire(history_key, self.ttl)
+        pipe.execute()
+        session["history"] = session["history"] + turns
+
+    def clear(self, task_id: str):
+        """
+        删除会话
+        """
+        self.client.delete(self._session_key(task_id), self._history_key(task_id))
+
+
+if __name__ == "__main__":
+    print(estimate_tokens("怎么改项目经历"), estimate_tokens("How should I rewrite my project section?"))
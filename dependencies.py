@@ -0,0 +1,187 @@
+"""
+外部依赖的延迟初始化与预热
+    LazyDependency：首次使用时才导入模块并构造实例（大模型客户端、知识图谱、知识库等），导入API或工作进程模块时不连接任何外部服务。
+                    属性访问转发给实例，调用方式与直接使用实例相同；构造是线程安全的，并发的首次调用只构造一次
+    warm_up：进程启动后并行构造并预热全部依赖（如加载向量模型），总耗时取最慢的一个而不是逐个相加
+    readiness：汇总各依赖状态，供就绪检查接口使用（API进程GET /ready，AI工作进程指标服务的/ready）
+构造失败的依赖不会导致进程启动失败：错误被记录，就绪检查报告未就绪，
+DEPENDENCY_RETRY_S秒（默认10）后的下一次使用会重新构造，期间的调用直接抛出上次的错误。
+预热失败（或超时）的依赖由就绪检查在后台重新预热，重试间隔从DEPENDENCY_RETRY_S起按失败次数翻倍，最长DEPENDENCY_RETRY_MAX_S秒（默认300）。
+"""
+import importlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, Union
+
+from logger import get_logger
+from metrics import DEPENDENCY_INIT, DEPENDENCY_READY
+
+log = get_logger(__name__)
+
+DEPENDENCY_RETRY_S = float(os.getenv("DEPENDENCY_RETRY_S", "10"))
+DEPENDENCY_RETRY_MAX_S = float(os.getenv("DEPENDENCY_RETRY_MAX_S", "300"))
+# 启动预热的最长等待时间（秒），超时后进程照常开始工作，未完成的依赖在后台继续初始化
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "60"))
+
+
+def _resolve(factory: Union[str, Callable[[], Any]]) -> Callable[[], Any]:
+    """
+    "模块:名称"形式的字符串在使用时才导入
+    """
+    if callable(factory):
+        return factory
+    module_name, _, attr = factory.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+class LazyDependency(object):
+    """
+    延迟构造的依赖，线程安全
+    """
+    def __init__(self, name: str, factory: Union[str, Callable[[], Any]], warm: Callable[[Any], Any] = None,
+                 check: Callable[[Any], bool] = None):
+        """
+        :param name: 依赖名称，用于日志、指标和就绪检查
+        :param factory: 构造函数或"模块:名称"（如"LLMs.KimiUser:KimiUser"），不带参数调用
+        :param warm: 预热函数，构造后在warm_up中调用（如计算一次向量以加载模型）
+        :param check: 可用性检查，返回False时视为未就绪（用于构造时只记录错误、不抛出异常的类）
+        """
+        self._name = name
+        self._factory = factory
+        self._warm = warm
+        self._check = check
+        self._instance = None
+        self._error: Optional[Exception] = None
+        self._failed_at = 0.0
+        self._warmed = False
+        self._lock = threading.Lock()
+        # 预热互斥（同一时刻只有一个预热），以及最近一次预热的时间和连续失败次数（用于重试退避）
+        self._warm_lock = threading.Lock()
+        self._warm_attempted_at = 0.0
+        self._warm_failures = 0
+
+    def get(self) -> Any:
+        """
+        获取实例，首次调用时构造
+        """
+        instance = self._instance
+        if instance is not None:
+            return instance
+        with self._lock:
+            if self._instance is None:
+                if self._error is not None and time.monotonic() - self._failed_at < DEPENDENCY_RETRY_S:
+                    raise self._error
+                start = time.perf_counter()
+                try:
+                    self._instance = _resolve(self._factory)()
+                except Exception as e:
+                    self._error, self._failed_at = e, time.monotonic()
+                    DEPENDENCY_READY.set(0, dependency=self._name)
+                    log.error(f"依赖初始化失败：{self._name}，{e}")
+                    raise
+                self._error = None
+                DEPENDENCY_INIT.observe(time.perf_counter() - start, dependency=self._name, phase="init")
+                log.info(f"依赖初始化完成：{self._name}，耗时{time.perf_counter() - start:.2f}秒")
+            return self._instance
+
+    def set(self, instance: Any):
+        """
+        直接指定实例（压测、调试时替换为桩）
+        """
+        with self._lock:
+            self._instance, self._error, self._warmed = instance, None, True
+
+    def warm_up(self) -> bool:
+        """
+        构造并预热，返回是否就绪。异常只记录，不抛出。已有预热在进行时不重复预热
+        """
+        if not self._warm_lock.acquire(blocking=False):
+            return self.status()["ready"]
+        try:
+            try:
+                instance = self.get()
+                if not self._warmed and self._warm is not None:
+                    start = time.perf_counter()
+                    self._warm(instance)
+                    DEPENDENCY_INIT.observe(time.perf_counter() - start, dependency=self._name, phase="warm")
+                self._warmed = True
+            except Exception as e:
+                log.error(f"依赖预热失败：{self._name}，{e}")
+            ready = self.status()["ready"]
+            self._warm_failures = 0 if ready else self._warm_failures + 1
+        finally:
+            self._warm_attempted_at = time.monotonic()
+            self._warm_lock.release()
+        DEPENDENCY_READY.set(1 if ready else 0, dependency=self._name)
+        return ready
+
+    def retry_warm_up(self) -> bool:
+        """
+        未就绪且距上次预热已超过退避间隔时，在后台线程中重新预热（不阻塞调用方）
+        :return: 是否发起了重新预热
+        """
+        if self._warm_lock.locked():
+            return False
+        backoff = min(DEPENDENCY_RETRY_S * 2 ** max(self._warm_failures - 1, 0), DEPENDENCY_RETRY_MAX_S)
+        if self._warm_attempted_at and time.monotonic() - self._warm_attempted_at < backoff:
+            return False
+        self._warm_attempted_at = time.monotonic()
+        log.info(f"重新预热依赖：{self._name}（第{self._warm_failures + 1}次）")
+        threading.Thread(target=self.warm_up, name=f"warm-up-{self._name}", daemon=True).start()
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        instance = self._instance
+        ready = instance is not None and (self._warmed or self._warm is None)
+        if ready and self._check is not None:
+            try:
+                ready = bool(self._check(instance))
+            except Exception:
+                ready = False
+        status = {"ready": ready, "initialized": instance is not None, "warmed": self._warmed}
+        if self._error is not None:
+            status["error"] = str(self._error)[:200]
+        return status
+
+    def __getattr__(self, item):
+        # 只在代理自身没有该属性时调用，转发给实例
+        if item.startswith("__"):
+            raise AttributeError(item)
+        return getattr(self.get(), item)
+
+    def __repr__(self):
+        return f"LazyDependency({self._name}, initialized={self._instance is not None})"
+
+
+def warm_up(dependencies: Iterable[LazyDependency], timeout: float = WARMUP_TIMEOUT) -> Dict[str, bool]:
+    """
+    并行构造并预热依赖，最多等待timeout秒
+    :return: 依赖名称 -> 是否就绪（超时未完成的为False）
+    """
+    dependencies = list(dependencies)
+    if not dependencies:
+        return {}
+    start = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=len(dependencies), thread_name_prefix="warm-up")
+    futures = {d._name: executor.submit(d.warm_up) for d in dependencies}
+    wait(futures.values(), timeout=timeout)
+    # 不等待超时的依赖，它们在后台线程中继续初始化
+    executor.shutdown(wait=False)
+    result = {name: f.done() and f.result() for name, f in futures.items()}
+    log.info(f"依赖预热完成，耗时{time.perf_counter() - start:.2f}秒：{result}")
+    return result
+
+
+def readiness(dependencies: Iterable[LazyDependency]) -> Tuple[bool, Dict[str, Dict[str, Any]]]:
+    """
+    汇总依赖状态，未就绪的依赖按退避间隔在后台重新预热（本次检查仍报告未就绪）
+    :return: (是否全部就绪, 依赖名称 -> 状态)
+    """
+    statuses = {}
+    for dependency in dependencies:
+        statuses[dependency._name] = dependency.status()
+        if not statuses[dependency._name]["ready"]:
+            dependency.retry_warm_up()
+    return all(s["ready"] for s in statuses.values()), statuses
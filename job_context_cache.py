@@ -0,0 +1,176 @@
+"""
+岗位信息缓存类：缓存只与岗位相关、与简历无关的信息（知识图谱信息、工具搜索结果等）
+同一岗位（岗位名称、岗位描述、其他信息归一化后相同）的任务共享同一份缓存。
+并发的同岗位任务只计算一次（single-flight）：
+    进程内：第一个任务计算，其余任务等待同一个Future
+    进程间：通过redis锁（SET NX）选出一个计算者，其余进程轮询等待结果
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from concurrent.futures import Future
+from typing import Callable, Dict
+
+from logger import get_logger
+from metrics import CACHE_REQUESTS
+from redis_client import RedisClient
+
+log = get_logger(__name__)
+
+# 只有锁的持有者才能释放锁
+_UNLOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class JobContextCache(object):
+    """
+    岗位信息缓存
+    """
+    def __init__(self, redis_client: RedisClient = None, ttl: int = 3600, lock_ttl: int = 120,
+                 wait_timeout: float = 120, poll_interval: float = 0.2):
+        """
+        :param redis_client: redis客户端，为空时新建
+        :param ttl: 缓存过期时间（秒）
+        :param lock_ttl: 计算锁过期时间（秒），防止计算者崩溃后其他进程一直等待
+        :param wait_timeout: 等待其他进程计算结果的最长时间（秒），超时后自行计算
+        :param poll_interval: 等待其他进程计算结果时的轮询间隔（秒）
+        """
+        self.redis_client = redis_client or RedisClient()
+        self.client = self.redis_client.client
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+
+        self._unlock = self.client.register_script(_UNLOCK_SCRIPT)
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+
+    @staticmethod
+    def job_key(job_name: str, job_description: str, more_info: str) -> str:
+        """
+        根据归一化后的岗位信息生成缓存键。全角/半角、大小写、多余空白不影响结果
+        """
+        parts = []
+        for text in (job_name, job_description, more_info):
+            text = unicodedata.normalize("NFKC", text or "").lower()
+            parts.append(re.sub(r"\s+", " ", text).strip())
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()[:32]
+
+    def get_or_compute(self, job_name: str, job_description: str, more_info: str,
+                       compute: Callable[[], Dict[str, str]]) -> Dict[str, str]:
+        """
+        获取岗位信息，缓存不存在时调用compute计算并写入缓存
+        :param compute: 计算岗位信息的函数，返回{字段名: 字符串}
+        :return: 岗位信息字典
+        """
+        key = self.job_key(job_name, job_description, more_info)
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if not leader:
+            CACHE_REQUESTS.inc(cache="job_context", result="hit")
+            log.info(f"等待同岗位任务的岗位信息计算结果。{key}")
+            return future.result()
+
+        try:
+            context = self._get_or_compute_shared(key, compute)
+            future.set_result(context)
+            return context
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _get_or_compute_shared(self, key: str, compute: Callable[[], Dict[str, str]]) -> Dict[str, str]:
+        """
+        跨进程的缓存读取和计算
+        """
+        cache_key = f"job_ctx:{key}"
+        lock_key = f"job_ctx_lock:{key}"
+
+        context = self._read(cache_key)
+        if context:
+            CACHE_REQUESTS.inc(cache="job_context", result="hit")
+            log.info(f"岗位信息缓存命中。{key}")
+            return context
+
+        token = uuid.uuid4().hex
+        deadline = time.time() + self.wait_timeout
+        while not self._try_lock(lock_key, token):
+            # 其他进程正在计算，等待其结果；锁消失但没有结果说明对方失败，重新抢锁
+            time.sleep(self.poll_interval)
+            context = self._read(cache_key)
+            if context:
+                CACHE_REQUESTS.inc(cache="job_context", result="hit")
+                log.info(f"岗位信息由其他进程计算完成。{key}")
+                return context
+            if time.time() >= deadline:
+                CACHE_REQUESTS.inc(cache="job_context", result="miss")
+                log.warning(f"等待岗位信息超时，自行计算。{key}")
+                return compute()
+
+        try:
+            # 抢到锁后再检查一次，避免刚好在上一次读取后写入
+            context = self._read(cache_key)
+            if context:
+                CACHE_REQUESTS.inc(cache="job_context", result="hit")
+                return context
+            CACHE_REQUESTS.inc(cache="job_context", result="miss")
+            context = compute()
+            self._write(cache_key, context)
+            log.info(f"岗位信息计算完成并写入缓存。{key}")
+            return context
+        finally:
+            try:
+                self._unlock(keys=[lock_key], args=[token])
+            except Exception as e:
+                log.error(f"岗位信息计算锁释放失败。{key}，错误：{e}")
+
+    def _try_lock(self, lock_key: str, token: str) -> bool:
+        try:
+            return bool(self.client.set(lock_key, token, nx=True, ex=self.lock_ttl))
+        except Exception as e:
+            # redis不可用时不阻塞任务，直接自行计算
+            log.error(f"岗位信息计算锁获取失败：{e}")
+            return True
+
+    def _read(self, cache_key: str) -> Dict[str, str]:
+        try:
+            return self.client.hgetall(cache_key)
+        except Exception as e:
+            log.error(f"岗位信息缓存读取失败：{e}")
+            return {}
+
+    def _write(self, cache_key: str, context: Dict[str, str]):
+        if not context:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=True)
+            pipe.hset(cache_key, mapping=context)
+            pipe.expire(cache_key, self.ttl)
+            pipe.execute()
+        except Exception as e:
+            log.error(f"岗位信息缓存写入失败：{e}")
+
+
+if __name__ == "__main__":
+    cache = JobContextCache(ttl=60)
+    print(cache.job_key("数据分析师", "  负责  数据分析 ", "ＡＢＣ公司"))
+    print(cache.job_key("数据分析师", "负责 数据分析", "abc公司"))
+    print(cache.get_or_compute("数据分析师", "负责数据分析", "abc公司",
+                               lambda: {"kg_info": "SQL Python", "tools_reply_else": "暂无"}))
@@ -1,17 +1,164 @@
 """
 日志类
+业务线程只把日志记录放入内存队列（QueueHandler），格式化、脱敏和写出由后台线程（QueueListener）完成，不阻塞请求。
+环境变量：
+    LOG_LEVEL           全局日志级别，默认INFO
+    LOG_FORMAT          json（默认，每行一个JSON，包含task_id）或text
+    LOG_FILE            日志文件路径，为空时只输出到控制台
+    LOG_MODULE_LEVELS   按模块设置级别，如 "KnowledgeGraph.KgUser=WARNING,httpx=WARNING"
+    LOG_SAMPLE_RATES    按模块对INFO及以下日志采样，如 "ResumeOptimization=0.1"。WARNING及以上不采样
+    LOG_MAX_CHARS       单条日志消息的最大字符数，超出部分截断，默认500
 """
+import atexit
+import contextvars
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import time
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    # filename='开发日志.log',  # 日志文件名称（默认在项目根目录）
-    # filemode='a'  # 写入模式：a=追加（默认），w=覆盖
-)
+# 当前处理的任务ID（用于日志和链路追踪）。线程池中需使用contextvars.copy_context()传递
+current_task_id: contextvars.ContextVar[str] = contextvars.ContextVar("current_task_id", default="")
+
+LOG_MAX_CHARS = int(os.getenv("LOG_MAX_CHARS", "500"))
+
+# 脱敏规则：简历文本中的手机号、邮箱、身份证号，以及接口密钥
+_REDACT_RULES = [
+    (re.compile(r"sk-[A-Za-z0-9]{16,}"), "sk-***"),
+    (re.compile(r"(?<!\d)\d{17}[\dXx](?!\d)"), "***身份证号***"),
+    (re.compile(r"(?<!\d)1[3-9]\d{9}(?!\d)"), "***手机号***"),
+    (re.compile(r"[\w.+-]+@[\w-]+(\.[\w-]+)+"), "***邮箱***"),
+]
+
+
+def redact(text: str) -> str:
+    """
+    脱敏：替换手机号、邮箱、身份证号和接口密钥
+    """
+    for pattern, replacement in _REDACT_RULES:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _parse_mapping(value: str) -> dict:
+    """
+    解析 "a=1,b=2" 形式的环境变量
+    """
+    mapping = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            name, setting = item.split("=", 1)
+            mapping[name.strip()] = setting.strip()
+    return mapping
+
+
+def _lookup(mapping: dict, name: str):
+    """
+    按模块名最长前缀匹配，如ResumeOptimization同时作用于ResumeOptimization.xxx
+    """
+    while name:
+        if name in mapping:
+            return mapping[name]
+        name = name.rpartition(".")[0]
+    return mapping.get("root")
+
+
+class _ContextFilter(logging.Filter):
+    """
+    在业务线程中执行：按模块采样，补充task_id，截断过长的消息
+    """
+    def __init__(self, sample_rates: dict):
+        super().__init__()
+        self.sample_rates = sample_rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.sample_rates and record.levelno <= logging.INFO:
+            rate = _lookup(self.sample_rates, record.name)
+            if rate is not None and random.random() >= rate:
+                return False
+        record.task_id = current_task_id.get()
+        message = record.getMessage()
+        if len(message) > LOG_MAX_CHARS:
+            message = f"{message[:LOG_MAX_CHARS]}...（截断，共{len(message)}字符）"
+        record.msg, record.args = message, None
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    只做最少的工作（消息已在过滤器中生成），格式化留给后台线程
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    每条日志输出为一行JSON
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record.created))
+                    + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "task_id": getattr(record, "task_id", ""),
+            "message": redact(record.getMessage()),
+        }
+        if record.exc_text:
+            data["exception"] = redact(record.exc_text)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    文本格式，消息同样脱敏
+    """
+    def __init__(self):
+        super().__init__('%(asctime)s - %(levelname)s - %(task_id)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, "task_id"):
+            record.task_id = ""
+        return redact(super().format(record))
+
+
+def _setup():
+    formatter = JsonFormatter() if os.getenv("LOG_FORMAT", "json").lower() == "json" else TextFormatter()
+    handlers = [logging.StreamHandler(sys.stderr)]
+    log_file = os.getenv("LOG_FILE")
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(_ContextFilter({k: float(v) for k, v in
+                                            _parse_mapping(os.getenv("LOG_SAMPLE_RATES")).items()}))
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    for name, level in _parse_mapping(os.getenv("LOG_MODULE_LEVELS")).items():
+        logging.getLogger(name).setLevel(level.upper())
+    return listener
+
+
+_listener = _setup()
 
 def get_logger(name=None):
     """获取配置好的logger"""
     return logging.getLogger(name)
-
@@ -3,23 +3,44 @@
 进入网页：http://127.0.0.1:8000/docs
 """
 import io
-import threading
+import os
+import zipfile
 from datetime import datetime
 from urllib.parse import unquote
-from typing import Optional
+from typing import List, Optional
 import pdfplumber
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
+import threading
 import time
+from contextlib import asynccontextmanager
+
+from dependencies import LazyDependency, warm_up, readiness
+from logger import get_logger, current_task_id
+from metrics import REGISTRY, CONTENT_TYPE, render as render_metrics
+from tracing import init_tracing, astage, inject_context, tracer
+from redis_client import RedisClient, AsyncRedisClient, RES_FIELDS, join_res_fields
+from task_scheduler import TaskScheduler, ADMIT_QUEUE_FULL
+from task_id import TaskIDGenerator
+from task_state import TaskStateStore, STATE_PARSING, STATE_FAILED, STATE_QUEUED, STATE_DONE, FINAL_STATES
+from chat_session import ChatSessionStore
+from semantic_cache import SemanticCache
 
-from LLMs.deepseekUser import deepseekUser
-from LLMs.KimiUser import KimiUser
-from logger import get_logger
-from redis_client import RedisClient
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 后台并行预热依赖，不阻塞服务启动；预热完成前GET /ready返回503
+    threading.Thread(target=warm_up, args=(API_DEPENDENCIES,), name="warm-up", daemon=True).start()
+    yield
+    # 释放节点号租约，重启后的进程可立即复用
+    task_id_generator.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -36,8 +57,22 @@ app.add_middleware(
 
 log = get_logger(__name__)
 rc = RedisClient()
-deepseek = deepseekUser()
-kimi = KimiUser()
+arc = AsyncRedisClient()
+scheduler = TaskScheduler(rc)
+chat_sessions = ChatSessionStore(rc)
+task_states = TaskStateStore(rc)
+init_tracing("resume-api", rc)
+REGISTRY.register_collector(scheduler.export_metrics)
+# 语义回答缓存（可选）：环境变量SEMANTIC_CACHE_ENABLED=1时启用，SEMANTIC_CACHE_THRESHOLD为相似度阈值
+semantic_cache = SemanticCache(rc, threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))) \
+    if os.getenv("SEMANTIC_CACHE_ENABLED", "0") == "1" else None
+# 大模型客户端在首次使用时才导入和构造（见dependencies）
+kimi = LazyDependency("kimi", "LLMs.KimiUser:KimiUser")
+API_DEPENDENCIES = [kimi]
+if semantic_cache is not None:
+    # 语义缓存启用时预热向量模型，避免第一个聊天请求承担模型加载时间
+    API_DEPENDENCIES.append(LazyDependency("embedding", "KnowledgeSystem.KsEmbedding:get_embedding_service",
+                                           warm=lambda service: service.embed(["简历"], persist=False)))
 
 class ResumeOptimization(BaseModel):
     """
@@ -61,46 +96,119 @@ class ResumeOptimization_chat(BaseModel):
 
 task_texts = [["简历打分+优化任务",1],["简历打分_聊天",2],["面试题目生成",3],["面试题目生成_聊天",4]]
 
-class TaskIDGenerator:
-    def __init__(self):
-        self._lock = threading.Lock()
-        self.task_counter = 0
-        self.current_hour = datetime.now().strftime("%Y%m%d%H")
+# 任务ID：多进程、多节点不重复，按时间有序，见task_id.py
+task_id_generator = TaskIDGenerator(rc)
+
+# 单个批量任务最多包含的简历数
+MAX_BATCH_FILES = 500
+# 上传限制：单个文件（pdf或zip）的字节数，批量请求的总字节数（含zip解压后的pdf），
+# zip内的条目数和解压后的总字节数（防止压缩炸弹）
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_BATCH_UPLOAD_BYTES = int(os.getenv("MAX_BATCH_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+MAX_ZIP_ENTRIES = int(os.getenv("MAX_ZIP_ENTRIES", "1000"))
+MAX_ZIP_UNCOMPRESSED_BYTES = int(os.getenv("MAX_ZIP_UNCOMPRESSED_BYTES", str(200 * 1024 * 1024)))
+_READ_CHUNK_BYTES = 1024 * 1024
 
-    def generate_task_id(self) -> str:
-        """
-        生成任务ID
-        格式：年月日时分秒 + 8位数字编号
-        8位数字编号每小时重置，达到上限99999999时立即更新
-        """
 
-        # 获取当前时间
-        now = datetime.now()
-        current_time_str = now.strftime("%Y%m%d%H%M%S")
-        current_hour_str = now.strftime("%Y%m%d%H")
+def _extract_pdf_text(pdf_content: bytes) -> str:
+    """
+    提取pdf全部文本
+    :param pdf_content: pdf文件内容
+    :return: pdf文本
+    """
+    pdf_text = ""
+    with pdfplumber.open(io.BytesIO(pdf_content)) as pdf:
+        for page in pdf.pages:
+            page_text = page.extract_text()
+            if page_text:
+                pdf_text += page_text + "\n"
+    return pdf_text
 
-        # 检查是否需要重置计数器（新小时或达到上限）
-        if current_hour_str != self.current_hour or self.task_counter >= 99999999:
-            self.task_counter = 0
-            self.current_hour = current_hour_str
 
-        # 生成8位数字编号，前面补零
-        task_number = str(self.task_counter).zfill(8)
-        self.task_counter += 1
+def _check_content_length(request: Request, limit: int):
+    """
+    按请求头Content-Length提前拒绝过大的上传
+    """
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > limit:
+        raise HTTPException(status_code=413, detail=f"上传内容超过{limit // (1024 * 1024)}MB")
+
 
-        task_id = current_time_str + task_number
-        return task_id
+async def _read_upload(file: UploadFile, limit: int = MAX_UPLOAD_BYTES) -> bytes:
+    """
+    读取上传文件，超过limit字节时返回413。已知大小的文件在读取前检查，否则分块读取，超出时立即停止
+    """
+    if file.size is not None and file.size > limit:
+        raise HTTPException(status_code=413, detail=f"文件{file.filename}超过{limit // (1024 * 1024)}MB")
+    chunks, size = [], 0
+    while True:
+        chunk = await file.read(_READ_CHUNK_BYTES)
+        if not chunk:
+            return b"".join(chunks)
+        size += len(chunk)
+        if size > limit:
+            raise HTTPException(status_code=413, detail=f"文件{file.filename}超过{limit // (1024 * 1024)}MB")
+        chunks.append(chunk)
+
+
+def _extract_zip_pdfs(file_name: str, content: bytes) -> List[tuple]:
+    """
+    解压zip中的pdf。条目数、单个pdf大小和解压后的总大小超出限制时返回413，
+    大小以ZipInfo.file_size在解压前检查，并在解压时按实际读出的字节数再次检查（file_size可被伪造）
+    :return: [(文件名, pdf内容)]
+    """
+    try:
+        with zipfile.ZipFile(io.BytesIO(content)) as zf:
+            infos = zf.infolist()
+            if len(infos) > MAX_ZIP_ENTRIES:
+                raise HTTPException(status_code=413, detail=f"zip文件{file_name}的条目数超过{MAX_ZIP_ENTRIES}")
+            infos = [i for i in infos if not i.is_dir() and i.filename.lower().endswith(".pdf")
+                     and not i.filename.startswith("__MACOSX/")]
+            if sum(i.file_size for i in infos) > MAX_ZIP_UNCOMPRESSED_BYTES \
+                    or any(i.file_size > MAX_UPLOAD_BYTES for i in infos):
+                raise HTTPException(status_code=413, detail=f"zip文件{file_name}解压后超过大小限制")
+            pdf_files, total = [], 0
+            for info in infos:
+                with zf.open(info) as f:
+                    data = f.read(MAX_UPLOAD_BYTES + 1)
+                total += len(data)
+                if len(data) > MAX_UPLOAD_BYTES or total > MAX_ZIP_UNCOMPRESSED_BYTES:
+                    raise HTTPException(status_code=413, detail=f"zip文件{file_name}解压后超过大小限制")
+                pdf_files.append((info.filename.rsplit("/", 1)[-1], data))
+            return pdf_files
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, NotImplementedError) as e:
+        raise HTTPException(status_code=400, detail=f"zip文件解析失败: {file_name}, {str(e)}")
+
+
+def _reject(admission: dict) -> JSONResponse:
+    """
+    未通过准入控制：返回429，Retry-After为建议的重试间隔（秒），estimated_wait为按最近处理速度估算的排队等待时间（秒）
+    """
+    message = "当前排队任务已满，请稍后再试" if admission["reason"] == ADMIT_QUEUE_FULL else "提交过于频繁，请稍后再试"
+    return JSONResponse(
+        {"status": "error", "message": message, "reason": admission["reason"], "queue_depth": admission["depth"],
+         "retry_after": admission["retry_after"], "estimated_wait": admission["estimated_wait"]},
+        status_code=429, headers={"Retry-After": str(admission["retry_after"])})
+
+
+async def _release(admission: dict, task_type: int, count: int = 1):
+    """
+    归还准入时预占但未入队的排队名额
+    """
+    if admission["reserved"]:
+        await run_in_threadpool(scheduler.release, task_type, count)
 
-task_id_generator = TaskIDGenerator()
 
 @app.post("/resume_optimization")
 async def resume_optimization(
+        request: Request,
         # response_model:ResumeOptimization,
         file:UploadFile = File(...),
         job_name: str = Form("", description="岗位名称"),
         job_description: str = Form("", description="岗位描述"),
         more_info: str = Form("", description="其他信息"),
-        user_request: str = Form("", description="用户备注")
+        user_request: str = Form("", description="用户备注"),
+        tenant_id: str = Form("", description="租户标识（为空时使用客户端IP）")
 ):
 
     log.info(f"{task_texts[0][0]}方法开始运行")
@@ -117,85 +225,271 @@ async def resume_optimization(
     # user_request = unquote(user_request)
 
     log.info("信息接收完成")
-    pdf_content = await file.read()
-
-    pdf_text = ""
-    try:
-        with pdfplumber.open(io.BytesIO(pdf_content)) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    pdf_text += page_text + "\n"
-    except Exception as e:
-        log.error(f"PDF解析失败: {e}")
-        raise HTTPException(status_code=400, detail=f"PDF文件解析失败: {str(e)}")
-
-    if not pdf_text.strip():
-        raise HTTPException(status_code=400, detail="无法从PDF中提取文本内容")
-
-    pdf_name = file.filename
-    # task_id:str 年月日时分秒+8位数字编号。8位数字编号默认每小时重置（默认00000000），若达到上限（99999999）则立即更新。累加。
+    # 留出表单字段的余量
+    _check_content_length(request, MAX_UPLOAD_BYTES + _READ_CHUNK_BYTES)
+    # 准入控制：排队已满或超出租户限速时直接返回429，不解析pdf、不入队
+    tenant = tenant_id or (request.client.host if request.client else "")
+    admission = await run_in_threadpool(scheduler.admit, task_texts[0][1], tenant)
+    if not admission["admitted"]:
+        return _reject(admission)
+
+    # task_id:str 年月日时分秒+毫秒+节点号+序号，见task_id.py
+    # 在解析pdf前生成，使pdf解析阶段的耗时可归属到该任务
     task_id = task_id_generator.generate_task_id()
+    current_task_id.set(task_id)
     log.info("task_id:"+task_id)
 
-    current_date = datetime.now().strftime("%Y-%m-%d")
-
-    # task_info:任务内容
-    task_info = {"pdf全部文本":pdf_text+"当前时间："+current_date, "岗位名称":job_name, "岗位描述":job_description, "其他信息":more_info,
-                 "用户备注":user_request}
-    # log.info("简历名称："+pdf_name+"岗位名称:"+job_name+"岗位描述:"+job_description+"其他信息:"+more_info+"用户备注:"+user_request)
-
-    # text:任务名称
-    # task_type:任务类型编号
-    task_queue = {"task_id": task_id, "task_info": task_info, "text": task_texts[0][0], "task_type": task_texts[0][1]}
-    log.info(f"任务上传成功。任务类型{task_texts[0][0]}。任务类型编号{task_texts[0][1]}")
-
-    result = rc.pushQueue_RO(task_queue)
-    if result:
-        queue_length = rc.get_queue_length()
+    with tracer.start_as_current_span("api_submit", attributes={"task_id": task_id}):
+        try:
+            pdf_content = await _read_upload(file)
+        except HTTPException:
+            await _release(admission, task_texts[0][1])
+            raise
+        await run_in_threadpool(task_states.update, task_id, STATE_PARSING)
+
+        try:
+            async with astage("pdf_parse", bytes=len(pdf_content)):
+                pdf_text = await run_in_threadpool(_extract_pdf_text, pdf_content)
+        except Exception as e:
+            log.error(f"PDF解析失败: {e}")
+            await _release(admission, task_texts[0][1])
+            await run_in_threadpool(task_states.update, task_id, STATE_FAILED, error="PDF文件解析失败")
+            raise HTTPException(status_code=400, detail=f"PDF文件解析失败: {str(e)}")
+
+        if not pdf_text.strip():
+            await _release(admission, task_texts[0][1])
+            await run_in_threadpool(task_states.update, task_id, STATE_FAILED, error="无法从PDF中提取文本内容")
+            raise HTTPException(status_code=400, detail="无法从PDF中提取文本内容")
+
+        pdf_name = file.filename
+
+        current_date = datetime.now().strftime("%Y-%m-%d")
+
+        # task_info:任务内容
+        task_info = {"pdf全部文本":pdf_text+"当前时间："+current_date, "岗位名称":job_name, "岗位描述":job_description, "其他信息":more_info,
+                     "用户备注":user_request}
+        # log.info("简历名称："+pdf_name+"岗位名称:"+job_name+"岗位描述:"+job_description+"其他信息:"+more_info+"用户备注:"+user_request)
+
+        # text:任务名称
+        # task_type:任务类型编号
+        # trace_context:追踪上下文，工作进程据此将处理阶段挂在同一条链路下
+        task_queue = {"task_id": task_id, "task_info": task_info, "text": task_texts[0][0], "task_type": task_texts[0][1],
+                      "trace_context": inject_context()}
+        log.info(f"任务上传成功。任务类型{task_texts[0][0]}。任务类型编号{task_texts[0][1]}")
+
+        async with astage("enqueue"):
+            queue_length = await run_in_threadpool(scheduler.push, task_queue, tenant=tenant,
+                                                   reserved=admission["reserved"])
+    if queue_length:
         log.info(f"任务{task_texts[0][1]}提交成功 - 任务ID: {task_id}, 队列位置: {queue_length}")
         return {"status": "success", "message": task_id}
     else:
         log.error(f"任务{task_texts[0][1]}提交失败")
+        await _release(admission, task_texts[0][1])
         raise HTTPException(status_code=500, detail=f"任务{task_texts[0][1]}提交失败")
 
 
+@app.post("/resume_optimization_batch")
+async def resume_optimization_batch(
+        request: Request,
+        files: List[UploadFile] = File(..., description="多个pdf简历或包含pdf简历的zip压缩包"),
+        job_name: str = Form("", description="岗位名称"),
+        job_description: str = Form("", description="岗位描述"),
+        more_info: str = Form("", description="其他信息"),
+        user_request: str = Form("", description="用户备注"),
+        tenant_id: str = Form("", description="租户标识（为空时使用客户端IP）")
+):
+    """
+    批量简历打分+优化：同一岗位下的多份简历。岗位相关的知识图谱、搜索等信息由同批次子任务共享，只计算一次
+    :return: 批量任务ID及子任务列表
+    """
+    log.info(f"批量{task_texts[0][0]}方法开始运行")
+
+    _check_content_length(request, MAX_BATCH_UPLOAD_BYTES)
+    # 展开上传文件：pdf直接使用，zip解压出其中的pdf
+    pdf_files = []
+    total_bytes = 0
+    for file in files:
+        content = await _read_upload(file)
+        if (file.filename or "").lower().endswith(".zip"):
+            extracted = await run_in_threadpool(_extract_zip_pdfs, file.filename, content)
+        else:
+            extracted = [(file.filename, content)]
+        pdf_files.extend(extracted)
+        total_bytes += sum(len(c) for _, c in extracted)
+        if len(pdf_files) > MAX_BATCH_FILES:
+            raise HTTPException(status_code=400, detail=f"单个批量任务最多{MAX_BATCH_FILES}份简历")
+        if total_bytes > MAX_BATCH_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"上传内容超过{MAX_BATCH_UPLOAD_BYTES // (1024 * 1024)}MB")
+
+    if not pdf_files:
+        raise HTTPException(status_code=400, detail="未找到pdf简历文件")
+
+    # 准入控制：按简历数预占排队名额，整批通过或整批拒绝
+    tenant = tenant_id or (request.client.host if request.client else "")
+    admission = await run_in_threadpool(scheduler.admit, task_texts[0][1], tenant, len(pdf_files))
+    if not admission["admitted"]:
+        return _reject(admission)
+
+    batch_id = "B" + task_id_generator.generate_task_id()
+    current_date = datetime.now().strftime("%Y-%m-%d")
+    task_queues = []
+    children = []
+    rejected = []
+    for pdf_name, pdf_content in pdf_files:
+        # 每个子任务一条链路，pdf解析阶段归属到子任务
+        task_id = task_id_generator.generate_task_id()
+        current_task_id.set(task_id)
+        with tracer.start_as_current_span("api_submit", attributes={"task_id": task_id, "batch_id": batch_id}):
+            try:
+                async with astage("pdf_parse", bytes=len(pdf_content)):
+                    pdf_text = await run_in_threadpool(_extract_pdf_text, pdf_content)
+            except Exception as e:
+                log.error(f"PDF解析失败: {pdf_name}, {e}")
+                rejected.append({"file_name": pdf_name, "error": f"PDF文件解析失败: {str(e)}"})
+                continue
+            if not pdf_text.strip():
+                rejected.append({"file_name": pdf_name, "error": "无法从PDF中提取文本内容"})
+                continue
+
+            task_info = {"pdf全部文本": pdf_text + "当前时间：" + current_date, "岗位名称": job_name,
+                         "岗位描述": job_description, "其他信息": more_info, "用户备注": user_request}
+            task_queues.append({"task_id": task_id, "task_info": task_info, "text": task_texts[0][0],
+                                "task_type": task_texts[0][1], "batch_id": batch_id,
+                                "trace_context": inject_context()})
+            children.append({"task_id": task_id, "file_name": pdf_name})
+    current_task_id.set("")
+
+    # 解析失败的简历不入队，归还其预占的名额
+    await _release(admission, task_texts[0][1], len(pdf_files) - len(task_queues))
+    if not task_queues:
+        raise HTTPException(status_code=400, detail={"message": "没有可处理的简历", "rejected": rejected})
+
+    batch_info = {"job_name": job_name, "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    if not await run_in_threadpool(rc.create_batch, batch_id, batch_info, children):
+        await _release(admission, task_texts[0][1], len(task_queues))
+        raise HTTPException(status_code=500, detail="批量任务创建失败")
+
+    queue_length = await run_in_threadpool(scheduler.push_many, task_queues, tenant=tenant,
+                                           reserved=admission["reserved"])
+    if not queue_length:
+        log.error(f"批量任务提交失败 - 批量任务ID: {batch_id}")
+        await _release(admission, task_texts[0][1], len(task_queues))
+        raise HTTPException(status_code=500, detail="批量任务提交失败")
+
+    log.info(f"批量任务提交成功 - 批量任务ID: {batch_id}, 子任务数: {len(children)}, 队列位置: {queue_length}")
+    return {"status": "success", "message": batch_id, "tasks": children, "rejected": rejected}
+
+
+@app.post("/get_resume_optimization_batch_result")
+async def resume_optimization_batch_result(
+        batch_id: str = Form("", description="批量任务id"),
+):
+    """
+    获取批量任务进度及汇总结果。子任务的完整结果通过/get_resume_optimization_result按task_id获取
+    :param batch_id: 批量任务ID
+    :return: 进度（总数、完成数、失败数）及各子任务的状态和分数
+    """
+    if not batch_id or not batch_id.strip():
+        return {"status": "error", "message": "批量任务ID不能为空"}
+
+    info, children = await arc.get_batch(batch_id)
+    if not info:
+        return {"status": "not_found", "message": f"批量任务ID不存在: {batch_id}", "batch_id": batch_id}
+
+    # 只取出各子任务结果的分数字段；没有结果的子任务按任务状态判断是失败、排队还是处理中
+    task_ids = [c["task_id"] for c in children]
+    results = await arc.get_res_field_many(task_ids, "score")
+    pending = [i for i, score in enumerate(results) if score is None]
+    states = dict(zip(pending, await task_states.get_many_async(arc.client, [task_ids[i] for i in pending])))
+    tasks = []
+    scores = []
+    for i, (child, score) in enumerate(zip(children, results)):
+        if score is None:
+            state = states[i] or {}
+            if state.get("state") == STATE_FAILED:
+                tasks.append({**child, "status": "failed", "state": STATE_FAILED, "score": None,
+                              "error": state.get("error") or "任务处理失败"})
+            else:
+                tasks.append({**child, "status": "processing", "state": state.get("state") or STATE_QUEUED,
+                              "score": None})
+            continue
+        score = int(score) if score else None
+        if score is not None:
+            scores.append(score)
+        tasks.append({**child, "status": "success", "state": STATE_DONE, "score": score})
+
+    # 进度按各子任务的状态统计，与子任务列表一致
+    total = len(tasks)
+    done = sum(1 for t in tasks if t["status"] == "success")
+    failed = sum(1 for t in tasks if t["status"] == "failed")
+    return {
+        "status": "success" if done + failed >= total else "processing",
+        "batch_id": batch_id,
+        "message": {
+            "job_name": info.get("job_name", ""),
+            "created_at": info.get("created_at", ""),
+            "total": total,
+            "done": done,
+            "failed": failed,
+            "progress": round((done + failed) / total, 4) if total else 1.0,
+            "score_avg": round(sum(scores) / len(scores), 2) if scores else None,
+            "score_max": max(scores) if scores else None,
+            "score_min": min(scores) if scores else None,
+            "tasks": sorted(tasks, key=lambda t: -1 if t["score"] is None else t["score"], reverse=True),
+        }
+    }
+
+
 @app.post("/get_resume_optimization_result")
 async def resume_optimization_chat(
         task_id: str = Form("", description="任务id"),
+        fields: str = Form("", description="需要返回的结果字段，逗号分隔，可选score,suggestions,resume,meta。"
+                                           "为空时返回完整结果字符串"),
 ):
     """
     获取简历优化任务结果
     :param task_id: 任务ID
+    :param fields: 需要返回的结果字段。指定时message为{字段: 值}，只传输所需字段
     :return: 任务处理结果
     """
     if not task_id or not task_id.strip():
         return {"status": "error", "message": "任务ID不能为空"}
 
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in RES_FIELDS]
+    if unknown:
+        return {"status": "error", "message": f"未知的结果字段: {','.join(unknown)}", "task_id": task_id}
+
     log.info(f"查询任务结果 - 任务ID: {task_id}")
 
     try:
         # 直接获取任务结果
-        result = rc.get_res(task_id)
+        result = await arc.get_res_fields(task_id, requested or ["suggestions", "resume"])
 
-        # 关键修复：严格判断结果是否有效（非空且不是"暂无"）
-        if result and result.strip() and result.strip() != "暂无":
+        if result:
             log.info(f"任务结果获取成功 - 任务ID: {task_id}")
-            log.info(f"任务结果获取成功 - 结果： {result[:50]}...")  # 只打印前50字符，避免日志过长
             return {
                 "status": "success",
-                "message": result,
-                "task_id": task_id
-            }
-        else:
-            # 结果为空或"暂无"，表示任务仍在处理中
-            log.warning(f"任务未完成或结果未生成 - 任务ID: {task_id}")
-            return {
-                "status": "processing",
-                "message": "任务仍在处理中，请稍后重试",
+                "message": result if requested else join_res_fields(result),
                 "task_id": task_id
             }
 
+        # 结果不存在：根据任务状态区分任务不存在、失败和处理中
+        state = await task_states.get_async(arc.client, task_id)
+        if state is None:
+            return {"status": "not_found", "message": f"任务ID不存在: {task_id}", "task_id": task_id}
+        if state["state"] == STATE_FAILED:
+            return {"status": "failed", "message": state.get("error", "任务处理失败"), "task_id": task_id}
+        log.info(f"任务未完成 - 任务ID: {task_id}, 状态: {state['state']}")
+        return {
+            "status": "processing",
+            "message": "任务仍在处理中，请稍后重试",
+            "state": state["state"],
+            "retry_after": _retry_after(state),
+            "task_id": task_id
+        }
+
     except Exception as e:
         log.error(f"查询任务结果时发生错误 - 任务ID: {task_id}, 错误: {e}")
         if "not found" in str(e).lower() or "不存在" in str(e):
@@ -211,17 +505,108 @@ async def resume_optimization_chat(
                 "task_id": task_id
             }
 
+@app.get("/queue_stats")
+async def queue_stats():
+    """
+    获取各任务类型的排队数及排队等待时间分位数（毫秒）
+    """
+    try:
+        stats = await run_in_threadpool(scheduler.get_wait_percentiles)
+        return {"status": "success",
+                "message": {task_text: stats.get(task_type, {}) for task_text, task_type in task_texts}}
+    except Exception as e:
+        log.error(f"获取队列统计失败: {e}")
+        return {"status": "error", "message": str(e)}
+
+def _retry_after(state: dict) -> int:
+    """
+    建议的下次查询间隔（秒）：排队时按排队位置估计，处理中每2秒，已结束时为0
+    """
+    if state["state"] in FINAL_STATES:
+        return 0
+    if state["state"] == STATE_QUEUED:
+        return min(30, 2 + state.get("queue_position", 1))
+    return 2
+
+
+@app.post("/get_task_status")
+async def get_task_status(task_id: str = Form("", description="任务id")):
+    """
+    获取任务状态：parsing/queued/cleaning/retrieving/generating/done/failed，
+    以及进入各状态的时间戳、排队位置（排队中时）、失败原因和建议的下次查询间隔（秒）
+    """
+    if not task_id or not task_id.strip():
+        return {"status": "error", "message": "任务ID不能为空"}
+    try:
+        state = await task_states.get_async(arc.client, task_id)
+        if state is None:
+            return {"status": "not_found", "message": f"任务ID不存在: {task_id}", "task_id": task_id}
+        state["retry_after"] = _retry_after(state)
+        return {"status": "success", "message": state, "task_id": task_id}
+    except Exception as e:
+        log.error(f"获取任务状态失败 - 任务ID: {task_id}, 错误: {e}")
+        return {"status": "error", "message": str(e), "task_id": task_id}
+
+@app.post("/get_task_trace")
+async def get_task_trace(task_id: str = Form("", description="任务id")):
+    """
+    获取任务各阶段耗时（毫秒）：pdf_parse、enqueue、queue_wait、clean、keyword_extract、ks_search、
+    job_context、kg_search、web_search_resume、web_search_else、llm_generate、result_write
+    """
+    if not task_id or not task_id.strip():
+        return {"status": "error", "message": "任务ID不能为空"}
+    try:
+        stages = await arc.client.hgetall(f"task_trace:{task_id}")
+        if not stages:
+            return {"status": "error", "message": "暂无该任务的耗时记录", "task_id": task_id}
+        return {"status": "success", "message": {k: float(v) for k, v in stages.items()}, "task_id": task_id}
+    except Exception as e:
+        log.error(f"获取任务耗时失败 - 任务ID: {task_id}, 错误: {e}")
+        return {"status": "error", "message": str(e), "task_id": task_id}
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus格式的监控指标：队列深度、入队/出队数、各阶段耗时、大模型tokens及费用、缓存命中、ChromaDB查询耗时、各阶段失败数
+    """
+    return Response(content=await run_in_threadpool(render_metrics), media_type=CONTENT_TYPE)
+
+@app.get("/ready")
+async def ready():
+    """
+    就绪检查：redis可用且依赖（大模型客户端，启用语义缓存时包括向量模型）已初始化并预热时返回200，否则返回503
+    """
+    redis_ready = await arc.ping()
+    dependencies_ready, detail = readiness(API_DEPENDENCIES)
+    detail["redis"] = {"ready": redis_ready}
+    is_ready = redis_ready and dependencies_ready
+    return JSONResponse({"status": "success" if is_ready else "error", "message": detail},
+                        status_code=200 if is_ready else 503)
+
+@app.get("/semantic_cache_stats")
+async def semantic_cache_stats():
+    """
+    获取语义回答缓存的命中次数和命中率
+    """
+    if semantic_cache is None:
+        return {"status": "error", "message": "语义回答缓存未启用"}
+    return {"status": "success", "message": await run_in_threadpool(semantic_cache.stats)}
+
 @app.post("/resume_optimization_chat")
 async def resume_optimization_chat(
-        history_chat_record: str = Form("", description="历史聊天信息"),
+        task_id: str = Form("", description="简历打分+优化任务id。传入时使用服务端聊天会话，只需上传用户提示词"),
+        history_chat_record: str = Form("", description="历史聊天信息（未传入task_id时使用）"),
         user_prompt: str = Form("", description="用户提示词"),
-        res_opt_record: str = Form("", description="简历打分优化任务处理结果"),
+        res_opt_record: str = Form("", description="简历打分优化任务处理结果（未传入task_id时使用）"),
 ):
     log.info("聊天方法开始运行")
     current_date = datetime.now().strftime("%Y-%m-%d")
-    log.info(history_chat_record)
-    log.info(user_prompt+"当前时间："+current_date)
-    log.info(res_opt_record)
+
+    if task_id:
+        return await _session_chat(task_id, user_prompt, current_date)
+
+    log.info(f"聊天输入长度：历史聊天信息{len(history_chat_record)}，用户提示词{len(user_prompt)}，"
+             f"简历打分+优化结果{len(res_opt_record)}")
     try:
         time.sleep(6)  # 模拟处理时间
         res = "聊天内容"
@@ -233,6 +618,33 @@ async def resume_optimization_chat(
         return {"status": "error", "message": str(e)}
 
 
+async def _session_chat(task_id: str, user_prompt: str, current_date: str) -> dict:
+    """
+    基于服务端聊天会话的聊天：简历打分+优化结果和历史聊天记录都保存在服务端。
+    启用语义回答缓存时，语义相近的问题直接返回之前的回答
+    """
+    user_prompt_dated = user_prompt + "当前时间：" + current_date
+    try:
+        session = await run_in_threadpool(chat_sessions.load, task_id)
+        if session is None:
+            return {"status": "not_found", "message": f"任务ID不存在或任务未完成: {task_id}", "task_id": task_id}
+
+        res, embedding = None, None
+        if semantic_cache is not None:
+            res, embedding = await run_in_threadpool(semantic_cache.lookup, task_id, user_prompt)
+        if res is None:
+            res = await run_in_threadpool(kimi.kimi_resume_optimization_session_chat, session["res_opt_record"],
+                                          session["summary"], session["history"], user_prompt_dated)
+            if semantic_cache is not None:
+                await run_in_threadpool(semantic_cache.store, task_id, user_prompt, res, embedding)
+        await run_in_threadpool(chat_sessions.append_turn, task_id, session, user_prompt_dated, res,
+                                kimi.kimi_chat_history_summary)
+        log.info(f"会话聊天方法成功 - 任务ID: {task_id}")
+        return {"status": "success", "message": res, "task_id": task_id}
+    except Exception as e:
+        log.error(f"会话聊天方法失败 - 任务ID: {task_id}。{e}")
+        return {"status": "error", "message": str(e), "task_id": task_id}
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,287 @@
+"""
+监控指标类：以Prometheus文本格式导出API进程和AI工作进程的运行指标
+    API进程：GET /metrics
+    AI工作进程：start_metrics_server()启动的HTTP服务，端口取环境变量METRICS_PORT（默认9100）加WORKER_INDEX（默认0），同时提供就绪检查GET /ready
+指标均为进程内统计，多进程部署时由Prometheus按实例汇总；队列深度在每次采集时从redis读取。
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from logger import get_logger
+
+log = get_logger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 秒级耗时的默认分桶：覆盖毫秒级的redis/向量检索到分钟级的大模型生成
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(object):
+    """
+    指标基类：按标签值保存样本
+    """
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """
+    只增计数器
+    """
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}"
+                for k, v in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """
+    瞬时值
+    """
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}"
+                for k, v in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """
+    分桶直方图
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry(object):
+    """
+    指标注册表。collector在每次采集前调用，用于刷新需从外部读取的指标（如队列深度）
+    """
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], None]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                log.error(f"指标采集失败：{e}")
+        return "\n".join(m.render() for m in self._metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "resume_queue_depth", "各任务类型当前排队数", ("task_type",)))
+TASKS_ENQUEUED = REGISTRY.register(Counter(
+    "resume_tasks_enqueued_total", "入队任务数", ("task_type",)))
+TASKS_DEQUEUED = REGISTRY.register(Counter(
+    "resume_tasks_dequeued_total", "出队任务数", ("task_type",)))
+TASKS_REJECTED = REGISTRY.register(Counter(
+    "resume_tasks_rejected_total", "未通过准入控制的任务数，reason为queue_full/rate_limited", ("task_type", "reason")))
+QUEUE_WAIT = REGISTRY.register(Histogram(
+    "resume_queue_wait_seconds", "任务排队等待时间", ("task_type",)))
+STAGE_DURATION = REGISTRY.register(Histogram(
+    "resume_stage_duration_seconds", "各处理阶段耗时", ("stage",)))
+STAGE_FAILURES = REGISTRY.register(Counter(
+    "resume_stage_failures_total", "各处理阶段失败次数", ("stage",)))
+TASK_RETRIES = REGISTRY.register(Counter(
+    "resume_task_retries_total", "任务重新入队次数，reason为error（处理失败）/reclaimed（工作进程失联后回收）",
+    ("task_type", "reason")))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "llm_tokens_total", "大模型tokens用量，kind为prompt/cached/completion", ("provider", "kind")))
+LLM_COST = REGISTRY.register(Counter(
+    "llm_cost_yuan_total", "大模型调用费用估算（元）", ("provider",)))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "cache_requests_total", "缓存查询次数，result为hit/miss", ("cache", "result")))
+CHROMA_QUERY = REGISTRY.register(Histogram(
+    "chroma_query_duration_seconds", "ChromaDB查询耗时，op为query/get", ("op",)))
+KS_QUERY_BATCH = REGISTRY.register(Histogram(
+    "ks_query_batch_size", "合并后每次知识库查询包含的数量，unit为requests（调用方请求数）/keywords（关键词数）",
+    ("unit",), buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)))
+WORKER_INFLIGHT = REGISTRY.register(Gauge(
+    "resume_worker_inflight_tasks", "工作进程正在并发处理的任务数"))
+DEPENDENCY_INIT = REGISTRY.register(Histogram(
+    "dependency_init_seconds", "外部依赖初始化耗时，phase为init（导入并构造）/warm（预热）", ("dependency", "phase")))
+DEPENDENCY_READY = REGISTRY.register(Gauge(
+    "dependency_ready", "外部依赖是否就绪（1/0）", ("dependency",)))
+
+# 大模型价格（元/百万tokens）：(输入未命中缓存, 输入命中缓存, 输出)
+# 可通过环境变量 LLM_PRICE_<服务商大写>="输入,缓存,输出" 覆盖
+LLM_PRICES = {
+    "kimi": (4.0, 1.0, 16.0),
+    "deepseek": (2.0, 0.2, 3.0),
+}
+
+
+def llm_price(provider: str) -> Tuple[float, float, float]:
+    env = os.getenv(f"LLM_PRICE_{provider.upper()}")
+    if env:
+        try:
+            price_input, price_cached, price_output = (float(p) for p in env.split(","))
+            return price_input, price_cached, price_output
+        except ValueError:
+            log.error(f"大模型价格配置格式错误：LLM_PRICE_{provider.upper()}={env}")
+    return LLM_PRICES.get(provider, (0.0, 0.0, 0.0))
+
+
+def record_llm_usage(provider: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int):
+    """
+    记录一次大模型调用的tokens用量及费用
+    """
+    LLM_TOKENS.inc(prompt_tokens, provider=provider, kind="prompt")
+    LLM_TOKENS.inc(cached_tokens, provider=provider, kind="cached")
+    LLM_TOKENS.inc(completion_tokens, provider=provider, kind="completion")
+    price_input, price_cached, price_output = llm_price(provider)
+    cost = ((prompt_tokens - cached_tokens) * price_input + cached_tokens * price_cached
+            + completion_tokens * price_output) / 1e6
+    LLM_COST.inc(cost, provider=provider)
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/ready" and self.server.ready_check is not None:
+            self._send_ready()
+            return
+        if path != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_ready(self):
+        try:
+            ready, detail = self.server.ready_check()
+        except Exception as e:
+            ready, detail = False, {"error": str(e)}
+        body = json.dumps({"ready": ready, "dependencies": detail}, ensure_ascii=False).encode("utf-8")
+        self.send_response(200 if ready else 503)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int = None, host: str = "0.0.0.0",
+                         ready_check: Callable[[], Tuple[bool, dict]] = None) -> Optional[ThreadingHTTPServer]:
+    """
+    在后台线程中启动指标HTTP服务（供AI工作进程使用）
+    同一台机器上启动多个工作进程时，为每个进程设置不同的WORKER_INDEX（0, 1, 2...），端口为METRICS_PORT + WORKER_INDEX。
+    端口被占用时只记录警告并返回None，工作进程照常处理任务（没有指标和就绪检查接口）
+    :param port: 端口，为空时取环境变量METRICS_PORT（默认9100）加WORKER_INDEX（默认0）
+    :param ready_check: 就绪检查，返回(是否就绪, 详情)。指定时GET /ready返回200或503
+    """
+    if port is None:
+        port = int(os.getenv("METRICS_PORT", "9100")) + int(os.getenv("WORKER_INDEX", "0"))
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        log.warning(f"指标服务启动失败，端口{port}不可用（可设置METRICS_PORT或WORKER_INDEX）：{e}")
+        return None
+    server.ready_check = ready_check
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    log.info(f"指标服务启动：http://{host}:{port}/metrics")
+    return server
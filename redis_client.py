@@ -1,142 +1,370 @@
 """
 客户端操作类
+同一进程内连接参数相同的RedisClient共享一个连接池，只在连接池创建时检查一次连接，
+之后由连接池按health_check_interval对空闲连接做健康检查。
+连接池大小可通过环境变量REDIS_MAX_CONNECTIONS配置。
 """
 import json
+import os
+import threading
 from typing import Any
 
 import redis
+import redis.asyncio as aioredis
+import zstandard
 from logger import get_logger
 
 log = get_logger(__name__)
 
+# 任务结果写入后的通知频道
+RES_NOTIFY_CHANNEL = "res_notify"
+
+# 任务结果以哈希存储，字段分别为：分数，打分及优化建议，清洗后的简历文本，元数据（JSON）
+RES_FIELDS = ("score", "suggestions", "resume", "meta")
+# 兼容旧格式时，打分及优化建议与简历文本之间的分隔符
+RES_SEPARATOR = "###$$$简历文本$$$###："
+# 超过该字节数的字段使用zstd压缩后存储
+_COMPRESS_MIN_BYTES = 1024
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+_POOL_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+_POOL_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+# redis地址，默认本机6379（压测时可指向独立的redis实例）
+_REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+_REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+
+_pools: dict = {}
+_async_pools: dict = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_kwargs(host, port, db, password, max_connections, decode_responses) -> dict:
+    return dict(
+        host=host,
+        port=port,
+        db=db,
+        password=password,
+        decode_responses=decode_responses,  # 自动解码为字符串（存取压缩数据时关闭）
+        socket_connect_timeout=5,
+        socket_keepalive=True,
+        health_check_interval=_POOL_HEALTH_CHECK_INTERVAL,
+        max_connections=max_connections or _POOL_MAX_CONNECTIONS,
+    )
+
+
+def get_connection_pool(host='localhost', port=6379, db=0, password=None, max_connections=None,
+                        decode_responses=True) -> redis.ConnectionPool:
+    """
+    获取进程内共享的连接池。创建时不连接redis，redis暂不可用时进程仍可启动，由就绪检查（ping）报告
+    """
+    key = (host, port, db, password, decode_responses)
+    pool = _pools.get(key)
+    if pool is not None:
+        return pool
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = redis.ConnectionPool(**_pool_kwargs(host, port, db, password, max_connections, decode_responses))
+            log.info(f"Redis连接池创建 - {host}:{port} DB:{db}，连接池大小：{pool.max_connections}")
+            _pools[key] = pool
+    return pool
+
+
+def get_async_connection_pool(host='localhost', port=6379, db=0, password=None,
+                              max_connections=None, decode_responses=True) -> aioredis.ConnectionPool:
+    """
+    获取进程内共享的异步连接池
+    """
+    key = (host, port, db, password, decode_responses)
+    with _pools_lock:
+        pool = _async_pools.get(key)
+        if pool is None:
+            pool = aioredis.ConnectionPool(**_pool_kwargs(host, port, db, password, max_connections, decode_responses))
+            _async_pools[key] = pool
+    return pool
+
+
+def encode_field(value: str) -> bytes:
+    """
+    编码结果字段，较大的字段使用zstd压缩
+    """
+    data = (value or "").encode("utf-8")
+    if len(data) >= _COMPRESS_MIN_BYTES:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return data
+
+
+def decode_field(value: bytes) -> str:
+    """
+    解码结果字段。zstd帧以固定魔数开头，utf-8文本不会以该字节序列开头
+    """
+    if value is None:
+        return None
+    if value.startswith(_ZSTD_MAGIC):
+        value = zstandard.ZstdDecompressor().decompress(value)
+    return value.decode("utf-8")
+
+
+def res_key(task_id: str) -> str:
+    return f"res_data:{task_id}"
+
+
+def batch_key(batch_id: str) -> str:
+    return f"batch:{batch_id}"
+
+
+def queue_key_prefix(queue_name: str) -> str:
+    """
+    调度器各键的前缀。队列名作为哈希标签（{queue_name}），同一队列的键位于同一个slot，
+    出队脚本按租户拼出的队列键在Redis Cluster/代理下也与声明的KEYS位于同一节点
+    """
+    return f"{{{queue_name}}}"
+
+
+def join_res_fields(fields: dict) -> str:
+    """
+    将结果字段拼接为旧格式字符串：打分及优化建议 + 分隔符 + 简历文本
+    """
+    return (fields.get("suggestions") or "") + RES_SEPARATOR + (fields.get("resume") or "")
+
 
 class RedisClient(object):
     """
     用于执行redis数据库操作
     """
-    def __init__(self, queue_name = "Queue_RO",host='localhost', port=6379, db=0, password=None):
+    def __init__(self, queue_name = "Queue_RO",host=_REDIS_HOST, port=_REDIS_PORT, db=0, password=None,
+                 max_connections=None):
         self.queue_name = queue_name
         try:
             self.client = redis.Redis(
-                host=host,
-                port=port,
-                db=db,
-                password=password,
-                decode_responses=True,  # 自动解码为字符串
-                socket_connect_timeout=5,
-                socket_keepalive=True
+                connection_pool=get_connection_pool(host, port, db, password, max_connections)
+            )
+            # 不自动解码的客户端，用于存取压缩后的结果字段
+            self.raw_client = redis.Redis(
+                connection_pool=get_connection_pool(host, port, db, password, max_connections,
+                                                    decode_responses=False)
             )
-            if self.client.ping():
-                log.info(f"Redis连接成功 - {host}:{port} DB:{db}")
-
         except Exception as e:
             log.error(f"Redis连接失败: {e}")
             raise
 
 
-    def pushQueue_RO(self, task_data:dict)->bool:
+    def ping(self) -> bool:
         """
-        将简历打分+优化请求加入消息队列，发布订阅信息。
-        :return:加入是否成功。
+        检查redis是否可用（用于就绪检查，不在构造时调用）
         """
         try:
-            # 序列化任务数据
-            task_str = json.dumps(task_data, ensure_ascii=False)
-            result = self.client.lpush(self.queue_name, task_str)
-            log.info(f"任务推送成功 - 队列: {self.queue_name}")
-            # log.info(f"任务推送成功 - 队列: {self.queue_name}, 数据: {task_data}")
-
-            return bool(result)
+            return bool(self.client.ping())
         except Exception as e:
-            log.error(f"任务推送失败{e}")
+            log.error(f"Redis连接检查失败: {e}")
             return False
 
 
-    def popQueue_RO(self, timeout: int = 0)->Any:
+    def input_res(self, task_id: str, res_data: str) -> bool:
         """
-        从消息队列中获取简历打分+优化请求
-        :return:task_data。消息队列里的信息
+        将处理好的简历打分任务结果存入redis
+        :param task_id: 任务id
+        :param res_data: 任务处理结果
+        :return: 是否成功
         """
-        try:
-            result = self.client.brpop([self.queue_name],timeout=timeout)
-            if result:
-                log.debug(f"任务获取成功 - 队列: {self.queue_name}")
-                return result
-            return None
-
-        except Exception as e:
-            log.error(f"任务获取失败{e}")
+        return self.input_res_fields(task_id, {"suggestions": res_data})
 
 
-    def input_res(self, task_id: str, res_data: str) -> bool:
+    def input_res_fields(self, task_id: str, fields: dict) -> bool:
         """
-        将处理好的简历打分任务结果以字符串形式存入redis
+        以哈希形式写入任务结果（较大字段压缩存储），同时发布完成通知（MULTI事务，一次往返）
+        工作进程通过TaskStateStore.finish写入结果（同时更新任务状态和批量任务进度，只写入一次）
         :param task_id: 任务id
-        :param res_data: 任务处理结果
+        :param fields: 结果字段，见RES_FIELDS
         :return: 是否成功
         """
         try:
-            # 使用任务ID作为键，存储结果数据
+            pipe = self.raw_client.pipeline(transaction=True)
             # 设置过期时间为24小时（86400秒），避免数据长期堆积
-            result = self.client.setex(
-                f"res_result:{task_id}",
-                86400,
-                res_data
-            )
-            if result:
-                log.info(f"结果存储成功 - 任务ID: {task_id}")
-                return True
-            else:
-                log.error(f"结果存储失败 - 任务ID: {task_id}")
-                return False
+            pipe.hset(res_key(task_id), mapping={k: encode_field(v) for k, v in fields.items()})
+            pipe.expire(res_key(task_id), 86400)
+            pipe.publish(RES_NOTIFY_CHANNEL, task_id)
+            pipe.execute()
+            log.info(f"结果存储成功 - 任务ID: {task_id}")
+            return True
         except Exception as e:
             log.error(f"结果存储异常 - 任务ID: {task_id}, 错误: {e}")
             return False
 
 
+    def get_res_fields(self, task_id: str, fields: list[str] = None) -> dict:
+        """
+        取出任务结果的指定字段
+        :param task_id: 任务id
+        :param fields: 需要的字段，为空时取出全部字段
+        :return: {字段: 值}，任务结果不存在时返回空字典
+        """
+        try:
+            if fields:
+                values = self.raw_client.hmget(res_key(task_id), fields)
+                if all(v is None for v in values):
+                    return {}
+                return {k: decode_field(v) for k, v in zip(fields, values)}
+            values = self.raw_client.hgetall(res_key(task_id))
+            return {k.decode("utf-8"): decode_field(v) for k, v in values.items()}
+        except Exception as e:
+            log.error(f"结果获取异常 - 任务ID: {task_id}, 错误: {e}")
+            return {}
+
+
     def get_res(self, task_id: str) -> str:
         """
-        使用id将处理结果取出
+        使用id将处理结果取出（旧格式字符串）
         :param task_id: 任务id
         :return: 任务处理结果
         """
+        fields = self.get_res_fields(task_id, ["suggestions", "resume"])
+        if fields:
+            log.info(f"结果获取成功 - 任务ID: {task_id}")
+            return join_res_fields(fields)
+        log.warning(f"结果不存在 - 任务ID: {task_id}")
+        return "暂无"
+
+
+    def create_batch(self, batch_id: str, batch_info: dict, children: list[dict], ttl: int = 86400) -> bool:
+        """
+        创建批量任务记录
+        :param batch_id: 批量任务id
+        :param batch_info: 批量任务信息（岗位名称等）
+        :param children: 子任务列表，每项包含task_id和file_name
+        :param ttl: 过期时间（秒）
+        :return: 是否成功
+        """
+        try:
+            mapping = {k: json.dumps(v, ensure_ascii=False) if not isinstance(v, str) else v
+                       for k, v in batch_info.items()}
+            mapping.update({"total": len(children), "done": 0, "failed": 0})
+            pipe = self.client.pipeline(transaction=True)
+            pipe.hset(batch_key(batch_id), mapping=mapping)
+            pipe.rpush(f"batch:{batch_id}:tasks", *[json.dumps(c, ensure_ascii=False) for c in children])
+            pipe.expire(batch_key(batch_id), ttl)
+            pipe.expire(f"batch:{batch_id}:tasks", ttl)
+            pipe.execute()
+            log.info(f"批量任务创建成功 - 批量任务ID: {batch_id}, 子任务数: {len(children)}")
+            return True
+        except Exception as e:
+            log.error(f"批量任务创建失败 - 批量任务ID: {batch_id}, 错误: {e}")
+            return False
+
+
+    def get_batch(self, batch_id: str) -> tuple[dict, list[dict]]:
+        """
+        获取批量任务信息及子任务列表
+        :param batch_id: 批量任务id
+        :return: (批量任务信息, 子任务列表)，不存在时返回({}, [])
+        """
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hgetall(batch_key(batch_id))
+            pipe.lrange(f"batch:{batch_id}:tasks", 0, -1)
+            info, children = pipe.execute()
+            return info, [json.loads(c) for c in children]
+        except Exception as e:
+            log.error(f"批量任务获取异常 - 批量任务ID: {batch_id}, 错误: {e}")
+            return {}, []
+
+
+    def get_res_field_many(self, task_ids: list[str], field: str) -> list:
+        """
+        一次取出多个任务结果的同一字段
+        :param task_ids: 任务id列表
+        :param field: 字段名
+        :return: 与task_ids顺序一致的字段值列表，不存在的为None
+        """
+        if not task_ids:
+            return []
         try:
-            result = self.client.get(f"res_result:{task_id}")
-            if result is not None:
-                log.info(f"结果获取成功 - 任务ID: {task_id}")
-                return str(result)
-            else:
-                log.warning(f"结果不存在 - 任务ID: {task_id}")
-                return "暂无"
+            pipe = self.raw_client.pipeline(transaction=False)
+            for task_id in task_ids:
+                pipe.hget(res_key(task_id), field)
+            return [decode_field(v) for v in pipe.execute()]
+        except Exception as e:
+            log.error(f"批量结果获取异常: {e}")
+            return [None] * len(task_ids)
+
+
+class AsyncRedisClient(object):
+    """
+    RedisClient的异步版本，用于FastAPI的异步接口，避免阻塞事件循环
+    """
+    def __init__(self, queue_name="Queue_RO", host=_REDIS_HOST, port=_REDIS_PORT, db=0, password=None,
+                 max_connections=None):
+        self.queue_name = queue_name
+        self.client = aioredis.Redis(
+            connection_pool=get_async_connection_pool(host, port, db, password, max_connections)
+        )
+        self.raw_client = aioredis.Redis(
+            connection_pool=get_async_connection_pool(host, port, db, password, max_connections,
+                                                      decode_responses=False)
+        )
+
+
+    async def ping(self) -> bool:
+        try:
+            return bool(await self.client.ping())
+        except Exception as e:
+            log.error(f"Redis连接检查失败: {e}")
+            return False
+
+
+    async def get_res_fields(self, task_id: str, fields: list[str] = None) -> dict:
+        """
+        取出任务结果的指定字段
+        :param task_id: 任务id
+        :param fields: 需要的字段，为空时取出全部字段
+        :return: {字段: 值}，任务结果不存在时返回空字典
+        """
+        try:
+            if fields:
+                values = await self.raw_client.hmget(res_key(task_id), fields)
+                if all(v is None for v in values):
+                    return {}
+                return {k: decode_field(v) for k, v in zip(fields, values)}
+            values = await self.raw_client.hgetall(res_key(task_id))
+            return {k.decode("utf-8"): decode_field(v) for k, v in values.items()}
         except Exception as e:
             log.error(f"结果获取异常 - 任务ID: {task_id}, 错误: {e}")
-            return "暂无"
+            return {}
 
 
-    def get_queue_length(self) -> int:
-        """获取队列长度"""
+    async def get_batch(self, batch_id: str) -> tuple[dict, list[dict]]:
+        """
+        获取批量任务信息及子任务列表
+        """
         try:
-            return self.client.llen(self.queue_name)
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.hgetall(batch_key(batch_id))
+                pipe.lrange(f"batch:{batch_id}:tasks", 0, -1)
+                info, children = await pipe.execute()
+            return info, [json.loads(c) for c in children]
         except Exception as e:
-            log.error(f"获取队列长度失败: {e}")
-            return 0
+            log.error(f"批量任务获取异常 - 批量任务ID: {batch_id}, 错误: {e}")
+            return {}, []
+
 
+    async def get_res_field_many(self, task_ids: list[str], field: str) -> list:
+        """
+        一次取出多个任务结果的同一字段
+        """
+        if not task_ids:
+            return []
+        try:
+            async with self.raw_client.pipeline(transaction=False) as pipe:
+                for task_id in task_ids:
+                    pipe.hget(res_key(task_id), field)
+                values = await pipe.execute()
+            return [decode_field(v) for v in values]
+        except Exception as e:
+            log.error(f"批量结果获取异常: {e}")
+            return [None] * len(task_ids)
 
 
 if __name__ == "__main__":
     a = RedisClient()
     a.input_res("task1","task1的处理结果")
     a.get_res("task1")
-    # 测试功能：
-    # resume_optimization_queue = RedisClient("Queue_RO")
-    # task_info = {"pdf全部文本": "pdf_text", "岗位名称": "数据分析师", "岗位描述": "job_description", "其他信息": "more_info",
-    #              "用户备注": "user_request"}
-    #
-    # task_queue = {"task_id": "task_id", "task_info": task_info, "text": "task_texts[0][0]",
-    #               "task_type": "task_texts[0][1]"}
-    # task_id = "t"
-    # a = 1
-    # while a<=2:
-    #     task_queue["task_id"] = task_id+"_"+str(a)
-    #     resume_optimization_queue.pushQueue_RO(task_queue)
-    #     a+=1
@@ -0,0 +1,118 @@
+"""
+语义回答缓存类：同一简历打分+优化任务（task_id）下，语义相近的聊天问题直接返回之前的回答
+    sem_cache:{task_id}    列表。最近的问答，每项为{"prompt": .., "embedding": base64(float32), "answer": .., "ts": ..}
+    sem_cache:stats        哈希。hits：命中次数，misses：未命中次数
+问题向量由向量服务（KsEmbedding，ChromaDB默认的本地向量模型all-MiniLM-L6-v2）计算，与知识库检索共用模型和合批，
+聊天问题只进入内存缓存，不写入磁盘缓存。
+"""
+import base64
+import json
+import time
+from typing import Optional
+
+import numpy as np
+
+from KnowledgeSystem.KsEmbedding import EmbeddingService, get_embedding_service
+from logger import get_logger
+from metrics import CACHE_REQUESTS
+from redis_client import RedisClient
+
+log = get_logger(__name__)
+
+
+class SemanticCache(object):
+    """
+    按task_id隔离的语义回答缓存
+    """
+    def __init__(self, redis_client: RedisClient = None, threshold: float = 0.92, max_entries: int = 50,
+                 ttl: int = 86400, embedding_function=None):
+        """
+        :param redis_client: redis客户端，为空时新建
+        :param threshold: 余弦相似度阈值，达到该值视为同一问题
+        :param max_entries: 每个task_id最多保留的问答数，超出后淘汰最早的
+        :param ttl: 问答过期时间（秒）
+        :param embedding_function: 向量函数，输入文本列表返回向量列表。为空时使用进程内共享的默认向量服务
+        """
+        self.redis_client = redis_client or RedisClient()
+        self.client = self.redis_client.client
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._embedding_service = EmbeddingService(embedding_function, cache_path=None) if embedding_function else None
+
+    def _embed(self, text: str) -> np.ndarray:
+        service = self._embedding_service or get_embedding_service()
+        vector = np.asarray(service.embed([text], persist=False)[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def _key(task_id: str) -> str:
+        return f"sem_cache:{task_id}"
+
+    def lookup(self, task_id: str, prompt: str) -> tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        查找语义相近问题的回答
+        :param task_id: 简历打分+优化任务id
+        :param prompt: 用户提示词
+        :return: (命中的回答或None, 问题向量)。问题向量可在未命中时传给store，避免重复计算
+        """
+        try:
+            embedding = self._embed(prompt)
+            entries = self.client.lrange(self._key(task_id), 0, -1)
+        except Exception as e:
+            log.error(f"语义缓存查找失败 - 任务ID: {task_id}, 错误: {e}")
+            return None, None
+
+        now = time.time()
+        best_answer, best_similarity = None, -1.0
+        for raw in entries:
+            entry = json.loads(raw)
+            if now - entry["ts"] > self.ttl:
+                continue
+            cached = np.frombuffer(base64.b64decode(entry["embedding"]), dtype=np.float32)
+            similarity = float(np.dot(embedding, cached))
+            if similarity > best_similarity:
+                best_answer, best_similarity = entry["answer"], similarity
+
+        hit = best_similarity >= self.threshold
+        self.client.hincrby("sem_cache:stats", "hits" if hit else "misses", 1)
+        CACHE_REQUESTS.inc(cache="semantic", result="hit" if hit else "miss")
+        if hit:
+            log.info(f"语义缓存命中 - 任务ID: {task_id}, 相似度: {best_similarity:.3f}")
+            return best_answer, embedding
+        return None, embedding
+
+    def store(self, task_id: str, prompt: str, answer: str, embedding: np.ndarray = None):
+        """
+        保存问答，超出数量上限时淘汰最早的问答
+        """
+        try:
+            if embedding is None:
+                embedding = self._embed(prompt)
+            entry = json.dumps({"prompt": prompt, "answer": answer, "ts": time.time(),
+                                "embedding": base64.b64encode(embedding.astype(np.float32).tobytes()).decode()},
+                               ensure_ascii=False)
+            pipe = self.client.pipeline(transaction=True)
+            pipe.lpush(self._key(task_id), entry)
+            pipe.ltrim(self._key(task_id), 0, self.max_entries - 1)
+            pipe.expire(self._key(task_id), self.ttl)
+            pipe.execute()
+        except Exception as e:
+            log.error(f"语义缓存保存失败 - 任务ID: {task_id}, 错误: {e}")
+
+    def stats(self) -> dict:
+        """
+        获取命中次数、未命中次数和命中率
+        """
+        stats = self.client.hgetall("sem_cache:stats")
+        hits, misses = int(stats.get("hits", 0)), int(stats.get("misses", 0))
+        return {"hits": hits, "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0}
+
+
+if __name__ == "__main__":
+    cache = SemanticCache()
+    cache.store("demo", "怎么改项目经历", "项目经历建议使用STAR法则……")
+    print(cache.lookup("demo", "项目经历怎么写更好")[0])
+    print(cache.stats())
@@ -0,0 +1,95 @@
+"""
+任务阶段检查点：保存任务各处理阶段的输出，重试或被回收的任务跳过已完成的阶段
+    task_ckpt:{task_id}    哈希。阶段名 -> 阶段输出（JSON，较大的字段按结果字段的方式zstd压缩）
+检查点在TASK_CHECKPOINT_TTL秒（默认3600）后过期，任务成功写入结果后删除。
+简历清洗、关键词提取、最终生成都是付费的大模型调用，失败重试时不再重复调用已完成的阶段。
+"""
+import json
+import os
+from typing import Any, Callable, Dict
+
+from logger import get_logger
+from metrics import CACHE_REQUESTS
+from redis_client import RedisClient, decode_field, encode_field
+
+log = get_logger(__name__)
+
+CHECKPOINT_TTL = int(os.getenv("TASK_CHECKPOINT_TTL", "3600"))
+
+
+def checkpoint_key(task_id: str) -> str:
+    return f"task_ckpt:{task_id}"
+
+
+class TaskCheckpointStore(object):
+    """
+    检查点存储。读写失败只记录日志，不影响任务处理（相当于没有检查点）
+    """
+    def __init__(self, redis_client: RedisClient = None, ttl: int = CHECKPOINT_TTL):
+        """
+        :param redis_client: redis客户端，为空时新建
+        :param ttl: 检查点过期时间（秒）
+        """
+        self.redis_client = redis_client or RedisClient()
+        self.client = self.redis_client.raw_client
+        self.ttl = ttl
+
+    def load(self, task_id: str) -> Dict[str, Any]:
+        """
+        :return: 阶段名 -> 阶段输出
+        """
+        try:
+            record = self.client.hgetall(checkpoint_key(task_id))
+            return {name.decode("utf-8"): json.loads(decode_field(value)) for name, value in record.items()}
+        except Exception as e:
+            log.error(f"读取任务检查点失败 - 任务ID: {task_id}, 错误: {e}")
+            return {}
+
+    def save(self, task_id: str, stage: str, value: Any):
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hset(checkpoint_key(task_id), stage, encode_field(json.dumps(value, ensure_ascii=False)))
+            pipe.expire(checkpoint_key(task_id), self.ttl)
+            pipe.execute()
+        except Exception as e:
+            log.error(f"保存任务检查点失败 - 任务ID: {task_id}, 阶段: {stage}, 错误: {e}")
+
+    def clear(self, task_id: str):
+        try:
+            self.client.delete(checkpoint_key(task_id))
+        except Exception as e:
+            log.error(f"删除任务检查点失败 - 任务ID: {task_id}, 错误: {e}")
+
+    def task(self, task_id: str) -> "TaskCheckpoint":
+        """
+        读取一个任务的全部检查点
+        """
+        return TaskCheckpoint(self, task_id, self.load(task_id))
+
+
+class TaskCheckpoint(object):
+    """
+    单个任务的检查点。各阶段可在不同线程中并行执行
+    """
+    def __init__(self, store: TaskCheckpointStore, task_id: str, completed: Dict[str, Any]):
+        self.store = store
+        self.task_id = task_id
+        self.completed = completed
+        # 有检查点的任务（重试或被回收）才统计命中率
+        self.resumed = bool(completed)
+
+    def run(self, stage: str, fn: Callable[..., Any], *args) -> Any:
+        """
+        阶段已完成时直接返回保存的输出，否则执行fn(*args)并保存输出
+        输出需可JSON序列化（元组读回后为列表）
+        """
+        if stage in self.completed:
+            CACHE_REQUESTS.inc(cache="checkpoint", result="hit")
+            log.info(f"跳过已完成的阶段：{stage}。{self.task_id}")
+            return self.completed[stage]
+        if self.resumed:
+            CACHE_REQUESTS.inc(cache="checkpoint", result="miss")
+        value = fn(*args)
+        self.store.save(self.task_id, stage, value)
+        self.completed[stage] = value
+        return value
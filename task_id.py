@@ -0,0 +1,168 @@
+"""
+任务ID生成类：多进程、多节点部署时不重复，按时间有序
+格式（25位数字）：年月日时分秒(14，UTC) + 毫秒(3) + 节点号(4) + 序号(4)
+    节点号：环境变量TASK_NODE_ID，未设置时首次生成ID时从redis租用（SET NX EX），后台线程定期续期。
+            租用从INCR得到的位置开始依次尝试0-9999，已退出进程的节点号在租约过期（TASK_NODE_LEASE_TTL秒，默认60）后可被再次租用；
+            续期时发现租约已丢失（如redis长时间不可用）则重新租用，redis不可用时退化为随机节点号
+    序号：每毫秒从0开始，同一毫秒内用尽10000个序号后借用下一毫秒
+时间取UTC（不受夏令时影响），并且只增不减：系统时钟回拨时沿用上一次的毫秒，直到时钟追上。
+同一进程生成的ID严格递增；同一时刻不同进程的节点号不同，不会生成相同ID。
+"""
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from logger import get_logger
+from redis_client import RedisClient
+
+log = get_logger(__name__)
+
+NODE_ID_KEY = "task_id:node_seq"
+NODE_LEASE_PREFIX = "task_id:node:"
+NODE_LEASE_TTL = int(os.getenv("TASK_NODE_LEASE_TTL", "60"))
+NODE_ID_MODULO = 10000
+SEQ_MODULO = 10000
+TASK_ID_LENGTH = 25
+
+# 从INCR得到的位置开始依次尝试SET NX EX，返回租到的节点号，全部被占用时返回-1
+# KEYS[1] 起始位置计数器；ARGV: 租约键前缀, 节点号个数, 租约标识, 租约秒数
+_ACQUIRE_SCRIPT = """
+local n = tonumber(ARGV[2])
+local start = (redis.call('INCR', KEYS[1]) - 1) % n
+for i = 0, n - 1 do
+    local node = (start + i) % n
+    if redis.call('SET', ARGV[1] .. node, ARGV[3], 'NX', 'EX', tonumber(ARGV[4])) then
+        return node
+    end
+end
+return -1
+"""
+
+# 租约仍属于自己时续期，返回1；已过期或被其他进程租用时返回0
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+    return 1
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class TaskIDGenerator(object):
+    """
+    按时间有序的任务ID生成器，线程安全
+    """
+    def __init__(self, redis_client: RedisClient = None, node_id: int = None, lease_ttl: int = NODE_LEASE_TTL):
+        """
+        :param redis_client: 用于租用节点号的redis客户端，为空时新建
+        :param node_id: 节点号（0-9999），为空时取环境变量TASK_NODE_ID，仍为空时首次生成ID时由redis租用
+        :param lease_ttl: 节点号租约秒数，每lease_ttl/3秒续期一次
+        """
+        if node_id is None and os.getenv("TASK_NODE_ID"):
+            node_id = int(os.getenv("TASK_NODE_ID"))
+        self.node_id = None if node_id is None else node_id % NODE_ID_MODULO
+        self._redis_client = redis_client
+        self.lease_ttl = lease_ttl
+        self._token = uuid.uuid4().hex
+        self._lease_key = None
+        self._renewer = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._seq = 0
+        if self.node_id is not None:
+            log.info(f"任务ID生成器节点号：{self.node_id:04d}")
+
+    def _client(self):
+        if self._redis_client is None:
+            self._redis_client = RedisClient()
+        return self._redis_client.client
+
+    def _acquire_node_id(self) -> int:
+        """
+        租用节点号，失败时返回随机节点号（不持有租约，由续期线程稍后重试租用）
+        """
+        try:
+            client = self._client()
+            node_id = int(client.register_script(_ACQUIRE_SCRIPT)(
+                keys=[NODE_ID_KEY], args=[NODE_LEASE_PREFIX, NODE_ID_MODULO, self._token, self.lease_ttl]))
+            if node_id < 0:
+                raise RuntimeError(f"{NODE_ID_MODULO}个节点号均已被租用")
+            self._lease_key = f"{NODE_LEASE_PREFIX}{node_id}"
+            log.info(f"任务ID生成器节点号：{node_id:04d}（租约{self.lease_ttl}秒）")
+            return node_id
+        except Exception as e:
+            # redis不可用时退化为随机节点号，多进程间存在极小的冲突概率
+            self._lease_key = None
+            node_id = random.SystemRandom().randrange(NODE_ID_MODULO)
+            log.warning(f"节点号租用失败，暂时使用随机节点号{node_id}：{e}")
+            return node_id
+
+    def _set_node_id(self, node_id: int):
+        """
+        更换节点号。下一个ID从下一毫秒开始，保证进程内ID仍然递增
+        """
+        with self._lock:
+            if node_id != self.node_id:
+                self.node_id = node_id
+                self._last_ms, self._seq = self._last_ms + 1, 0
+
+    def _renew_loop(self):
+        interval = max(self.lease_ttl / 3, 0.1)
+        while not self._stopped.wait(interval):
+            try:
+                if self._lease_key is not None:
+                    renewed = self._client().register_script(_RENEW_SCRIPT)(
+                        keys=[self._lease_key], args=[self._token, self.lease_ttl])
+                    if renewed:
+                        continue
+                    log.warning(f"节点号{self.node_id:04d}的租约已丢失，重新租用")
+                self._set_node_id(self._acquire_node_id())
+            except Exception as e:
+                log.error(f"节点号续期失败：{e}")
+
+    def close(self):
+        """
+        停止续期并释放节点号租约
+        """
+        self._stopped.set()
+        if self._lease_key is not None:
+            try:
+                self._client().register_script(_RELEASE_SCRIPT)(keys=[self._lease_key], args=[self._token])
+            except Exception as e:
+                log.warning(f"释放节点号租约失败：{e}")
+            self._lease_key = None
+
+    def generate_task_id(self) -> str:
+        """
+        生成任务ID
+        格式：UTC年月日时分秒 + 3位毫秒 + 4位节点号 + 4位序号
+        """
+        with self._lock:
+            if self.node_id is None:
+                # 首次生成ID时租用节点号并启动续期线程
+                self.node_id = self._acquire_node_id()
+                self._renewer = threading.Thread(target=self._renew_loop, name="task-id-lease", daemon=True)
+                self._renewer.start()
+            now_ms = int(time.time() * 1000)
+            if now_ms > self._last_ms:
+                self._last_ms, self._seq = now_ms, 0
+            elif self._seq + 1 < SEQ_MODULO:
+                # 同一毫秒内，或时钟回拨后尚未追上上一次的毫秒
+                self._seq += 1
+            else:
+                # 本毫秒的序号已用尽，借用下一毫秒
+                self._last_ms, self._seq = self._last_ms + 1, 0
+            ms, node_id, seq = self._last_ms, self.node_id, self._seq
+        return (datetime.fromtimestamp(ms // 1000, tz=timezone.utc).strftime("%Y%m%d%H%M%S")
+                + f"{ms % 1000:03d}{node_id:04d}{seq:04d}")
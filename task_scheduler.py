@@ -0,0 +1,592 @@
+"""
+任务调度类：按任务类型分队列 + 租户公平分享
+队列结构（均以{{queue_name}}为前缀：队列名作为哈希标签，同一队列的键位于Redis Cluster的同一个slot）：
+    {{queue_name}}:q:{task_type}:{tenant}    每个任务类型下每个租户的任务列表
+    {{queue_name}}:ring:{task_type}          有待处理任务的租户环（轮询用）
+    {{queue_name}}:tenants:{task_type}       有待处理任务的租户集合（环去重用）
+    {{queue_name}}:depth:{task_type}         该任务类型的排队任务数
+    {{queue_name}}:waits:{task_type}         该任务类型最近的排队等待时间（毫秒）
+    {{queue_name}}:seq:{task_type}           该任务类型的入队序号
+    {{queue_name}}:dequeued:{task_type}      该任务类型的已出队任务数（入队序号 - 已出队数 = 排队位置）
+    {{queue_name}}:popped_at:{task_type}     该任务类型最近的出队时间戳（估算工作进程吞吐量）
+    {{queue_name}}:rate:{tenant}             租户的提交限速令牌桶
+    {{queue_name}}:inflight                  已出队、处理中的任务（租约ID -> 任务数据），租约ID为{task_id}:{attempt}
+    {{queue_name}}:leases                    处理中任务的租约到期时间（有序集合）
+入队时同时写入任务状态task_state:{task_id}（queued、入队序号），见task_state.py。
+准入控制（admit）：入队前在一个Lua脚本中原子地检查排队数上限（QUEUE_MAX_DEPTH）和租户限速（TENANT_RATE_LIMIT个/TENANT_RATE_WINDOW秒），
+通过时预占排队数，之后push(reserved=True)不再重复计数；未能入队的预占通过release归还。
+令牌桶按任务数全额扣除：超过桶容量的批量任务在桶满时放行，令牌记为负数（欠账），还清前该租户的提交均被限速。
+失败重试和回收的任务重新入队前同样经过排队数上限检查（不扣租户令牌）。
+拒绝时按最近的出队速率估算排队等待时间和建议的重试间隔。
+出队时任务同时登记为处理中并获得TASK_LEASE_S秒（默认60）的租约，工作进程处理期间定期续约（extend），结束后ack；
+工作进程崩溃或失联时租约到期，由其他工作进程通过reclaim取回并重新入队（attempt加1）。
+旧版的单一列表队列（键名为queue_name）由工作进程启动时通过migrate_legacy_queue移入新的队列。
+任务类型之间使用赤字轮询（DRR），同一任务类型内的租户之间使用轮询，
+短小的聊天类任务不会排在耗时较长的简历优化任务之后。
+"""
+import json
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from logger import get_logger
+from metrics import QUEUE_DEPTH, QUEUE_WAIT, TASKS_ENQUEUED, TASKS_DEQUEUED, TASKS_REJECTED
+from redis_client import RedisClient, queue_key_prefix
+from task_state import STATE_QUEUED, STATE_TTL, task_state_key
+
+log = get_logger(__name__)
+
+# 任务类型编号与main.task_texts保持一致
+TASK_TYPE_RO = 1            # 简历打分+优化任务
+TASK_TYPE_RO_CHAT = 2       # 简历打分_聊天
+TASK_TYPE_INTERVIEW = 3     # 面试题目生成
+TASK_TYPE_INTERVIEW_CHAT = 4  # 面试题目生成_聊天
+
+# 每轮赤字轮询中各任务类型获得的配额（quantum）
+DEFAULT_WEIGHTS = {
+    TASK_TYPE_RO: 2,
+    TASK_TYPE_RO_CHAT: 4,
+    TASK_TYPE_INTERVIEW: 2,
+    TASK_TYPE_INTERVIEW_CHAT: 4,
+}
+
+# 各任务类型单个任务的预估开销（与配额同单位）。聊天类任务开销小，出队更频繁
+DEFAULT_COSTS = {
+    TASK_TYPE_RO: 4,
+    TASK_TYPE_RO_CHAT: 1,
+    TASK_TYPE_INTERVIEW: 3,
+    TASK_TYPE_INTERVIEW_CHAT: 1,
+}
+
+DEFAULT_TENANT = "default"
+
+# 准入控制，为0时不限制
+QUEUE_MAX_DEPTH = int(os.getenv("QUEUE_MAX_DEPTH", "500"))         # 每个任务类型的最大排队数
+TENANT_RATE_LIMIT = int(os.getenv("TENANT_RATE_LIMIT", "20"))       # 每个租户每个窗口最多提交的任务数
+TENANT_RATE_WINDOW = float(os.getenv("TENANT_RATE_WINDOW", "60"))   # 限速窗口（秒）
+# 估算吞吐量时使用的最近出队时间窗口（秒）
+THROUGHPUT_WINDOW = 300
+# 处理中任务的租约时长（秒），工作进程每1/3租约续约一次
+TASK_LEASE_S = float(os.getenv("TASK_LEASE_S", "60"))
+
+ADMIT_QUEUE_FULL = "queue_full"
+ADMIT_RATE_LIMITED = "rate_limited"
+
+# 入队：任务放入租户队列，租户首次出现时加入轮询环，排队数+1，分配入队序号并写入任务状态
+_PUSH_SCRIPT = """
+redis.call('LPUSH', KEYS[1], ARGV[2])
+if redis.call('SADD', KEYS[3], ARGV[1]) == 1 then
+    redis.call('LPUSH', KEYS[2], ARGV[1])
+end
+local seq = redis.call('INCR', KEYS[5])
+redis.call('HSET', KEYS[6], 'state', ARGV[3], ARGV[3] .. '_at', ARGV[4], 'updated_at', ARGV[4],
+           'task_type', ARGV[5], 'enqueue_seq', seq)
+redis.call('EXPIRE', KEYS[6], ARGV[6])
+if ARGV[7] == '1' then
+    return tonumber(redis.call('GET', KEYS[4]) or '0')
+end
+return redis.call('INCR', KEYS[4])
+"""
+
+# 准入：检查排队数上限和租户令牌桶，通过时扣除令牌并预占排队数。ARGV[3]（限速）为0时不检查令牌桶
+# 返回{结果, 排队数, 令牌不足时需等待的秒数}，结果0为通过、1为排队已满、2为超出限速；小数以字符串返回
+_ADMIT_SCRIPT = """
+local n = tonumber(ARGV[1])
+local max_depth = tonumber(ARGV[2])
+local depth = tonumber(redis.call('GET', KEYS[1]) or '0')
+if max_depth > 0 and depth + n > max_depth then
+    return {1, depth, '0'}
+end
+local limit = tonumber(ARGV[3])
+if limit > 0 then
+    local window = tonumber(ARGV[4])
+    local now = tonumber(ARGV[5])
+    local rate = limit / window
+    local bucket = redis.call('HMGET', KEYS[2], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or limit
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(limit, tokens + math.max(0, now - ts) * rate)
+    -- 按任务数全额扣除；超过桶容量的批量任务只要求桶满，不足部分记为欠账（令牌为负）
+    local cost = tonumber(ARGV[6])
+    local required = math.min(cost, limit)
+    if tokens < required then
+        return {2, depth, tostring((required - tokens) / rate)}
+    end
+    redis.call('HSET', KEYS[2], 'tokens', tostring(tokens - cost), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[2], math.ceil(window * 2))
+end
+return {0, redis.call('INCRBY', KEYS[1], n), '0'}
+"""
+
+# 出队：沿轮询环依次尝试各租户，取到任务即登记为处理中并返回；租户队列为空则移出环
+_POP_SCRIPT = """
+local n = redis.call('LLEN', KEYS[1])
+for i = 1, n do
+    local tenant = redis.call('RPOPLPUSH', KEYS[1], KEYS[1])
+    if not tenant then
+        return nil
+    end
+    local task = redis.call('RPOP', ARGV[1] .. tenant)
+    if task then
+        redis.call('DECR', KEYS[3])
+        redis.call('INCR', KEYS[4])
+        local data = cjson.decode(task)
+        local lease = data['task_id'] .. ':' .. string.format('%d', data['attempt'] or 0)
+        redis.call('HSET', KEYS[5], lease, task)
+        redis.call('ZADD', KEYS[6], ARGV[2], lease)
+        return task
+    end
+    redis.call('LREM', KEYS[1], 0, tenant)
+    redis.call('SREM', KEYS[2], tenant)
+end
+return nil
+"""
+
+# 回收：取出租约已到期的处理中任务。ZREM成功的调用方独占该任务，多个工作进程同时回收时不会重复入队
+_RECLAIM_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+local tasks = {}
+for _, lease in ipairs(expired) do
+    redis.call('ZREM', KEYS[2], lease)
+    local task = redis.call('HGET', KEYS[1], lease)
+    redis.call('HDEL', KEYS[1], lease)
+    if task then
+        table.insert(tasks, task)
+    end
+end
+return tasks
+"""
+
+
+class TaskScheduler(object):
+    """
+    多任务类型、多租户的公平任务调度器
+    """
+    def __init__(self, redis_client: RedisClient = None, queue_name: str = "Queue_RO",
+                 weights: Dict[int, int] = None, costs: Dict[int, int] = None,
+                 wait_samples: int = 1000, max_depth: int = QUEUE_MAX_DEPTH, rate_limit: int = TENANT_RATE_LIMIT,
+                 rate_window: float = TENANT_RATE_WINDOW, lease_s: float = TASK_LEASE_S):
+        """
+        :param redis_client: redis客户端，为空时新建
+        :param queue_name: 队列前缀
+        :param weights: 各任务类型每轮获得的配额
+        :param costs: 各任务类型单个任务的预估开销
+        :param wait_samples: 每个任务类型保留的最近排队等待时间样本数
+        :param max_depth: 准入控制：每个任务类型的最大排队数，0为不限制
+        :param rate_limit: 准入控制：每个租户每rate_window秒最多提交的任务数，0为不限制
+        :param rate_window: 限速窗口（秒）
+        :param lease_s: 处理中任务的租约时长（秒）
+        """
+        self.redis_client = redis_client or RedisClient(queue_name=queue_name)
+        self.client = self.redis_client.client
+        self.queue_name = queue_name
+        self.key_prefix = queue_key_prefix(queue_name)
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.costs = dict(costs or DEFAULT_COSTS)
+        self.wait_samples = wait_samples
+        self.max_depth = max_depth
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.lease_s = lease_s
+
+        self._push = self.client.register_script(_PUSH_SCRIPT)
+        self._pop = self.client.register_script(_POP_SCRIPT)
+        self._admit = self.client.register_script(_ADMIT_SCRIPT)
+        self._reclaim = self.client.register_script(_RECLAIM_SCRIPT)
+
+        # 赤字轮询状态（每个工作进程各自维护）
+        self._deficits = {task_type: 0 for task_type in self.weights}
+        self._cursor = 0
+
+    def _queue_prefix(self, task_type: int) -> str:
+        return f"{self.key_prefix}:q:{task_type}:"
+
+    def _ring_key(self, task_type: int) -> str:
+        return f"{self.key_prefix}:ring:{task_type}"
+
+    def _tenants_key(self, task_type: int) -> str:
+        return f"{self.key_prefix}:tenants:{task_type}"
+
+    def _depth_key(self, task_type: int) -> str:
+        return f"{self.key_prefix}:depth:{task_type}"
+
+    def _waits_key(self, task_type: int) -> str:
+        return f"{self.key_prefix}:waits:{task_type}"
+
+    def _seq_key(self, task_type: int) -> str:
+        return f"{self.key_prefix}:seq:{task_type}"
+
+    def _dequeued_key(self, task_type: int) -> str:
+        return f"{self.key_prefix}:dequeued:{task_type}"
+
+    def _popped_at_key(self, task_type: int) -> str:
+        return f"{self.key_prefix}:popped_at:{task_type}"
+
+    def _rate_key(self, tenant: str) -> str:
+        return f"{self.key_prefix}:rate:{tenant}"
+
+    def _inflight_key(self) -> str:
+        return f"{self.key_prefix}:inflight"
+
+    def _leases_key(self) -> str:
+        return f"{self.key_prefix}:leases"
+
+    def migrate_legacy_queue(self, limit: int = 100000) -> int:
+        """
+        将旧版单一列表队列（键名为queue_name，LPUSH入队）中的任务按入队顺序移入各任务类型的队列（默认租户）。
+        工作进程启动时调用，多个工作进程同时迁移时每个任务只会被其中一个取出
+        :param limit: 最多迁移的任务数
+        :return: 迁移的任务数
+        """
+        moved = 0
+        try:
+            while moved < limit:
+                task_str = self.client.rpop(self.queue_name)
+                if task_str is None:
+                    break
+                try:
+                    task_data = json.loads(task_str)
+                    int(task_data["task_type"])
+                except Exception as e:
+                    log.error(f"旧队列中的任务无法解析，已丢弃 - 数据: {task_str[:200]}, 错误: {e}")
+                    continue
+                if not self.push(task_data, tenant=task_data.get("tenant") or DEFAULT_TENANT):
+                    # 入队失败时放回旧队列的出队端，下次启动时再迁移
+                    self.client.rpush(self.queue_name, task_str)
+                    break
+                moved += 1
+        except Exception as e:
+            log.error(f"迁移旧队列失败 - 队列: {self.queue_name}, 已迁移: {moved}, 错误: {e}")
+        if moved:
+            log.warning(f"已将旧队列中的{moved}个任务移入新队列 - 队列: {self.queue_name}")
+        return moved
+
+    def admit(self, task_type: int, tenant: str = DEFAULT_TENANT, count: int = 1,
+              rate_limited: bool = True) -> Dict[str, Any]:
+        """
+        准入控制：检查排队数上限和租户限速，通过时预占count个排队名额
+        通过后须调用push/push_many(reserved=True)入队，未能入队的名额用release归还
+        redis异常时不拦截请求（reserved为False，入队时照常计数）
+        :param task_type: 任务类型
+        :param tenant: 租户标识（如用户ID、客户端IP）
+        :param count: 任务数（批量任务为子任务数），按全数扣除令牌
+        :param rate_limited: 是否检查租户限速（重新入队的任务为False，只检查排队数上限）
+        :return: {"admitted": 是否通过, "reserved": 是否已预占排队数, "reason": 拒绝原因, "depth": 排队数,
+                  "retry_after": 建议的重试间隔（秒）, "estimated_wait": 预计排队等待时间（秒，无吞吐量数据时为None）}
+        """
+        tenant = tenant or DEFAULT_TENANT
+        rate_limit = self.rate_limit if rate_limited else 0
+        try:
+            code, depth, rate_wait = self._admit(
+                keys=[self._depth_key(task_type), self._rate_key(tenant)],
+                args=[count, self.max_depth, rate_limit, self.rate_window, time.time(), count])
+        except Exception as e:
+            log.error(f"准入检查失败，放行 - 任务类型: {task_type}, 租户: {tenant}, 错误: {e}")
+            return {"admitted": True, "reserved": False, "reason": None, "depth": None, "retry_after": 0,
+                    "estimated_wait": None}
+
+        depth = int(depth)
+        if code == 0:
+            return {"admitted": True, "reserved": True, "reason": None, "depth": depth, "retry_after": 0,
+                    "estimated_wait": None}
+
+        throughput = self.get_throughput(task_type)
+        estimated_wait = round(depth / throughput, 1) if throughput else None
+        if code == 1:
+            reason = ADMIT_QUEUE_FULL
+            # 排队数降到可容纳本次任务所需的时间，无吞吐量数据时按一个限速窗口
+            excess = depth + count - self.max_depth
+            retry_after = excess / throughput if throughput else self.rate_window
+        else:
+            reason = ADMIT_RATE_LIMITED
+            retry_after = float(rate_wait)
+        TASKS_REJECTED.inc(count, task_type=task_type, reason=reason)
+        log.warning(f"任务未通过准入控制 - 任务类型: {task_type}, 租户: {tenant}, 原因: {reason}, 排队数: {depth}, "
+                    f"任务数: {count}")
+        return {"admitted": False, "reserved": False, "reason": reason, "depth": depth,
+                "retry_after": max(1, math.ceil(retry_after)), "estimated_wait": estimated_wait}
+
+    def release(self, task_type: int, count: int = 1):
+        """
+        归还admit预占但未入队的排队名额（如pdf解析失败）
+        """
+        if count <= 0:
+            return
+        try:
+            self.client.decrby(self._depth_key(task_type), count)
+        except Exception as e:
+            log.error(f"归还排队名额失败 - 任务类型: {task_type}, 数量: {count}, 错误: {e}")
+
+    def get_throughput(self, task_type: int) -> Optional[float]:
+        """
+        最近THROUGHPUT_WINDOW秒内的出队速率（个/秒），样本不足时返回None
+        工作进程按并发名额取任务，稳定时出队速率即处理速率
+        """
+        now = time.time()
+        try:
+            popped = [float(t) for t in self.client.lrange(self._popped_at_key(task_type), 0, -1)]
+        except Exception as e:
+            log.error(f"获取出队速率失败: {e}")
+            return None
+        recent = [t for t in popped if t >= now - THROUGHPUT_WINDOW]
+        if len(recent) < 2:
+            return None
+        return len(recent) / max(now - min(recent), 1.0)
+
+    def _push_args(self, task_data: dict, tenant: str, reserved: bool = False) -> tuple[list, list]:
+        """
+        入队脚本的KEYS和ARGV
+        """
+        task_type = int(task_data["task_type"])
+        keys = [self._queue_prefix(task_type) + tenant, self._ring_key(task_type), self._tenants_key(task_type),
+                self._depth_key(task_type), self._seq_key(task_type), task_state_key(task_data.get("task_id", ""))]
+        args = [tenant, json.dumps(task_data, ensure_ascii=False), STATE_QUEUED, task_data["enqueued_at"],
+                task_type, STATE_TTL, 1 if reserved else 0]
+        return keys, args
+
+    def push(self, task_data: dict, tenant: str = DEFAULT_TENANT, reserved: bool = False) -> int:
+        """
+        将任务放入对应任务类型、对应租户的队列
+        :param task_data: 任务数据，需包含task_type
+        :param tenant: 租户标识（如用户ID、客户端IP）
+        :param reserved: 排队数是否已由admit预占
+        :return: 该任务类型当前排队数，失败返回0
+        """
+        task_type = int(task_data["task_type"])
+        tenant = tenant or DEFAULT_TENANT
+        task_data["tenant"] = tenant
+        task_data["enqueued_at"] = time.time()
+        try:
+            keys, args = self._push_args(task_data, tenant, reserved)
+            depth = self._push(keys=keys, args=args)
+            TASKS_ENQUEUED.inc(task_type=task_type)
+            log.info(f"任务入队成功 - 任务类型: {task_type}, 租户: {tenant}, 排队数: {depth}")
+            return int(depth)
+        except Exception as e:
+            log.error(f"任务入队失败 - 任务类型: {task_type}, 租户: {tenant}, 错误: {e}")
+            return 0
+
+    def push_many(self, tasks: List[dict], tenant: str = DEFAULT_TENANT, reserved: bool = False) -> int:
+        """
+        一次性放入多个任务（使用pipeline，只需一次往返）
+        :param tasks: 任务数据列表，需包含task_type
+        :param tenant: 租户标识
+        :param reserved: 排队数是否已由admit预占
+        :return: 最后一个任务入队后其任务类型的排队数，失败返回0
+        """
+        if not tasks:
+            return 0
+        tenant = tenant or DEFAULT_TENANT
+        now = time.time()
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for task_data in tasks:
+                task_data["tenant"] = tenant
+                task_data["enqueued_at"] = now
+                keys, args = self._push_args(task_data, tenant, reserved)
+                self._push(keys=keys, args=args, client=pipe)
+            depth = pipe.execute()[-1]
+            for task_data in tasks:
+                TASKS_ENQUEUED.inc(task_type=int(task_data["task_type"]))
+            log.info(f"批量任务入队成功 - 任务数: {len(tasks)}, 租户: {tenant}, 排队数: {depth}")
+            return int(depth)
+        except Exception as e:
+            log.error(f"批量任务入队失败 - 租户: {tenant}, 错误: {e}")
+            return 0
+
+    def _pop_type(self, task_type: int) -> Optional[str]:
+        return self._pop(
+            keys=[self._ring_key(task_type), self._tenants_key(task_type), self._depth_key(task_type),
+                  self._dequeued_key(task_type), self._inflight_key(), self._leases_key()],
+            args=[self._queue_prefix(task_type), time.time() + self.lease_s]
+        )
+
+    def _next_task(self, task_types: List[int]) -> Optional[dict]:
+        """
+        按赤字轮询从各任务类型中取出一个任务。某任务类型队列为空时其赤字清零
+        """
+        if not task_types:
+            return None
+        # 每个任务类型最多需要 cost/weight 轮才能攒够配额
+        max_rounds = max(-(-self.costs.get(t, 1) // max(self.weights.get(t, 1), 1)) for t in task_types) + 1
+        empty = set()
+        for _ in range(max_rounds * len(task_types)):
+            if len(empty) == len(task_types):
+                return None
+            task_type = task_types[self._cursor % len(task_types)]
+            if task_type in empty:
+                self._cursor += 1
+                continue
+
+            cost = self.costs.get(task_type, 1)
+            if self._deficits.get(task_type, 0) < cost:
+                self._deficits[task_type] = self._deficits.get(task_type, 0) + self.weights.get(task_type, 1)
+                if self._deficits[task_type] < cost:
+                    self._cursor += 1
+                    continue
+
+            task_str = self._pop_type(task_type)
+            if task_str is None:
+                self._deficits[task_type] = 0
+                empty.add(task_type)
+                self._cursor += 1
+                continue
+
+            self._deficits[task_type] -= cost
+            if self._deficits[task_type] < cost:
+                self._cursor += 1
+            return json.loads(task_str)
+        return None
+
+    def pop(self, task_types: List[int] = None, timeout: float = 0, poll_interval: float = 0.2) -> Optional[dict]:
+        """
+        取出下一个任务
+        :param task_types: 本工作进程处理的任务类型，为空时处理全部类型
+        :param timeout: 最长等待秒数，0表示一直等待
+        :param poll_interval: 所有队列为空时的轮询间隔
+        :return: 任务字典，超时返回None
+        """
+        task_types = [t for t in (task_types or list(self.weights)) if t in self.weights]
+        deadline = time.time() + timeout if timeout else None
+        while True:
+            try:
+                task = self._next_task(task_types)
+                if task:
+                    TASKS_DEQUEUED.inc(task_type=int(task["task_type"]))
+                    self._record_wait(task)
+                    log.debug(f"任务出队成功 - 任务ID: {task.get('task_id')}")
+                    return task
+            except Exception as e:
+                log.error(f"任务出队失败{e}")
+            if deadline is not None and time.time() >= deadline:
+                return None
+            time.sleep(poll_interval)
+
+    @staticmethod
+    def lease_id(task: dict) -> str:
+        """
+        处理中任务的租约ID，与出队脚本一致。重新入队的任务attempt不同，租约互不影响
+        """
+        return f"{task.get('task_id', '')}:{int(task.get('attempt', 0))}"
+
+    def ack(self, task: dict):
+        """
+        任务处理结束（成功、失败或已重新入队），取消处理中登记
+        """
+        lease = self.lease_id(task)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hdel(self._inflight_key(), lease)
+            pipe.zrem(self._leases_key(), lease)
+            pipe.execute()
+        except Exception as e:
+            log.error(f"任务确认失败 - 租约: {lease}, 错误: {e}")
+
+    def extend(self, leases: List[str]):
+        """
+        为仍在处理的任务续约（只更新仍登记为处理中的任务）
+        """
+        if not leases:
+            return
+        deadline = time.time() + self.lease_s
+        try:
+            self.client.zadd(self._leases_key(), {lease: deadline for lease in leases}, xx=True)
+        except Exception as e:
+            log.error(f"任务续约失败 - 任务数: {len(leases)}, 错误: {e}")
+
+    def reclaim(self, limit: int = 100) -> List[dict]:
+        """
+        取回租约已到期的处理中任务（处理它的工作进程已崩溃或失联），由调用方决定重新入队或标记失败
+        :return: 任务字典列表
+        """
+        try:
+            tasks = self._reclaim(keys=[self._inflight_key(), self._leases_key()], args=[time.time(), limit])
+        except Exception as e:
+            log.error(f"回收超时任务失败: {e}")
+            return []
+        return [json.loads(task) for task in tasks]
+
+    def _record_wait(self, task: dict):
+        """
+        记录任务排队等待时间和出队时间
+        """
+        enqueued_at = task.get("enqueued_at")
+        if not enqueued_at:
+            return
+        wait_ms = max(0, int((time.time() - float(enqueued_at)) * 1000))
+        QUEUE_WAIT.observe(wait_ms / 1000, task_type=int(task["task_type"]))
+        key = self._waits_key(int(task["task_type"]))
+        popped_key = self._popped_at_key(int(task["task_type"]))
+        pipe = self.client.pipeline(transaction=False)
+        pipe.lpush(key, wait_ms)
+        pipe.ltrim(key, 0, self.wait_samples - 1)
+        pipe.lpush(popped_key, time.time())
+        pipe.ltrim(popped_key, 0, self.wait_samples - 1)
+        pipe.execute()
+
+    def get_queue_length(self, task_type: int = None) -> int:
+        """
+        获取排队任务数
+        :param task_type: 任务类型，为空时返回全部任务类型之和
+        """
+        task_types = [task_type] if task_type is not None else list(self.weights)
+        try:
+            depths = self.client.mget([self._depth_key(t) for t in task_types])
+            return sum(int(d) for d in depths if d)
+        except Exception as e:
+            log.error(f"获取队列长度失败: {e}")
+            return 0
+
+    def export_metrics(self):
+        """
+        将各任务类型的排队数写入监控指标（注册为指标采集回调，每次采集时调用）
+        """
+        task_types = list(self.weights)
+        depths = self.client.mget([self._depth_key(t) for t in task_types])
+        for task_type, depth in zip(task_types, depths):
+            QUEUE_DEPTH.set(int(depth or 0), task_type=task_type)
+
+    def get_wait_percentiles(self, percentiles=(50, 95, 99)) -> Dict[int, Dict[str, Any]]:
+        """
+        获取各任务类型排队等待时间的分位数（毫秒）
+        :return: {任务类型: {"depth": 排队数, "samples": 样本数, "p50": .., "p95": .., "p99": ..}}
+        """
+        stats = {}
+        pipe = self.client.pipeline(transaction=False)
+        for task_type in self.weights:
+            pipe.lrange(self._waits_key(task_type), 0, -1)
+            pipe.get(self._depth_key(task_type))
+        replies = pipe.execute()
+        for i, task_type in enumerate(self.weights):
+            waits = sorted(int(w) for w in replies[2 * i])
+            item = {"depth": int(replies[2 * i + 1] or 0), "samples": len(waits)}
+            for p in percentiles:
+                item[f"p{p}"] = _percentile(waits, p)
+            stats[task_type] = item
+        return stats
+
+
+def _percentile(sorted_values: List[int], p: float) -> Optional[int]:
+    """
+    最近秩法计算分位数
+    """
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+if __name__ == "__main__":
+    s = TaskScheduler()
+    for i in range(3):
+        s.push({"task_id": f"ro_{i}", "task_info": {}, "text": "简历打分+优化任务", "task_type": TASK_TYPE_RO},
+               tenant="tenant_a")
+    s.push({"task_id": "chat_0", "task_info": {}, "text": "简历打分_聊天", "task_type": TASK_TYPE_RO_CHAT},
+           tenant="tenant_b")
+    while True:
+        t = s.pop(timeout=1)
+        if not t:
+            break
+        print(t["task_id"], t["tenant"])
+    print(s.get_wait_percentiles())
@@ -0,0 +1,197 @@
+"""
+任务状态类：记录每个任务所处的阶段，供客户端查询进度
+    task_state:{task_id}    哈希。state：当前状态，{状态}_at：进入各状态的时间戳，updated_at：最后更新时间，
+                            task_type、enqueue_seq：入队序号（计算排队位置），error：失败原因
+状态流转：parsing（API解析pdf） -> queued（入队，由调度器的入队脚本写入） -> cleaning -> retrieving -> generating
+         -> done / failed
+         处理失败或工作进程失联的任务在重试次数内重新入队，回到queued（见ResumeOptimization.TASK_MAX_ATTEMPTS）
+         进入最终状态（done/failed）由finish比较并设置：已是最终状态时不再写入结果、不再计入批量任务进度。
+         租约被回收的任务可能由原工作进程和新工作进程先后完成，只有先完成的一方生效
+排队位置 = 入队序号 - 该任务类型已出队任务数（按租户轮询出队，为估计值）。
+"""
+import time
+from typing import Optional
+
+from logger import get_logger
+from redis_client import RES_NOTIFY_CHANNEL, RedisClient, batch_key, encode_field, queue_key_prefix, res_key
+
+log = get_logger(__name__)
+
+STATE_PARSING = "parsing"
+STATE_QUEUED = "queued"
+STATE_CLEANING = "cleaning"
+STATE_RETRIEVING = "retrieving"
+STATE_GENERATING = "generating"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+
+STATES = (STATE_PARSING, STATE_QUEUED, STATE_CLEANING, STATE_RETRIEVING, STATE_GENERATING, STATE_DONE, STATE_FAILED)
+FINAL_STATES = (STATE_DONE, STATE_FAILED)
+
+# 状态记录保存时间（秒），与任务结果一致
+STATE_TTL = 86400
+
+# 更新中间状态：已是最终状态时不修改（晚于其他工作进程完成的处理不能把done改回处理中）
+# KEYS: 状态键；ARGV: 过期时间, 字段及值...
+_UPDATE_SCRIPT = f"""
+local state = redis.call('HGET', KEYS[1], 'state')
+if state == '{STATE_DONE}' or state == '{STATE_FAILED}' then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# 进入最终状态：当前状态已是最终状态时返回0，不做任何修改；
+# 否则更新状态，写入结果字段，更新批量任务的完成/失败数，成功时发布完成通知，返回1。
+# 批量任务已过期时不再计数（HINCRBY会重新创建一个没有过期时间的批量任务键）
+# KEYS: 状态键, 结果键, 批量任务键（无批量任务时为空字符串）
+# ARGV: 新状态, 时间戳, 过期时间, 通知频道, 任务id, 失败原因, 结果字段及值...
+_FINISH_SCRIPT = f"""
+local state = redis.call('HGET', KEYS[1], 'state')
+if state == '{STATE_DONE}' or state == '{STATE_FAILED}' then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'state', ARGV[1], ARGV[1] .. '_at', ARGV[2], 'updated_at', ARGV[2])
+if ARGV[6] ~= '' then
+    redis.call('HSET', KEYS[1], 'error', ARGV[6])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+if #ARGV > 6 then
+    redis.call('HSET', KEYS[2], unpack(ARGV, 7))
+    redis.call('EXPIRE', KEYS[2], ARGV[3])
+end
+if KEYS[3] ~= '' and redis.call('EXISTS', KEYS[3]) == 1 then
+    redis.call('HINCRBY', KEYS[3], ARGV[1] == '{STATE_DONE}' and 'done' or 'failed', 1)
+end
+if ARGV[1] == '{STATE_DONE}' then
+    redis.call('PUBLISH', ARGV[4], ARGV[5])
+end
+return 1
+"""
+
+
+def task_state_key(task_id: str) -> str:
+    return f"task_state:{task_id}"
+
+
+class TaskStateStore(object):
+    """
+    任务状态存储。每次状态更新只需一次往返
+    """
+    def __init__(self, redis_client: RedisClient = None, queue_name: str = "Queue_RO"):
+        """
+        :param redis_client: redis客户端，为空时新建
+        :param queue_name: 队列前缀，与TaskScheduler一致（用于读取已出队任务数）
+        """
+        self.redis_client = redis_client or RedisClient()
+        self.client = self.redis_client.client
+        self.queue_name = queue_name
+        self._update = self.client.register_script(_UPDATE_SCRIPT)
+        # 结果字段可能是压缩后的二进制，脚本使用不自动解码的客户端
+        self._finish = self.redis_client.raw_client.register_script(_FINISH_SCRIPT)
+
+    def update(self, task_id: str, state: str, **fields):
+        """
+        更新任务状态。任务已是最终状态（done/failed）时不修改
+        :param task_id: 任务id
+        :param state: 新状态
+        :param fields: 其他需要记录的字段，如error
+        """
+        if not task_id:
+            return
+        now = time.time()
+        mapping = {"state": state, f"{state}_at": now, "updated_at": now}
+        mapping.update({k: str(v) for k, v in fields.items() if v is not None})
+        try:
+            self._update(keys=[task_state_key(task_id)],
+                         args=[STATE_TTL, *[item for pair in mapping.items() for item in pair]])
+        except Exception as e:
+            log.error(f"任务状态更新失败 - 任务ID: {task_id}, 状态: {state}, 错误: {e}")
+
+    def finish(self, task_id: str, state: str, res_fields: dict = None, batch_id: str = None,
+               error: str = None) -> Optional[bool]:
+        """
+        将任务置为最终状态，同时写入结果（较大字段压缩存储）、更新所属批量任务进度（一个Lua脚本，原子执行）
+        :param state: STATE_DONE或STATE_FAILED
+        :param res_fields: 结果字段，见redis_client.RES_FIELDS
+        :param batch_id: 所属批量任务id（如有）
+        :param error: 失败原因
+        :return: True为已写入，False为任务已是最终状态（已由其他工作进程完成），None为redis异常
+        """
+        args = [state, time.time(), STATE_TTL, RES_NOTIFY_CHANNEL, task_id, error or ""]
+        for name, value in (res_fields or {}).items():
+            args += [name, encode_field(value)]
+        keys = [task_state_key(task_id), res_key(task_id), batch_key(batch_id) if batch_id else ""]
+        try:
+            finished = self._finish(keys=keys, args=args)
+        except Exception as e:
+            log.error(f"任务结束状态写入失败 - 任务ID: {task_id}, 状态: {state}, 错误: {e}")
+            return None
+        return bool(finished)
+
+    def is_final(self, task_id: str) -> bool:
+        """
+        任务是否已是最终状态（done/failed）。redis异常时返回False
+        """
+        try:
+            return self.client.hget(task_state_key(task_id), "state") in FINAL_STATES
+        except Exception as e:
+            log.error(f"任务状态获取失败 - 任务ID: {task_id}, 错误: {e}")
+            return False
+
+    def get(self, task_id: str) -> Optional[dict]:
+        """
+        获取任务状态，任务不存在时返回None
+        :return: {"state": .., "timestamps": {状态: 时间戳}, "queue_position": .., "error": ..}
+        """
+        record = self.client.hgetall(task_state_key(task_id))
+        if not record:
+            return None
+        return self._build(record, self._dequeued(record))
+
+    async def get_async(self, async_client, task_id: str) -> Optional[dict]:
+        """
+        get的异步版本，供FastAPI接口使用
+        :param async_client: redis.asyncio客户端（decode_responses=True）
+        """
+        record = await async_client.hgetall(task_state_key(task_id))
+        if not record:
+            return None
+        dequeued = None
+        if record.get("state") == STATE_QUEUED and record.get("task_type"):
+            dequeued = await async_client.get(self._dequeued_key(record["task_type"]))
+        return self._build(record, dequeued)
+
+    async def get_many_async(self, async_client, task_ids: list) -> list:
+        """
+        批量获取任务的状态和失败原因（一次pipeline往返，不计算排队位置），供批量任务进度查询使用
+        :return: 与task_ids一一对应的{"state": .., "error": ..}，任务不存在时为None
+        """
+        pipe = async_client.pipeline(transaction=False)
+        for task_id in task_ids:
+            pipe.hmget(task_state_key(task_id), "state", "error")
+        return [{"state": state, "error": error} if state else None for state, error in await pipe.execute()]
+
+    def _dequeued_key(self, task_type) -> str:
+        return f"{queue_key_prefix(self.queue_name)}:dequeued:{task_type}"
+
+    def _dequeued(self, record: dict):
+        if record.get("state") == STATE_QUEUED and record.get("task_type"):
+            return self.client.get(self._dequeued_key(record["task_type"]))
+        return None
+
+    @staticmethod
+    def _build(record: dict, dequeued) -> dict:
+        state = record.get("state", "")
+        timestamps = {s: float(record[f"{s}_at"]) for s in STATES if f"{s}_at" in record}
+        status = {"state": state, "timestamps": timestamps,
+                  "updated_at": float(record.get("updated_at", 0) or 0)}
+        if state == STATE_QUEUED and record.get("enqueue_seq"):
+            status["queue_position"] = max(1, int(record["enqueue_seq"]) - int(dequeued or 0))
+        if record.get("error"):
+            status["error"] = record["error"]
+        if record.get("batch_id"):
+            status["batch_id"] = record["batch_id"]
+        return status
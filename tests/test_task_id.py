@@ -0,0 +1,105 @@
+"""
+任务ID生成器测试：多进程从同一个redis（fakeredis的TCP服务）租用节点号并生成ID，检查不重复、格式正确、进程内严格递增；
+以及节点号回绕、释放后复用、同一毫秒序号用尽和时钟回拨
+运行：python -m pytest tests/test_task_id.py
+"""
+import multiprocessing
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+import task_id  # noqa: E402
+from redis_client import RedisClient  # noqa: E402
+from task_id import NODE_ID_KEY, NODE_ID_MODULO, NODE_LEASE_PREFIX, SEQ_MODULO, TASK_ID_LENGTH, \
+    TaskIDGenerator  # noqa: E402
+
+
+@pytest.fixture
+def redis_server():
+    server = fakeredis.TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    # fakeredis的TCP服务在返回错误后会断开连接，预先加载脚本，避免首次EVALSHA返回NOSCRIPT
+    client = RedisClient(host=server.server_address[0], port=server.server_address[1])
+    for script in (task_id._ACQUIRE_SCRIPT, task_id._RENEW_SCRIPT, task_id._RELEASE_SCRIPT):
+        client.client.script_load(script)
+    yield server.server_address
+    server.shutdown()
+    server.server_close()
+
+
+def _generate_ids(args) -> list:
+    host, port, count = args
+    generator = TaskIDGenerator(RedisClient(host=host, port=port))
+    ids = [generator.generate_task_id() for _ in range(count)]
+    generator.close()
+    return ids
+
+
+def test_multiprocess_ids_unique(redis_server, monkeypatch):
+    monkeypatch.delenv("TASK_NODE_ID", raising=False)
+    host, port = redis_server
+    processes, per_process = 4, 20000
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        results = pool.map(_generate_ids, [(host, port, per_process)] * processes)
+
+    all_ids = [i for ids in results for i in ids]
+    assert len(set(all_ids)) == len(all_ids)
+    assert all(len(i) == TASK_ID_LENGTH and i.isdigit() for i in all_ids)
+    # 节点号均由redis租用（而不是退化为随机节点号）
+    assert {ids[0][17:21] for ids in results} == {f"{i:04d}" for i in range(processes)}
+    for ids in results:
+        assert all(a < b for a, b in zip(ids, ids[1:]))
+
+
+def test_node_id_wraparound(redis_server):
+    host, port = redis_server
+    client = RedisClient(host=host, port=port)
+    client.client.set(NODE_ID_KEY, NODE_ID_MODULO * 3 - 2)
+    for node in (NODE_ID_MODULO - 2, NODE_ID_MODULO - 1, 0):
+        client.client.set(f"{NODE_LEASE_PREFIX}{node}", "other", ex=60)
+
+    generator = TaskIDGenerator(client)
+    assert generator.generate_task_id()[17:21] == "0001"
+    # 计数器回绕后下一个进程从9999开始尝试，跳过仍被租用的9999、0、1
+    other = TaskIDGenerator(client)
+    assert other.generate_task_id()[17:21] == "0002"
+    other.close()
+    generator.close()
+
+
+def test_released_lease_reused(redis_server):
+    host, port = redis_server
+    client = RedisClient(host=host, port=port)
+    generator = TaskIDGenerator(client)
+    generator.generate_task_id()
+    node_id = generator.node_id
+    generator.close()
+    assert not client.client.exists(f"{NODE_LEASE_PREFIX}{node_id}")
+
+    client.client.set(NODE_ID_KEY, node_id)
+    assert TaskIDGenerator(client).generate_task_id()[17:21] == f"{node_id:04d}"
+
+
+def test_sequence_exhausted_and_clock_step_back(monkeypatch):
+    now = [1700000000.0005]
+    monkeypatch.setattr(task_id.time, "time", lambda: now[0])
+    generator = TaskIDGenerator(node_id=7)
+
+    ids = [generator.generate_task_id() for _ in range(SEQ_MODULO + 1)]
+    assert ids[0] == "20231114221320000" + "0007" + "0000"
+    assert ids[-2].endswith("0007" + f"{SEQ_MODULO - 1:04d}")
+    # 第10001个ID借用下一毫秒
+    assert ids[-1] == "20231114221320001" + "0007" + "0000"
+
+    now[0] -= 3600
+    ids.append(generator.generate_task_id())
+    assert ids[-1] == "20231114221320001" + "0007" + "0001"
+    assert all(a < b for a, b in zip(ids, ids[1:]))
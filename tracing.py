@@ -0,0 +1,210 @@
+"""
+链路追踪类：记录每个任务在API进程和AI工作进程中各阶段的耗时
+    1、OpenTelemetry span：设置环境变量OTEL_EXPORTER_OTLP_ENDPOINT时导出到OTLP收集器，
+       否则以JSON行的形式写入TRACE_FILE（默认traces.jsonl）
+    2、各阶段耗时（毫秒）同时写入redis哈希task_trace:{task_id}，可按任务查询耗时分布
+跨进程：API进程将追踪上下文写入任务数据的trace_context字段，工作进程从中恢复，同一任务的span属于同一条链路。
+"""
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+
+from opentelemetry import context as otel_context
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.trace import Status, StatusCode
+
+from logger import get_logger, current_task_id
+from metrics import STAGE_DURATION, STAGE_FAILURES
+from redis_client import RedisClient
+
+log = get_logger(__name__)
+
+# 各阶段耗时的保存时间（秒）
+TRACE_TTL = 86400
+
+tracer = trace.get_tracer("resume_optimization")
+
+_redis_client: Optional[RedisClient] = None
+_init_lock = threading.Lock()
+_initialized = False
+
+
+class JsonFileSpanExporter(SpanExporter):
+    """
+    将span以JSON行的形式写入本地文件
+    """
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+
+    def export(self, spans) -> SpanExportResult:
+        lines = []
+        for span in spans:
+            lines.append(json.dumps({
+                "trace_id": format(span.context.trace_id, "032x"),
+                "span_id": format(span.context.span_id, "016x"),
+                "parent_id": format(span.parent.span_id, "016x") if span.parent else None,
+                "name": span.name,
+                "service": span.resource.attributes.get("service.name"),
+                "start_ns": span.start_time,
+                "end_ns": span.end_time,
+                "duration_ms": (span.end_time - span.start_time) / 1e6,
+                "status": span.status.status_code.name,
+                "attributes": dict(span.attributes or {}),
+            }, ensure_ascii=False))
+        try:
+            with self._lock, open(self.file_path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            return SpanExportResult.SUCCESS
+        except Exception as e:
+            log.error(f"span写入文件失败：{e}")
+            return SpanExportResult.FAILURE
+
+    def shutdown(self):
+        pass
+
+
+def init_tracing(service_name: str, redis_client: RedisClient = None):
+    """
+    初始化链路追踪，每个进程调用一次
+    :param service_name: 服务名称，如resume-api、resume-worker
+    :param redis_client: 用于保存各阶段耗时的redis客户端
+    """
+    global _redis_client, _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+        endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+        if endpoint:
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+            exporter = OTLPSpanExporter(endpoint=endpoint, insecure=endpoint.startswith("http://"))
+            log.info(f"链路追踪导出到OTLP收集器：{endpoint}")
+        else:
+            file_path = os.getenv("TRACE_FILE", "traces.jsonl")
+            exporter = JsonFileSpanExporter(file_path)
+            log.info(f"链路追踪导出到文件：{file_path}")
+        provider.add_span_processor(BatchSpanProcessor(exporter))
+        trace.set_tracer_provider(provider)
+        _redis_client = redis_client
+        _initialized = True
+
+
+def inject_context() -> Dict[str, str]:
+    """
+    导出当前追踪上下文，放入任务数据中传给工作进程
+    """
+    carrier: Dict[str, str] = {}
+    propagate.inject(carrier)
+    return carrier
+
+
+def extract_context(carrier: Optional[Dict[str, str]]) -> otel_context.Context:
+    """
+    从任务数据中恢复追踪上下文
+    """
+    return propagate.extract(carrier or {})
+
+
+def record_stage(stage_name: str, duration_ms: float, task_id: str = None):
+    """
+    将阶段耗时写入redis，同一阶段多次执行时记录最后一次
+    """
+    task_id = task_id or current_task_id.get()
+    if not task_id or _redis_client is None:
+        return
+    try:
+        pipe = _redis_client.client.pipeline(transaction=False)
+        pipe.hset(f"task_trace:{task_id}", stage_name, round(duration_ms, 1))
+        pipe.expire(f"task_trace:{task_id}", TRACE_TTL)
+        pipe.execute()
+    except Exception as e:
+        log.error(f"阶段耗时记录失败 - 任务ID: {task_id}, 阶段: {stage_name}, 错误: {e}")
+
+
+@contextmanager
+def _timed_span(stage_name: str, task_id: str, timing: dict, attributes: dict):
+    """
+    创建阶段span并记录阶段耗时指标，耗时（毫秒）写入timing["ms"]
+    """
+    start = time.perf_counter()
+    with tracer.start_as_current_span(stage_name, attributes={"task_id": task_id, **attributes},
+                                      record_exception=False, set_status_on_exception=False) as span:
+        try:
+            yield span
+        except Exception as e:
+            span.record_exception(e)
+            span.set_status(Status(StatusCode.ERROR, str(e)))
+            STAGE_FAILURES.inc(stage=stage_name)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            STAGE_DURATION.observe(duration, stage=stage_name)
+            timing["ms"] = duration * 1000
+
+
+@contextmanager
+def stage(stage_name: str, **attributes):
+    """
+    记录一个处理阶段：创建span并将耗时写入redis。task_id取自current_task_id
+    用法：with stage("clean"): ...
+    """
+    task_id, timing = current_task_id.get(), {}
+    try:
+        with _timed_span(stage_name, task_id, timing, attributes) as span:
+            yield span
+    finally:
+        record_stage(stage_name, timing["ms"], task_id)
+
+
+@asynccontextmanager
+async def astage(stage_name: str, **attributes):
+    """
+    stage的异步版本，供FastAPI异步接口使用：耗时在线程池中写入redis，不阻塞事件循环
+    用法：async with astage("enqueue"): ...
+    """
+    task_id, timing = current_task_id.get(), {}
+    try:
+        with _timed_span(stage_name, task_id, timing, attributes) as span:
+            yield span
+    finally:
+        await asyncio.to_thread(record_stage, stage_name, timing["ms"], task_id)
+
+
+def record_queue_wait(task: dict, parent: otel_context.Context = None):
+    """
+    根据入队时间记录排队等待阶段（span的开始时间为入队时间）
+    """
+    enqueued_at = task.get("enqueued_at")
+    if not enqueued_at:
+        return
+    start_ns = int(float(enqueued_at) * 1e9)
+    end_ns = time.time_ns()
+    span = tracer.start_span("queue_wait", context=parent, start_time=start_ns,
+                             attributes={"task_id": task.get("task_id", "")})
+    span.end(end_time=end_ns)
+    record_stage("queue_wait", (end_ns - start_ns) / 1e6, task.get("task_id"))
+
+
+def submit_with_context(executor: Executor, fn, *args, **kwargs) -> Future:
+    """
+    提交到线程池时带上当前上下文（追踪上下文、current_task_id），使线程中的span挂在当前span下
+    """
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def get_stage_breakdown(task_id: str, redis_client: RedisClient = None) -> Dict[str, float]:
+    """
+    获取任务各阶段耗时（毫秒）
+    """
+    client = (redis_client or _redis_client).client
+    return {k: float(v) for k, v in client.hgetall(f"task_trace:{task_id}").items()}